@@ -59,14 +59,70 @@ APPEND_SLASH = False
 
 REST_FRAMEWORK = {
    'DEFAULT_AUTHENTICATION_CLASSES': (
-       'rest_framework.authentication.TokenAuthentication',
+       'lms.authentication.CachedTokenAuthentication',
    ),
    'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAdminUser'
    ),
 }
 
+# In-process token -> user cache used by CachedTokenAuthentication
+LMS_TOKEN_CACHE_MAX_SIZE = 10000
+LMS_TOKEN_CACHE_TTL = 60  # seconds
+
+# How list pages and NDJSON exports are encoded: 'python' (serializers) or
+# 'database' (PostgreSQL json_agg, see lms.dbjson; other databases use 'python').
+LMS_LIST_JSON_STRATEGY = 'python'
+
+# Processes hashing passwords for POST /api/users/provision/, one pool per web
+# process shared by all its requests (the provision_users command uses its own)
+LMS_PASSWORD_HASH_WORKERS = 4
+
+# Most IDs one call to the users/books/borrowed batch endpoints may fetch
+LMS_BATCH_MAX_IDS = 200
+
+# Responses to requests sent with an Idempotency-Key are replayed for
+# LMS_IDEMPOTENCY_TTL seconds (see lms.idempotency); a claim whose request never
+# finished is released after LMS_IDEMPOTENCY_LOCK_SECONDS, or
+# LMS_IDEMPOTENCY_BULK_LOCK_SECONDS for the bulk endpoints. Keep both above the
+# web server's worker timeout.
+LMS_IDEMPOTENCY_TTL = 24 * 60 * 60
+LMS_IDEMPOTENCY_LOCK_SECONDS = 60
+LMS_IDEMPOTENCY_BULK_LOCK_SECONDS = 30 * 60
+
+# Rows the library-wide and per-genre circulation counters are striped over
+# (see lms.stats); more shards, fewer loans waiting on each other's counters.
+LMS_STATS_SHARDS = 16
+
+# Deleting a user or book removes its loans this many per transaction (see lms.deletion)
+LMS_DELETE_CHUNK_SIZE = 5000
+
+# archive_loans moves loans returned more than this many days ago out of
+# BorrowedBooks into the archive table (see lms.archive)
+LMS_ARCHIVE_AFTER_DAYS = 365
+
+# Loans are due LMS_LOAN_DAYS after borrowing unless a due_date is given; late
+# loans are fined LMS_FINE_PER_DAY per day, up to LMS_FINE_CAP (see lms.overdue).
+LMS_LOAN_DAYS = 14
+LMS_FINE_PER_DAY = '0.25'
+LMS_FINE_CAP = '20.00'
+
+# Share of requests lms.profiling.ProfilingMiddleware profiles (0 disables it,
+# 0.01 is cheap enough for production); with LMS_PROFILING_DUPLICATE_QUERIES
+# the log line also lists repeated (N+1) queries.
+LMS_PROFILING_SAMPLE_RATE = 0.0
+LMS_PROFILING_DUPLICATE_QUERIES = False
+
+# Aliases in DATABASES that lms.replicas.ReplicaRouter may send reads to. A
+# client that writes is pinned to the primary for LMS_REPLICA_PIN_SECONDS.
+LMS_READ_REPLICAS = []
+LMS_REPLICA_PIN_SECONDS = 10
+
+DATABASE_ROUTERS = ['lms.replicas.ReplicaRouter']
+
 MIDDLEWARE = [
+    'lms.profiling.ProfilingMiddleware',
+    'lms.replicas.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,6 +135,19 @@ MIDDLEWARE = [
 
 
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # One JSON line per profiled request
+        'lms.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
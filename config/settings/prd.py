@@ -3,6 +3,8 @@ from .base import *
 
 DEBUG = False
 
+LMS_LIST_JSON_STRATEGY = 'database'
+
 ALLOWED_HOSTS = ['*']
 
 # Password validation
@@ -32,4 +34,11 @@ DATABASES = {
         'HOST': 'localhost',
         'PORT': '',
     }
-}
\ No newline at end of file
+}
+
+# Streaming replicas of the database above, e.g. DB_REPLICA_HOSTS=replica1,replica2
+REPLICA_HOSTS = [host for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host]
+for index, host in enumerate(REPLICA_HOSTS, 1):
+    # Tests read through the replicas from the test database itself
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+LMS_READ_REPLICAS = [f'replica{index}' for index in range(1, len(REPLICA_HOSTS) + 1)]
@@ -5,7 +5,7 @@ from django.views.generic import RedirectView
 
 
 urlpatterns = [
-    path('api-token-auth/', obtain_auth_token, name='api_token_auth'),  ls
+    path('api-token-auth/', obtain_auth_token, name='api_token_auth'),
     path('api/', include('lms.urls')),
     path('', RedirectView.as_view(url='api/', permanent=False)),
 
@@ -0,0 +1,160 @@
+"""
+Archiving old loans.
+
+BorrowedBooks only ever grows, yet almost every query on it is about open or
+recent loans. archive() moves returned loans whose return date is more than
+LMS_ARCHIVE_AFTER_DAYS in the past into ArchivedLoan, which keeps their ids and
+columns. It walks the candidates in primary-key chunks; each chunk is locked,
+copied with one INSERT and removed with one DELETE in its own transaction,
+together with the run's JobCheckpoint, so an interrupted run resumes after the
+last committed chunk and a loan is never in both tables or in neither.
+
+Archived loans still count in the circulation statistics and are still deleted
+with their user or book (lms.deletion); the history endpoints list both tables
+as one.
+
+On PostgreSQL, partition() turns ArchivedLoan into a table range partitioned by
+borrow_date, one partition per year, so old years can be detached or dropped
+wholesale. archive() creates the yearly partitions it needs as it goes.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import NotSupportedError, connections, router, transaction
+from django.utils import timezone
+
+from .models import ArchivedLoan, BorrowedBooks, JobCheckpoint
+
+JOB = 'archive_loans'
+DEFAULT_CHUNK_SIZE = 5000
+
+# Copied column for column; values() and the constructor both take attnames
+_COLUMNS = [field.attname for field in BorrowedBooks._meta.concrete_fields]
+
+
+def cutoff(as_of=None, after_days=None):
+    """
+    Return the date before which returned loans are archived.
+    """
+    if after_days is None:
+        after_days = getattr(settings, 'LMS_ARCHIVE_AFTER_DAYS', 365)
+    return (as_of or datetime.date.today()) - datetime.timedelta(days=after_days)
+
+
+def _connection():
+    return connections[router.db_for_write(ArchivedLoan)]
+
+
+def _is_partitioned(cursor, table):
+    cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [table])
+    return cursor.fetchone() is not None
+
+
+def _create_partitions(cursor, table, years, parent=None):
+    """
+    Create `table`'s yearly partitions, attached to `parent` (default: `table`).
+    """
+    quote = cursor.db.ops.quote_name
+    for year in sorted(years):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {quote(f'{table}_y{year}')} PARTITION OF {quote(parent or table)} "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        )
+
+
+def partition():
+    """
+    Convert ArchivedLoan into a table range partitioned by borrow_date (PostgreSQL
+    only), with a partition for every year it holds. Its indexes and foreign
+    keys are re-created on the new table; the primary key becomes (id,
+    borrow_date), as PostgreSQL requires. Returns the number of rows moved, or
+    None when the table was partitioned already.
+    """
+    connection = _connection()
+    if connection.vendor != 'postgresql':
+        raise NotSupportedError("Partitioning the loan archive needs PostgreSQL.")
+    table = ArchivedLoan._meta.db_table
+    quote = connection.ops.quote_name
+    staging = f"{table}_partitioned"
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if _is_partitioned(cursor, table):
+            return None
+        # A table with deferred foreign key checks pending cannot be dropped
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute("SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass AND NOT indisprimary", [table])
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'", [table])
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f"SELECT DISTINCT EXTRACT(YEAR FROM borrow_date)::integer FROM {quote(table)}")
+        years = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(f"CREATE TABLE {quote(staging)} (LIKE {quote(table)} INCLUDING DEFAULTS) PARTITION BY RANGE (borrow_date)")
+        _create_partitions(cursor, table, years, parent=staging)
+        cursor.execute(f"INSERT INTO {quote(staging)} SELECT * FROM {quote(table)}")
+        moved = cursor.rowcount
+        cursor.execute(f"DROP TABLE {quote(table)}")
+        cursor.execute(f"ALTER TABLE {quote(staging)} RENAME TO {quote(table)}")
+        cursor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(f'{table}_pkey')} PRIMARY KEY (id, borrow_date)")
+        # The definitions name the table, which has its old name again
+        for definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}")
+    return moved
+
+
+def archive(as_of=None, after_days=None, chunk_size=DEFAULT_CHUNK_SIZE, restart=False, progress=None):
+    """
+    Move loans returned before cutoff(as_of, after_days) into ArchivedLoan.
+
+    Resumes an unfinished run for the same cutoff unless `restart` is given; a
+    finished run is not repeated. `progress(result)` is called after every
+    chunk. Returns {"loans": n, "cutoff": date, "resumed_after": pk} counting
+    this invocation only, or None when the run had already finished.
+    """
+    before = cutoff(as_of, after_days)
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(job=JOB, run=before.isoformat())
+    if restart:
+        checkpoint.last_pk, checkpoint.rows, checkpoint.finished = 0, 0, False
+        checkpoint.save()
+    elif checkpoint.finished:
+        return None
+
+    connection = _connection()
+    table = ArchivedLoan._meta.db_table
+    partitioned = False
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            partitioned = _is_partitioned(cursor, table)
+    years = set()
+
+    result = {"loans": 0, "cutoff": before, "resumed_after": checkpoint.last_pk}
+    candidates = BorrowedBooks.objects.filter(return_date__lt=before).order_by('id')
+    while True:
+        with transaction.atomic():
+            # Locked, so a loan cannot be reopened between the copy and the delete
+            rows = list(candidates.filter(id__gt=checkpoint.last_pk).select_for_update().values(*_COLUMNS)[:chunk_size])
+            if not rows:
+                break
+            new_years = {row['borrow_date'].year for row in rows} - years if partitioned else ()
+            if new_years:
+                with connection.cursor() as cursor:
+                    _create_partitions(cursor, table, new_years)
+                years |= new_years
+
+            now = timezone.now()
+            ArchivedLoan.objects.bulk_create([ArchivedLoan(archived_at=now, **row) for row in rows])
+            BorrowedBooks.objects.filter(id__in=[row['id'] for row in rows]).delete()
+            checkpoint.last_pk = rows[-1]['id']
+            checkpoint.rows += len(rows)
+            checkpoint.save(update_fields=['last_pk', 'rows', 'modified_at'])
+
+        result["loans"] += len(rows)
+        if progress:
+            progress(result)
+
+    checkpoint.finished = True
+    checkpoint.save(update_fields=['finished', 'modified_at'])
+    return result
@@ -0,0 +1,229 @@
+"""
+Async versions of the hot read endpoints, for deployments served over ASGI.
+
+DRF's @api_view only runs sync views, so under ASGI the whole of each request
+to them runs in a thread. These views are plain Django coroutines that query
+through the async ORM (aget / acount / async for): only the queries themselves
+leave the event loop, which matters once many slow clients are connected.
+They return the same bodies, status codes and conditional-GET headers as their
+sync counterparts in lms.views.
+
+They accept the same `Authorization: Token <key>` header and share the
+in-process token cache with CachedTokenAuthentication.
+"""
+import functools
+
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.authentication import get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+
+from .authentication import token_cache
+from .views import BOOK_ROWS, USER_ROWS
+from .conditional import book_validators, make_etag, not_modified_response, set_validators
+from .filters import BookFilter
+from .models import Book, BorrowedBooks, CatalogVersion, CustomUser
+from .pagination import AsyncPagination
+from .serializers import BorrowedBooksSerializer, CustomUserSerializer, ExpandableBookSerializer
+
+
+def _render(data, status=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+async def _authenticate(request):
+    """
+    Return the active user for the request's token, or an error response.
+
+    Mirrors TokenAuthentication + IsAuthenticated, including their error bodies.
+    """
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != b'token':
+        return None, _unauthorized("Authentication credentials were not provided.")
+    if len(auth) == 1:
+        return None, _unauthorized("Invalid token header. No credentials provided.")
+    if len(auth) > 2:
+        return None, _unauthorized("Invalid token header. Token string should not contain spaces.")
+    try:
+        key = auth[1].decode()
+    except UnicodeError:
+        return None, _unauthorized("Invalid token header. Token string should not contain invalid characters.")
+
+    cached = token_cache.get(key)
+    if cached is not None:
+        return cached[0], None
+
+    generation = token_cache.generation
+    try:
+        token = await Token.objects.select_related('user').aget(key=key)
+    except Token.DoesNotExist:
+        return None, _unauthorized("Invalid token.")
+    if not token.user.is_active:
+        return None, _unauthorized("User inactive or deleted.")
+
+    token_cache.set(key, (token.user, token), generation)
+    return token.user, None
+
+
+def _unauthorized(detail):
+    response = _render({"detail": detail}, status=status.HTTP_401_UNAUTHORIZED)
+    response['WWW-Authenticate'] = 'Token'
+    return response
+
+
+def async_read_view(view):
+    """
+    Async counterpart of @api_view(['GET']) + @permission_classes([IsAuthenticated]).
+
+    The wrapped coroutine returns (data, status) or an HttpResponse; APIExceptions
+    are rendered the way DRF renders them.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            response = _render({"detail": f'Method "{request.method}" not allowed.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+            response['Allow'] = 'GET, HEAD'
+            return response
+
+        user, error_response = await _authenticate(request)
+        if error_response is not None:
+            return error_response
+        request.user = user
+
+        try:
+            result = await view(request, *args, **kwargs)
+        except APIException as exc:
+            return _render({"detail": exc.detail}, status=exc.status_code)
+        if isinstance(result, HttpResponse):
+            return result
+        return _render(*result)
+    return wrapper
+
+
+def _parse_expand(request):
+    """
+    Parse `expand` as lms.views._parse_expand does; returns (expand, error).
+    """
+    expand = {name.strip() for name in request.GET.get('expand', '').split(',') if name.strip()}
+    unknown = expand - set(ExpandableBookSerializer.EXPANSIONS)
+    if unknown:
+        allowed = ", ".join(ExpandableBookSerializer.EXPANSIONS)
+        return None, ({"error": f"Unknown expand value(s): {', '.join(sorted(unknown))}. Allowed: {allowed}."}, status.HTTP_400_BAD_REQUEST)
+    return expand, None
+
+
+@async_read_view
+async def list_users(request):
+    """
+    Async version of lms.views.list_users (page-number pagination only).
+
+    GET /api/async/users/list/?page=2
+    """
+    paginator = AsyncPagination()
+    result_page = await paginator.apaginate_queryset(USER_ROWS.values(CustomUser.objects.all().order_by('-userID')), request)
+    if paginator.is_empty():
+        return {"message": "No users found."}, status.HTTP_404_NOT_FOUND
+
+    return paginator.get_paginated_data({"message": "users retrieved successfully.", "data": USER_ROWS.serialize(result_page)}), status.HTTP_200_OK
+
+
+@async_read_view
+async def get_user_by_id(request, id):
+    """
+    Async version of lms.views.get_user_by_id.
+
+    GET /api/async/users/<int:id>/
+    """
+    try:
+        user = await CustomUser.objects.aget(userID=id)
+    except CustomUser.DoesNotExist:
+        return {"message": f"Sorry, the user with ID {id} does not exist."}, status.HTTP_404_NOT_FOUND
+
+    etag = make_etag('user', user.userID, user.modified_at)
+    not_modified = not_modified_response(request, etag, user.modified_at)
+    if not_modified is not None:
+        return not_modified
+
+    serializer = CustomUserSerializer(user)
+    response = _render({"message": "User details retrieved successfully", "data": serializer.data})
+    return set_validators(response, etag, user.modified_at)
+
+
+@async_read_view
+async def list_books(request):
+    """
+    Async version of lms.views.list_books (page-number pagination only).
+
+    GET /api/async/books/list/?page=2&expand=details,borrowed_books&genre=Fiction&ordering=title
+    """
+    expand, error = _parse_expand(request)
+    if error is not None:
+        return error
+
+    filterset = BookFilter(request.GET, queryset=Book.objects.with_expansions(expand).order_by('-bookID'))
+    if not filterset.is_valid():
+        return {"error": filterset.error_messages()}, status.HTTP_400_BAD_REQUEST
+
+    etag, last_modified = None, None
+    if 'borrowed_books' not in expand:
+        version, last_modified = await CatalogVersion.acurrent(CatalogVersion.BOOKS, stamped=Book)
+        etag = make_etag('books', version, last_modified, request.get_full_path())
+    not_modified = not_modified_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    paginator = AsyncPagination()
+    books = filterset.qs
+    result_page = await paginator.apaginate_queryset(books if expand else BOOK_ROWS.values(books), request)
+    if paginator.is_empty():
+        return {"message": "No books found."}, status.HTTP_404_NOT_FOUND
+
+    if expand:
+        data = ExpandableBookSerializer(result_page, many=True, expand=expand).data
+    else:
+        data = BOOK_ROWS.serialize(result_page)
+    response = _render(paginator.get_paginated_data({"message": "List of books retrieved successfully", "data": data}))
+    return set_validators(response, etag, last_modified)
+
+
+@async_read_view
+async def get_book_by_id(request, id):
+    """
+    Async version of lms.views.get_book_by_id.
+
+    GET /api/async/books/<int:id>/?expand=details,borrowed_books
+    """
+    expand, error = _parse_expand(request)
+    if error is not None:
+        return error
+
+    try:
+        book = await Book.objects.with_expansions(expand).aget(bookID=id)
+    except Book.DoesNotExist:
+        return {"message": f"Book with ID {id} does not exist."}, status.HTTP_404_NOT_FOUND
+
+    etag, last_modified = book_validators(book, expand)
+    not_modified = not_modified_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    serializer = ExpandableBookSerializer(book, expand=expand)
+    return set_validators(_render(serializer.data), etag, last_modified)
+
+
+@async_read_view
+async def get_borrowed_book_by_id(request, id):
+    """
+    Async version of lms.views.get_borrowed_book_by_id.
+
+    GET /api/async/borrowed/<int:id>/
+    """
+    try:
+        borrowed_book = await BorrowedBooks.objects.aget(id=id)
+    except BorrowedBooks.DoesNotExist:
+        return {"message": f"Sorry, the borrowed book with ID {id} does not exist."}, status.HTTP_404_NOT_FOUND
+
+    serializer = BorrowedBooksSerializer(borrowed_book)
+    return {"message": "Borrowed book details retrieved successfully", "data": serializer.data}, status.HTTP_200_OK
@@ -0,0 +1,135 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """
+    Bounded, thread-safe LRU cache with a TTL, mapping token keys to (user, token).
+
+    get() hands out copies, so concurrent requests never share (and mutate) one
+    user instance. Keys are also indexed by user, so invalidating a user's
+    tokens does not scan the cache.
+
+    The cache lives in process memory, so an invalidation only reaches the worker
+    that handled the write; the TTL bounds how long other workers can serve a
+    stale entry.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._keys_by_user = {}  # user pk -> {key, ...}
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a lookup that raced with one does not
+        # put a stale entry back.
+        self._generation = 0
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return _detached(value)
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, key, value, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._keys_by_user.setdefault(value[0].pk, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_key(self, key):
+        with self._lock:
+            self._generation += 1
+            self._remove(key)
+
+    def invalidate_user(self, user_pk):
+        with self._lock:
+            self._generation += 1
+            for key in self._keys_by_user.pop(user_pk, ()):
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys_by_user.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_pk = entry[1][0].pk
+        keys = self._keys_by_user[user_pk]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_user[user_pk]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def _detached(value):
+    """
+    Copy a cached (user, token) pair, keeping token.user pointing at the copied user.
+    """
+    user, token = value
+    user, token = copy.copy(user), copy.copy(token)
+    token.user = user
+    return (user, token)
+
+
+token_cache = TokenCache(
+    max_size=getattr(settings, 'LMS_TOKEN_CACHE_MAX_SIZE', 10000),
+    ttl=getattr(settings, 'LMS_TOKEN_CACHE_TTL', 60),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that skips the token + user query for recently seen tokens.
+
+    Entries are dropped when the token is deleted or its user is saved or deleted
+    (see lms.signals). QuerySet.update() sends no signals, so changes made that
+    way are only picked up once the entry expires.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        generation = token_cache.generation
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, (user, token), generation)
+        return (user, token)
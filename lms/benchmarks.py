@@ -0,0 +1,336 @@
+"""
+Endpoint benchmark suite with latency and query budgets.
+
+ENDPOINTS declares one Endpoint per route in lms.urls: how to build its request
+and the budgets it must stay within, the most SQL queries a single request may
+run and its p95 latency. run_in_process() sends each request through the Django
+test client, counting queries with CaptureQueriesContext; callers run it inside
+a transaction they roll back, since half the routes write. run_live() replays
+the read-only endpoints against a running server with lms.loadgen, without
+query counts or budgets. Results are plain dicts so runs can be saved as JSON
+and compared, and over_budget() lists what failed or exceeded its budget.
+"""
+import datetime
+import json
+import time
+from urllib.parse import urlencode
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from . import loadgen
+from .models import Book, BookCirculation, BookDetails, BorrowedBooks, BorrowerCirculation, CustomUser
+from .urls import urlpatterns
+
+BENCH_DOMAIN = 'bench.example.com'
+
+READ_P95_MS = 250
+WRITE_P95_MS = 500
+# Password hashing dominates creating a user
+HASHING_P95_MS = 1000
+EXPORT_P95_MS = 10000
+
+
+class Endpoint:
+    """
+    A benchmarked route.
+
+    `build(fixture, n)` returns the reverse() kwargs and client options for the
+    n-th request to the route, creating whatever rows that request consumes; it
+    runs outside the timing and the query count. `max_requests` caps the number
+    of requests for endpoints too heavy to repeat many times.
+    """
+
+    def __init__(self, url_name, method='get', build=None, status=200, queries=5, p95_ms=READ_P95_MS, max_requests=None):
+        self.url_name = url_name
+        self.method = method
+        self.build = build or (lambda fixture, n: ({}, {}))
+        self.status = status
+        self.queries = queries
+        self.p95_ms = p95_ms
+        self.max_requests = max_requests
+
+    @property
+    def read_only(self):
+        return self.method == 'get'
+
+
+class Fixture:
+    """
+    The rows the benchmarked requests refer to.
+
+    Prefers the busiest book and borrower of the loaded dataset (run seed_data
+    first for realistic volumes) and creates what is missing, plus a staff user
+    whose token authenticates every request.
+    """
+
+    def __init__(self, token=None):
+        self.token = token
+        self.user_id = self.book_id = self.borrower_id = self.loan_id = self.details_id = None
+
+    @classmethod
+    def create(cls):
+        """
+        Build the fixture, writing rows; use inside a transaction that is rolled back.
+        """
+        staff = CustomUser.objects.create(name="Benchmark Staff", email=f"staff@{BENCH_DOMAIN}", password='!', is_staff=True)
+        fixture = cls(Token.objects.create(user=staff).key)
+        fixture.user_id = staff.userID
+        fixture._pick_existing()
+        if fixture.book_id is None:
+            book = Book.objects.create(title="Benchmark Book", isbn="B00000000", published_date="2000-01-01", genre="Benchmark", copies=50, available_copies=50)
+            fixture.book_id = book.bookID
+        if fixture.details_id is None:
+            fixture.details_id = BookDetails.objects.create(bookID_id=fixture.book_id, number_of_pages=300, publisher="Benchmark Press", language="English").detailsID
+        if fixture.loan_id is None:
+            fixture.loan_id = BorrowedBooks.objects.create(userID_id=fixture.user_id, bookID_id=fixture.book_id, borrow_date=datetime.date.today()).id
+        if fixture.borrower_id is None:
+            fixture.borrower_id = fixture.user_id
+        return fixture
+
+    @classmethod
+    def existing(cls, token):
+        """
+        Build the fixture from existing rows only, for benchmarking a live server.
+
+        Raises ValueError when the database has no loans to refer to.
+        """
+        fixture = cls(token)
+        fixture._pick_existing()
+        fixture.user_id = fixture.borrower_id
+        if None in (fixture.book_id, fixture.borrower_id, fixture.loan_id, fixture.details_id):
+            raise ValueError("The database needs books with details, users and loans; run seed_data first.")
+        return fixture
+
+    def _pick_existing(self):
+        self.book_id = (
+            BookCirculation.objects.filter(book__details__isnull=False).order_by('-total_loans', 'book').values_list('book', flat=True).first()
+            or BookDetails.objects.order_by('bookID').values_list('bookID', flat=True).first()
+        )
+        if self.book_id is not None:
+            self.details_id = BookDetails.objects.filter(bookID=self.book_id).values_list('detailsID', flat=True).first()
+            self.loan_id = BorrowedBooks.objects.filter(bookID=self.book_id).order_by('-id').values_list('id', flat=True).first()
+        self.borrower_id = BorrowerCirculation.objects.order_by('-open_loans', 'user').values_list('user', flat=True).first()
+        if self.loan_id is not None and self.borrower_id is None:
+            self.borrower_id = BorrowedBooks.objects.filter(id=self.loan_id).values_list('userID', flat=True).first()
+
+    def book_payload(self):
+        return Book.objects.values('title', 'isbn', 'published_date', 'genre', 'copies').get(bookID=self.book_id)
+
+    # Rows consumed by one request each
+
+    def new_user(self, n):
+        return CustomUser.objects.create(name=f"Benchmark User {n}", email=f"user{n}@{BENCH_DOMAIN}", password='!').userID
+
+    def new_book(self, n, copies=1):
+        return Book.objects.create(title=f"Benchmark Book {n}", isbn=f"B{n:08d}", published_date="2000-01-01", genre="Benchmark", copies=copies, available_copies=copies).bookID
+
+    def new_details(self, n):
+        return BookDetails.objects.create(bookID_id=self.new_book(n), number_of_pages=300, publisher="Benchmark Press", language="English").detailsID
+
+    def new_loan(self, n):
+        return BorrowedBooks.objects.create(userID_id=self.user_id, bookID_id=self.new_book(n), borrow_date=datetime.date.today()).id
+
+
+def _json(data):
+    return {"data": data, "format": 'json'}
+
+
+def _ndjson(rows):
+    return {"data": "".join(json.dumps(row) + "\n" for row in rows), "content_type": 'application/x-ndjson'}
+
+
+def _ids(first, count=100):
+    # A desk-sized batch; ids past the end of the table come back as missing
+    return {"data": {"ids": ",".join(str(first + i) for i in range(count))}}
+
+
+def _fresh(make, n, count=10):
+    # Rows for the bulk endpoints, numbered clear of the single-row builders'
+    return [make(50_000_000 + n * count + i) for i in range(count)]
+
+
+def _book(n):
+    return {"title": f"Benchmark Book {n}", "isbn": f"C{n:08d}", "published_date": "2000-01-01", "genre": "Benchmark", "copies": 2}
+
+
+ENDPOINTS = [
+    Endpoint(None, status=302, queries=0),
+
+    # Users
+    Endpoint('create-user', 'post', status=201, queries=7, p95_ms=HASHING_P95_MS, build=lambda f, n: (
+        {}, _json({"name": f"Benchmark User {n}", "email": f"new{n}@{BENCH_DOMAIN}", "password": "benchmark-password"}))),
+    Endpoint('provision-users', 'post', status=201, queries=6, p95_ms=10 * HASHING_P95_MS, max_requests=5, build=lambda f, n: (
+        {}, _ndjson({"name": f"Provisioned {n}-{i}", "email": f"prov{n}-{i}@{BENCH_DOMAIN}", "password": "benchmark-password"} for i in range(10)))),
+    Endpoint('list-users', queries=2),
+    Endpoint('get-user-by-id', queries=1, build=lambda f, n: ({'id': f.borrower_id}, {})),
+    Endpoint('get-users-by-ids', queries=1, build=lambda f, n: ({}, _ids(f.borrower_id))),
+    Endpoint('list-user-current-loans', queries=1, build=lambda f, n: ({'id': f.borrower_id}, {})),
+    Endpoint('list-user-loan-history', queries=2, build=lambda f, n: ({'id': f.borrower_id}, {})),
+    Endpoint('update-user', 'put', queries=5, p95_ms=WRITE_P95_MS, build=lambda f, n: (
+        {'id': f.user_id}, _json({"name": f"Benchmark Staff {n}", "email": f"staff@{BENCH_DOMAIN}"}))),
+    Endpoint('delete-user', 'delete', status=204, queries=17, p95_ms=WRITE_P95_MS, build=lambda f, n: ({'id': f.new_user(n)}, {})),
+
+    # Books
+    Endpoint('create-book', 'post', status=201, queries=4, p95_ms=WRITE_P95_MS, build=lambda f, n: ({}, _json(_book(n)))),
+    Endpoint('import-books', 'post', status=201, queries=5, p95_ms=WRITE_P95_MS, max_requests=20, build=lambda f, n: (
+        {}, _ndjson(_book(n * 100 + i) | {"isbn": f"I{n:05d}{i:02d}"} for i in range(10)))),
+    Endpoint('list-books', queries=3),
+    Endpoint('search-books', queries=2, build=lambda f, n: ({}, {"data": {"q": "benchmark"}})),
+    Endpoint('get-book-by-id', queries=1, build=lambda f, n: ({'id': f.book_id}, {})),
+    Endpoint('get-books-by-ids', queries=1, build=lambda f, n: ({}, _ids(f.book_id))),
+    Endpoint('list-book-current-borrowers', queries=1, build=lambda f, n: ({'id': f.book_id}, {})),
+    Endpoint('list-book-loan-history', queries=2, build=lambda f, n: ({'id': f.book_id}, {})),
+    Endpoint('update-book', 'put', queries=8, p95_ms=WRITE_P95_MS, build=lambda f, n: (
+        {'id': f.book_id}, _json(f.book_payload() | {"title": f"Benchmark Title {n}"}))),
+    Endpoint('bulk-update-books', 'post', queries=5, p95_ms=WRITE_P95_MS, build=lambda f, n: (
+        {}, _ndjson({"bookID": book_id, "title": f"Bulk Title {n}", "copies": 3} for book_id in _fresh(f.new_book, n)))),
+    Endpoint('delete-book', 'delete', status=204, queries=13, p95_ms=WRITE_P95_MS, build=lambda f, n: ({'id': f.new_book(n)}, {})),
+
+    # Book details
+    Endpoint('create-book-details', 'post', status=201, queries=4, p95_ms=WRITE_P95_MS, build=lambda f, n: (
+        {}, _json({"bookID": f.new_book(n), "number_of_pages": 300, "publisher": "Benchmark Press", "language": "English"}))),
+    Endpoint('get-book-details-by-id', queries=1, build=lambda f, n: ({'id': f.details_id}, {})),
+    Endpoint('update-book-details', 'put', queries=5, p95_ms=WRITE_P95_MS, build=lambda f, n: (
+        {'id': f.details_id}, _json({"bookID": f.book_id, "number_of_pages": 300 + n, "publisher": "Benchmark Press", "language": "English"}))),
+    Endpoint('bulk-update-book-details', 'post', queries=5, p95_ms=WRITE_P95_MS, build=lambda f, n: (
+        {}, _ndjson({"detailsID": details_id, "number_of_pages": 300 + n} for details_id in _fresh(f.new_details, n)))),
+    Endpoint('delete-book-details', 'delete', status=204, queries=3, p95_ms=WRITE_P95_MS, build=lambda f, n: ({'id': f.new_details(n)}, {})),
+
+    # Loans
+    Endpoint('borrow-book', 'post', status=201, queries=16, p95_ms=WRITE_P95_MS, build=lambda f, n: (
+        {}, _json({"userID": f.user_id, "bookID": f.new_book(n), "borrow_date": datetime.date.today().isoformat()}))),
+    Endpoint('get-borrowed-book-by-id', queries=1, build=lambda f, n: ({'id': f.loan_id}, {})),
+    Endpoint('get-borrowed-books-by-ids', queries=1, build=lambda f, n: ({}, _ids(f.loan_id))),
+    Endpoint('return-borrowed-book', 'put', queries=14, p95_ms=WRITE_P95_MS, build=lambda f, n: (
+        {'id': f.new_loan(n)}, _json({"return_date": datetime.date.today().isoformat()}))),
+    Endpoint('bulk-return-borrowed-books', 'post', queries=15, p95_ms=WRITE_P95_MS, build=lambda f, n: (
+        {}, _ndjson({"id": loan_id} for loan_id in _fresh(f.new_loan, n)))),
+    Endpoint('delete-borrowed-book', 'delete', status=204, queries=15, p95_ms=WRITE_P95_MS, build=lambda f, n: ({'id': f.new_loan(n)}, {})),
+
+    # Export, statistics and operations
+    Endpoint('export-resource', queries=1, p95_ms=EXPORT_P95_MS, max_requests=3, build=lambda f, n: ({'resource': 'books'}, {})),
+    Endpoint('circulation-stats', queries=3),
+    Endpoint('token-cache-stats', queries=0),
+
+    # Async reads
+    Endpoint('async-list-users', queries=2),
+    Endpoint('async-get-user-by-id', queries=1, build=lambda f, n: ({'id': f.borrower_id}, {})),
+    Endpoint('async-list-books', queries=3),
+    Endpoint('async-get-book-by-id', queries=1, build=lambda f, n: ({'id': f.book_id}, {})),
+    Endpoint('async-get-borrowed-book-by-id', queries=1, build=lambda f, n: ({'id': f.loan_id}, {})),
+]
+
+
+def route_names():
+    """
+    URL names of every route in lms.urls (None for the unnamed redirect).
+    """
+    return [pattern.name for pattern in urlpatterns]
+
+
+def _path(endpoint, kwargs):
+    if endpoint.url_name is None:
+        return reverse('list-users').rsplit('users/list/', 1)[0]
+    return reverse(endpoint.url_name, kwargs=kwargs)
+
+
+def _result(endpoint, summary, queries, status_codes, budget):
+    return {
+        "endpoint": endpoint.url_name or "root",
+        "method": endpoint.method.upper(),
+        **summary,
+        "queries": queries,
+        "status_codes": status_codes,
+        "budget": budget,
+    }
+
+
+def run_in_process(client, fixture, requests=50, warmup=2, endpoints=None, progress=None):
+    """
+    Benchmark `endpoints` (default: all) through a Django test client.
+
+    `warmup` requests per endpoint fill caches and are not measured. Requests
+    run one at a time, so requests_per_second is 1 / mean latency. `queries`
+    is the largest number of queries one measured request ran.
+    """
+    client.credentials(HTTP_AUTHORIZATION=f'Token {fixture.token}')
+    results = []
+    counter = 0
+    for endpoint in endpoints or ENDPOINTS:
+        count = min(requests, endpoint.max_requests or requests)
+        latencies, queries, errors, status_codes = [], 0, 0, {}
+        for i in range(warmup + count):
+            counter += 1
+            kwargs, options = endpoint.build(fixture, counter)
+            path = _path(endpoint, kwargs)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = getattr(client, endpoint.method)(path, **options)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - started
+            if i < warmup:
+                continue
+            status_codes[response.status_code] = status_codes.get(response.status_code, 0) + 1
+            if response.status_code != endpoint.status:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            queries = max(queries, len(captured))
+        budget = {"queries": endpoint.queries, "p95_ms": endpoint.p95_ms}
+        result = _result(endpoint, loadgen.summarize(latencies, errors, sum(latencies)), queries, status_codes, budget)
+        results.append(result)
+        if progress:
+            progress(result)
+    return results
+
+
+def run_live(base_url, fixture, requests=500, concurrency=1, timeout=30.0, endpoints=None, progress=None):
+    """
+    Benchmark the read-only `endpoints` (default: all) on a running server at
+    `base_url`, e.g. http://127.0.0.1:8000. The token must belong to a staff
+    user for the admin-only endpoints.
+
+    Query counts are not available, and latency includes connection setup, the
+    server stack and, once `concurrency` exceeds what the server handles at
+    once, queueing; so budgets are not applied and only failed requests count
+    against a live run. Compare live runs with each other instead.
+    """
+    headers = {"Authorization": f"Token {fixture.token}", "Accept": "application/json"}
+    results = []
+    for endpoint in endpoints or ENDPOINTS:
+        if not endpoint.read_only or endpoint.status != 200:
+            continue
+        kwargs, options = endpoint.build(fixture, 0)
+        url = base_url.rstrip('/') + _path(endpoint, kwargs)
+        if options.get("data"):
+            url += "?" + urlencode(options["data"])
+        count = min(requests, endpoint.max_requests or requests)
+        summary = loadgen.run_load(url, headers, concurrency=concurrency, total=count, timeout=timeout)
+        result = _result(endpoint, summary, None, None, None)
+        results.append(result)
+        if progress:
+            progress(result)
+    return results
+
+
+def over_budget(results):
+    """
+    Return a message for every result with failed requests or over its query or latency budget.
+    """
+    failures = []
+    for result in results:
+        name, budget = result["endpoint"], result["budget"]
+        if result["errors"] or not result["requests"]:
+            codes = f" (status codes {result['status_codes']})" if result["status_codes"] else ""
+            failures.append(f"{name}: {result['errors']} failed requests{codes}")
+        if budget is None:
+            continue
+        if result["queries"] > budget["queries"]:
+            failures.append(f"{name}: {result['queries']} queries, budget {budget['queries']}")
+        if result["p95_ms"] is not None and result["p95_ms"] > budget["p95_ms"]:
+            failures.append(f"{name}: p95 {result['p95_ms']} ms, budget {budget['p95_ms']} ms")
+    return failures
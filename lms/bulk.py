@@ -0,0 +1,539 @@
+"""
+Bulk loading helpers shared by the bulk API endpoints and management commands.
+"""
+import csv
+import json
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import circulation, overdue, stats
+from .models import Book, BookDetails, BorrowedBooks, CatalogVersion, CustomUser
+from .serializers import (
+    BookBulkUpdateSerializer,
+    BookDetailsBulkUpdateSerializer,
+    BookDetailsSerializer,
+    BookImportSerializer,
+    BookSerializer,
+    BorrowedBooksSerializer,
+    LoanReturnSerializer,
+    UserProvisionSerializer,
+)
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 10000
+
+# Only the first errors are kept in the summary so a bad 1M-row file cannot
+# blow up the response; the failed counter is always exact.
+MAX_REPORTED_ERRORS = 1000
+
+# Bulk updates and returns run in one transaction and report every row, so a
+# request is limited to this many rows.
+MAX_UPDATE_ROWS = 10000
+
+
+CONTENT_TYPE_FORMATS = {
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+}
+
+
+def iter_ndjson_rows(lines):
+    """
+    Yield (line_number, data) pairs from an iterable of NDJSON lines.
+
+    Lines that are not valid JSON are yielded with data set to None so the
+    importer can report them without aborting the load.
+    """
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        yield number, data
+
+
+def iter_csv_rows(lines):
+    """
+    Yield (line_number, data) pairs from an iterable of CSV lines with a header row.
+    """
+    reader = csv.DictReader(lines)
+    for data in reader:
+        yield reader.line_num, data
+
+
+def get_row_parser(file_format):
+    """
+    Return the row iterator for 'ndjson' or 'csv'.
+    """
+    return iter_csv_rows if file_format == 'csv' else iter_ndjson_rows
+
+
+def parse_batch_size(value):
+    """
+    Parse a client-supplied batch size, falling back to the default and capping it.
+    """
+    if value in (None, ''):
+        return DEFAULT_BATCH_SIZE
+    batch_size = int(value)
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer.")
+    return min(batch_size, MAX_BATCH_SIZE)
+
+
+def import_books(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Validate and insert books from an iterable of (line_number, data) pairs.
+
+    Rows are consumed lazily in batches of `batch_size`. Each batch costs one
+    `isbn IN (...)` query and one `bulk_create`. Invalid rows are reported and
+    skipped; the rest of the load carries on.
+
+    Returns a summary dict: {"created": int, "failed": int, "errors": [...]}.
+    """
+    result = {"created": 0, "failed": 0, "errors": []}
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        _import_book_batch(batch, result)
+    return result
+
+
+def _record_error(result, number, errors):
+    result["failed"] += 1
+    if len(result["errors"]) < MAX_REPORTED_ERRORS:
+        result["errors"].append({"row": number, "errors": errors})
+
+
+def _import_book_batch(batch, result):
+    candidates = {}  # isbn -> (line_number, Book)
+    for number, data in batch:
+        if not isinstance(data, dict):
+            _record_error(result, number, {"non_field_errors": ["Row must be a JSON object."]})
+            continue
+
+        serializer = BookImportSerializer(data=data)
+        if not serializer.is_valid():
+            _record_error(result, number, serializer.errors)
+            continue
+
+        isbn = serializer.validated_data['isbn']
+        if isbn in candidates:
+            _record_error(result, number, {"isbn": ["ISBN is repeated in the import."]})
+            continue
+        book = Book(**serializer.validated_data)
+        book.available_copies = book.copies
+        candidates[isbn] = (number, book)
+
+    if not candidates:
+        return
+
+    # One uniqueness check for the whole batch
+    existing = Book.objects.filter(isbn__in=list(candidates)).values_list('isbn', flat=True)
+    for isbn in existing:
+        number, _ = candidates.pop(isbn)
+        _record_error(result, number, {"isbn": ["ISBN must be unique."]})
+
+    books = [book for _, book in candidates.values()]
+    try:
+        with transaction.atomic():
+            Book.objects.bulk_create(books)
+            CatalogVersion.bump(CatalogVersion.BOOKS)
+    except IntegrityError:
+        # Another writer took one of the ISBNs since the check; insert row by row
+        # so only the conflicting rows fail.
+        for number, book in candidates.values():
+            try:
+                with transaction.atomic():
+                    book.save(force_insert=True)
+            except IntegrityError:
+                _record_error(result, number, {"isbn": ["ISBN must be unique."]})
+            else:
+                result["created"] += 1
+    else:
+        result["created"] += len(books)
+
+
+def provision_users(rows, batch_size=DEFAULT_BATCH_SIZE, workers=None):
+    """
+    Validate and create users, with an auth token each, from (line_number, data) pairs.
+
+    Rows need `name`, `email` and `password`. Passwords are hashed across a pool of
+    `workers` processes (1 hashes inline). By default they go to the pool of
+    LMS_PASSWORD_HASH_WORKERS processes that every request in this process
+    shares, so concurrent requests cannot multiply processes. Each batch costs
+    one `email IN (...)` query and one `bulk_create` each for users and tokens.
+
+    Returns the same summary as import_books, plus the elapsed time and throughput.
+    """
+    result = {"created": 0, "failed": 0, "errors": []}
+    started = time.monotonic()
+
+    rows = iter(rows)
+    with _password_hasher(workers) as hash_passwords:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            _provision_user_batch(batch, result, hash_passwords)
+
+    elapsed = time.monotonic() - started
+    result["seconds"] = round(elapsed, 3)
+    result["users_per_second"] = round(result["created"] / elapsed, 1) if elapsed else 0.0
+    return result
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def _shared_password_pool():
+    """
+    Return the process-wide hashing pool, starting it on first use.
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ProcessPoolExecutor(max_workers=_shared_pool_size(), initializer=django.setup)
+        return _shared_pool
+
+
+def _shared_pool_size():
+    return max(1, getattr(settings, 'LMS_PASSWORD_HASH_WORKERS', 4))
+
+
+def shutdown_password_pool():
+    """
+    Stop the shared hashing pool, if it was started; the next request starts a new one.
+    """
+    global _shared_pool
+    with _shared_pool_lock:
+        pool, _shared_pool = _shared_pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def _hash_with(pool, workers):
+    def hash_passwords(passwords):
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(pool.map(make_password, passwords, chunksize=chunksize))
+    return hash_passwords
+
+
+@contextmanager
+def _password_hasher(workers):
+    if workers is None:
+        if _shared_pool_size() <= 1:
+            workers = 1
+        else:
+            try:
+                yield _hash_with(_shared_password_pool(), _shared_pool_size())
+            except BrokenProcessPool:
+                # A worker died; let the next request start a fresh pool
+                shutdown_password_pool()
+                raise
+            return
+
+    if workers <= 1:
+        yield lambda passwords: [make_password(password) for password in passwords]
+        return
+
+    # Worker processes only run make_password, but still need configured settings
+    # when the platform spawns rather than forks them.
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        yield _hash_with(pool, workers)
+
+
+def _provision_user_batch(batch, result, hash_passwords):
+    candidates = {}  # email -> (line_number, validated_data)
+    for number, data in batch:
+        if not isinstance(data, dict):
+            _record_error(result, number, {"non_field_errors": ["Row must be a JSON object."]})
+            continue
+
+        serializer = UserProvisionSerializer(data=data)
+        if not serializer.is_valid():
+            _record_error(result, number, serializer.errors)
+            continue
+
+        email = serializer.validated_data['email']
+        if email in candidates:
+            _record_error(result, number, {"email": ["Email address is repeated in the import."]})
+            continue
+        candidates[email] = (number, serializer.validated_data)
+
+    if not candidates:
+        return
+
+    existing = CustomUser.objects.filter(email__in=list(candidates)).values_list('email', flat=True)
+    for email in existing:
+        number, _ = candidates.pop(email)
+        _record_error(result, number, {"email": ["Email address must be unique."]})
+
+    if not candidates:
+        return
+
+    # Hash before opening the transaction so the slow part holds no locks
+    passwords = hash_passwords([data['password'] for _, data in candidates.values()])
+    # Same flags as users registered one by one (views.create_user)
+    users = [
+        CustomUser(name=data['name'], email=data['email'], password=password, is_staff=True, is_superuser=False)
+        for (_, data), password in zip(candidates.values(), passwords)
+    ]
+
+    try:
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(users)
+            Token.objects.bulk_create([Token(key=Token.generate_key(), user=user) for user in users])
+    except IntegrityError:
+        for (number, _), user in zip(candidates.values(), users):
+            user.pk = None
+            try:
+                with transaction.atomic():
+                    user.save(force_insert=True)
+                    Token.objects.create(user=user)
+            except IntegrityError:
+                _record_error(result, number, {"email": ["Email address must be unique."]})
+            else:
+                result["created"] += 1
+    else:
+        result["created"] += len(users)
+
+
+def _take_rows(rows):
+    """
+    Buffer at most MAX_UPDATE_ROWS (line_number, data) pairs; raise ValueError beyond that.
+    """
+    rows = list(islice(rows, MAX_UPDATE_ROWS + 1))
+    if len(rows) > MAX_UPDATE_ROWS:
+        raise ValueError(f"At most {MAX_UPDATE_ROWS} rows can be sent in one request.")
+    return rows
+
+
+def _batches(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
+def _record_result(result, number, pk, errors=None, data=None):
+    if errors is None:
+        result["results"].append({"row": number, "id": pk, "data": data})
+    else:
+        result["failed"] += 1
+        result["results"].append({"row": number, "id": pk, "errors": errors})
+
+
+def return_loans(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Return many loans from (line_number, data) pairs with an `id` and an optional
+    `return_date` (today by default).
+
+    Everything happens in one transaction. Each batch locks its loans with one
+    SELECT, writes them with one UPDATE and releases their copies with another,
+    whatever the number of books; fines are settled as in a single return. Loans
+    that do not exist, are already returned, or would be returned before they
+    were borrowed are reported and skipped.
+
+    Returns {"returned": int, "failed": int, "results": [...]} with one result per
+    row, in row order. Raises ValueError for more than MAX_UPDATE_ROWS rows.
+    """
+    rows = _take_rows(rows)
+    result = {"returned": 0, "failed": 0, "results": []}
+    rates = overdue.fine_rates()
+    with transaction.atomic():
+        for batch in _batches(rows, batch_size):
+            _return_loan_batch(batch, result, rates)
+    result["results"].sort(key=lambda item: item["row"])
+    return result
+
+
+def _return_loan_batch(batch, result, rates):
+    today = timezone.localdate()
+    candidates = {}  # loan ID -> (line_number, return_date)
+    for number, data in batch:
+        if not isinstance(data, dict):
+            _record_result(result, number, None, {"non_field_errors": ["Row must be a JSON object."]})
+            continue
+
+        serializer = LoanReturnSerializer(data=data)
+        if not serializer.is_valid():
+            _record_result(result, number, data.get('id'), serializer.errors)
+            continue
+
+        loan_id = serializer.validated_data['id']
+        if loan_id in candidates:
+            _record_result(result, number, loan_id, {"id": ["Loan is repeated in the request."]})
+            continue
+        candidates[loan_id] = (number, serializer.validated_data.get('return_date', today))
+
+    if not candidates:
+        return
+
+    loans = BorrowedBooks.objects.select_related('bookID').select_for_update(of=('self',)).filter(id__in=list(candidates)).order_by('id')
+    loans = {loan.id: loan for loan in loans}
+    returned = []
+    for loan_id, (number, return_date) in candidates.items():
+        loan = loans.get(loan_id)
+        if loan is None:
+            _record_result(result, number, loan_id, {"id": ["Loan does not exist."]})
+        elif loan.return_date is not None:
+            _record_result(result, number, loan_id, {"id": ["Loan was already returned."]})
+        elif return_date < loan.borrow_date:
+            _record_result(result, number, loan_id, {"return_date": ["return_date cannot be before borrow_date."]})
+        else:
+            loan.return_date = return_date
+            loan.fine = overdue.fine_for(loan.due_date, return_date, rates)
+            returned.append((number, loan))
+
+    circulation.return_loans([loan for _, loan in returned])
+    # One serializer for the batch, so its fields are built once
+    data = BorrowedBooksSerializer([loan for _, loan in returned], many=True).data
+    for (number, loan), item in zip(returned, data):
+        _record_result(result, number, loan.id, data=item)
+    result["returned"] += len(returned)
+
+
+def update_books(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Partially update many books from (line_number, data) pairs holding a `bookID`
+    and the fields to change.
+
+    Everything happens in one transaction. Each batch locks its books with one
+    SELECT, checks ISBN uniqueness with one `isbn IN (...)` query and writes the
+    changes with one UPDATE. A change of `copies` shifts `available_copies` by
+    the same amount, as update_book does.
+
+    Returns {"updated": int, "failed": int, "results": [...]} with one result per
+    row, in row order. Raises ValueError for more than MAX_UPDATE_ROWS rows.
+    """
+    return _update(rows, batch_size, Book, BookBulkUpdateSerializer, BookSerializer, _apply_book_updates)
+
+
+def update_book_details(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Partially update many book details from (line_number, data) pairs holding a
+    `detailsID` and the fields to change; see update_books.
+    """
+    return _update(rows, batch_size, BookDetails, BookDetailsBulkUpdateSerializer, BookDetailsSerializer, None)
+
+
+def _update(rows, batch_size, model, serializer_class, output_serializer_class, apply):
+    rows = _take_rows(rows)
+    result = {"updated": 0, "failed": 0, "results": []}
+    with transaction.atomic():
+        for batch in _batches(rows, batch_size):
+            updated = _update_batch(batch, result, model, serializer_class, apply)
+            data = output_serializer_class([instance for _, instance in updated], many=True).data
+            for (number, instance), item in zip(updated, data):
+                _record_result(result, number, instance.pk, data=item)
+            result["updated"] += len(updated)
+    result["results"].sort(key=lambda item: item["row"])
+    return result
+
+
+def _update_batch(batch, result, model, serializer_class, apply):
+    """
+    Validate a batch of partial updates against the locked rows and write them with
+    one bulk_update. `apply` may reject rows or make related changes; it gets the
+    valid (line_number, instance, validated_data) triples, before they are
+    applied, and returns those to keep.
+    """
+    pk_name = model._meta.pk.name
+    requested = {}  # pk -> (line_number, data)
+    for number, data in batch:
+        if not isinstance(data, dict):
+            _record_result(result, number, None, {"non_field_errors": ["Row must be a JSON object."]})
+            continue
+        pk = data.get(pk_name)
+        if isinstance(pk, str) and pk.isdigit():
+            pk = int(pk)
+        if not isinstance(pk, int) or isinstance(pk, bool):
+            _record_result(result, number, None, {pk_name: ["A valid integer is required."]})
+            continue
+        if pk in requested:
+            _record_result(result, number, pk, {pk_name: [f"{model.__name__} is repeated in the request."]})
+            continue
+        requested[pk] = (number, data)
+
+    if not requested:
+        return []
+
+    instances = {obj.pk: obj for obj in model.objects.select_for_update().filter(pk__in=list(requested)).order_by('pk')}
+    valid = []
+    for pk, (number, data) in requested.items():
+        instance = instances.get(pk)
+        if instance is None:
+            _record_result(result, number, pk, {pk_name: [f"{model.__name__} does not exist."]})
+            continue
+        changes = {field: value for field, value in data.items() if field != pk_name}
+        serializer = serializer_class(instance, data=changes, partial=True)
+        if not serializer.is_valid():
+            _record_result(result, number, pk, serializer.errors)
+            continue
+        valid.append((number, instance, serializer.validated_data))
+
+    if apply is not None:
+        valid = apply(valid, result)
+    if not valid:
+        return []
+
+    # bulk_update bypasses auto_now and the post_save signals
+    now = timezone.now()
+    fields = {'modified_at'}
+    for _, instance, validated_data in valid:
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.modified_at = now
+        fields.update(validated_data)
+    instances = [instance for _, instance, _ in valid]
+    model.objects.bulk_update(instances, sorted(fields))
+    CatalogVersion.bump(CatalogVersion.BOOKS)
+    return [(number, instance) for number, instance, _ in valid]
+
+
+def _apply_book_updates(valid, result):
+    isbns = {}  # new ISBN -> (line_number, book)
+    kept = []
+    for number, book, validated_data in valid:
+        isbn = validated_data.get('isbn')
+        if isbn is not None and isbn != book.isbn:
+            if isbn in isbns:
+                _record_result(result, number, book.pk, {"isbn": ["ISBN is repeated in the request."]})
+                continue
+            isbns[isbn] = (number, book)
+        kept.append((number, book, validated_data))
+
+    # One uniqueness check for the whole batch
+    taken = set(Book.objects.filter(isbn__in=list(isbns)).values_list('isbn', flat=True))
+    valid, kept = kept, []
+    genres = {}  # book ID -> (old genre, new genre)
+    for number, book, validated_data in valid:
+        if validated_data.get('isbn') in taken and validated_data['isbn'] != book.isbn:
+            _record_result(result, number, book.pk, {"isbn": ["ISBN must be unique."]})
+            continue
+        if 'copies' in validated_data:
+            # The row is locked, so the shelf count can be shifted here
+            book.available_copies += validated_data['copies'] - book.copies
+            validated_data = {**validated_data, 'available_copies': book.available_copies}
+        if validated_data.get('genre', book.genre) != book.genre:
+            genres[book.pk] = (book.genre, validated_data['genre'])
+        kept.append((number, book, validated_data))
+
+    if genres:
+        stats.move_genres(genres)
+    return kept
@@ -0,0 +1,160 @@
+"""
+Circulation: checking copies of a book out and back in.
+
+Book.available_copies is only ever changed with conditional UPDATEs whose WHERE
+clause re-checks the count on the row being written. Concurrent checkouts of the
+last copy therefore cannot both succeed, and no lock is held beyond the
+transaction that records the loan. Those UPDATEs bypass auto_now and signals, so
+they stamp Book.modified_at themselves. They do not bump the books
+CatalogVersion, whose single row would then serialize every checkout; book list
+validators also read the latest stamp (CatalogVersion.current).
+
+Every loan, return and delete is also counted in the lms.stats summary tables
+within the same transaction. All of them lock in one order: the loan, then the
+book (taking or returning its copy), then the summary rows. A return that
+counted first and released the copy second would deadlock with a checkout of
+the same book.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from . import overdue, stats
+from .models import Book, BorrowedBooks
+
+
+class NoCopiesAvailable(Exception):
+    """
+    Raised when every copy of a book is already on loan.
+    """
+
+
+class ReturnBeforeBorrow(Exception):
+    """
+    Raised when a loan would be returned before it was borrowed.
+    """
+
+
+def reserve_copy(book_id):
+    """
+    Take one available copy of a book. Returns False when none is left.
+    """
+    reserved = Book.objects.filter(bookID=book_id, available_copies__gt=0).update(
+        available_copies=F('available_copies') - 1, modified_at=timezone.now()
+    )
+    return reserved == 1
+
+
+def release_copy(book_id):
+    """
+    Put one copy of a book back on the shelf.
+    """
+    Book.objects.filter(bookID=book_id, available_copies__lt=F('copies')).update(
+        available_copies=F('available_copies') + 1, modified_at=timezone.now()
+    )
+
+
+def checkout(serializer):
+    """
+    Save a validated BorrowedBooksSerializer, reserving a copy if the loan is open.
+
+    Raises NoCopiesAvailable, without writing anything, when the book is fully on loan.
+    """
+    data = serializer.validated_data
+    with transaction.atomic():
+        if data.get('return_date') is None and not reserve_copy(data['bookID'].pk):
+            raise NoCopiesAvailable()
+        loan = serializer.save()
+        stats.record_loan(loan)
+        return loan
+
+
+def set_return_date(loan_id, return_date):
+    """
+    Set (or, with None, clear) a loan's return date, moving the copy back to or
+    off the shelf and settling its fine. `return_date` is a date, already
+    validated (views use ReturnDateSerializer).
+
+    Raises BorrowedBooks.DoesNotExist for an unknown loan, ReturnBeforeBorrow
+    for a return_date before the loan's borrow_date and NoCopiesAvailable when
+    re-opening a loan for a book with no free copies.
+    """
+    with transaction.atomic():
+        # The book's genre picks its stats row; only the loan is locked here
+        loan = BorrowedBooks.objects.select_related('bookID').select_for_update(of=('self',)).get(id=loan_id)
+        # Checked on the locked row, as bulk returns do
+        if return_date is not None and return_date < loan.borrow_date:
+            raise ReturnBeforeBorrow()
+        previous_return_date = loan.return_date
+        was_open = previous_return_date is None
+        if was_open and return_date is not None:
+            release_copy(loan.bookID_id)
+        elif not was_open and return_date is None and not reserve_copy(loan.bookID_id):
+            raise NoCopiesAvailable()
+
+        loan.return_date = return_date
+        # Settle the fine on return; a re-opened loan accrues from today again
+        loan.fine = overdue.fine_for(loan.due_date, loan.return_date or timezone.localdate())
+        loan.save()
+        stats.record_return(loan, previous_return_date)
+    return loan
+
+
+def return_loans(loans):
+    """
+    Record the return of many open loans whose return_date and fine are already
+    set, e.g. by a bulk return. Call inside a transaction holding their row locks.
+
+    Writes the loans with one UPDATE and puts the copies back on the shelf with
+    another, whatever the number of loans or books.
+    """
+    if not loans:
+        return
+    fields = {name: BorrowedBooks._meta.get_field(name) for name in ('return_date', 'fine')}
+    BorrowedBooks.objects.filter(id__in=[loan.id for loan in loans]).update(**{
+        name: stats.case_by_pk({loan.id: getattr(loan, name) for loan in loans}, field)
+        for name, field in fields.items()
+    })
+
+    per_book = Counter(loan.bookID_id for loan in loans)
+    returned = stats.case_by_pk(per_book, IntegerField())
+    Book.objects.filter(bookID__in=list(per_book)).update(
+        available_copies=Least(F('available_copies') + returned, F('copies')), modified_at=timezone.now()
+    )
+    stats.record_returns(loans)
+
+
+def delete_loan(loan_id):
+    """
+    Delete a loan, returning its copy to the shelf if it was still open.
+
+    Raises BorrowedBooks.DoesNotExist for an unknown loan.
+    """
+    with transaction.atomic():
+        # Read under the lock, so a concurrent return cannot release the copy twice
+        loan = BorrowedBooks.objects.select_related('bookID').select_for_update(of=('self',)).get(id=loan_id)
+        if loan.return_date is None:
+            release_copy(loan.bookID_id)
+        stats.record_delete(loan)
+        loan.delete()
+
+
+def release_copies(loans):
+    """
+    Return every copy a queryset of loans has out, in one UPDATE, before the
+    loans are deleted (e.g. with their user).
+    """
+    open_loans = loans.filter(return_date__isnull=True)
+    per_book = (
+        open_loans.filter(bookID=OuterRef('pk'))
+        .order_by()
+        .values('bookID')
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    Book.objects.filter(bookID__in=open_loans.values('bookID')).update(
+        available_copies=F('available_copies') + Subquery(per_book), modified_at=timezone.now()
+    )
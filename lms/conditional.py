@@ -0,0 +1,64 @@
+"""
+Conditional GET support (ETag / Last-Modified) for read endpoints.
+
+Views compute validators from version data they already have, or can get with one
+indexed lookup, and return 304 before any serializer runs. Representations that
+embed loans (expand=borrowed_books) are not validated: loans, and the fines
+lms.overdue assesses on them, change without touching their book, so pass
+etag=None for those.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """
+    Build a strong ETag from the values that identify a representation.
+    """
+    digest = hashlib.md5("|".join(str(part) for part in parts).encode(), usedforsecurity=False).hexdigest()
+    return quote_etag(digest)
+
+
+def not_modified_response(request, etag, last_modified):
+    """
+    Return a 304 response when the client's cached copy is current, otherwise None.
+
+    `last_modified` is a datetime; If-None-Match takes precedence over
+    If-Modified-Since as RFC 9110 requires. Always None when `etag` is None.
+    """
+    if etag is None:
+        return None
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    """
+    Attach ETag and Last-Modified headers to a response and return it; with
+    `etag` None, the response is returned unchanged.
+    """
+    if etag is None:
+        return response
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def book_validators(book, expand):
+    """
+    Return (etag, last_modified) for one book rendered with `expand`.
+
+    Checkouts and returns stamp the book and details changes stamp their own
+    row; loans are not covered, so with borrowed_books this is (None, None).
+    """
+    if 'borrowed_books' in expand:
+        return None, None
+    details = getattr(book, 'details', None) if 'details' in expand else None
+    last_modified = max(book.modified_at, details.modified_at) if details else book.modified_at
+    return make_etag('book', book.bookID, book.modified_at, details and details.modified_at, sorted(expand)), last_modified
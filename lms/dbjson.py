@@ -0,0 +1,146 @@
+"""
+Database-side JSON assembly for large list and export responses on PostgreSQL.
+
+With LMS_LIST_JSON_STRATEGY = 'database', page-number list pages are built by a
+single `SELECT json_agg(json_build_object(...))` and NDJSON exports by one
+`json_build_object(...)::text` per row, and the resulting text is written to the
+response as is: no model instances, serializers or JSON encoding in Python.
+Every other case (SQLite, cursor pagination, `expand`, a non-UTC active
+timezone) keeps the Python path.
+
+The payloads equal the Python ones value for value; only insignificant
+whitespace differs. Timestamps are formatted in SQL the way DRF
+(microseconds) and DjangoJSONEncoder (milliseconds) print them in UTC.
+"""
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Func, JSONField, TextField, Value, Window
+from django.db.models.functions import Cast, RowNumber
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import ISO_8601, relations, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+PYTHON = 'python'
+DATABASE = 'database'
+STRATEGIES = (PYTHON, DATABASE)
+
+# Stands in for the array while the rest of the response body is rendered.
+PLACEHOLDER = "\x00lms-json-array\x00"
+
+
+def enabled(queryset):
+    """
+    Return True when `queryset`'s rows should be assembled by the database it
+    reads from (a replica, when lms.replicas routes the read there).
+    """
+    return (
+        getattr(settings, 'LMS_LIST_JSON_STRATEGY', PYTHON) == DATABASE
+        and connections[queryset.db].vendor == 'postgresql'
+        and timezone.get_current_timezone_name() == 'UTC'
+    )
+
+
+class JSONBuildObject(Func):
+    """
+    json_build_object(key1, value1, ...); unlike jsonb, json keeps the key order.
+    """
+    function = 'json_build_object'
+    output_field = JSONField()
+
+    def __init__(self, pairs):
+        expressions = []
+        for key, expression in pairs:
+            expressions += [Value(key), expression]
+        super().__init__(*expressions)
+
+
+class UTCTimestamp(Func):
+    """
+    A timestamptz column as Python's isoformat() prints it in UTC, with a "Z".
+
+    `fraction` is 'US' (microseconds, as DRF) or 'MS' (milliseconds, as
+    DjangoJSONEncoder); like isoformat(), no fraction is printed when the
+    microseconds are zero. Column expressions only: the column is repeated.
+    """
+    template = (
+        "to_char(%(expressions)s AT TIME ZONE 'UTC', 'YYYY-MM-DD\"T\"HH24:MI:SS') || "
+        "CASE WHEN mod(extract(microseconds FROM %(expressions)s)::bigint, 1000000) = 0 THEN '' "
+        "ELSE to_char(%(expressions)s AT TIME ZONE 'UTC', '.%(fraction)s') END || 'Z'"
+    )
+    output_field = TextField()
+
+    def __init__(self, expression, fraction='US'):
+        super().__init__(expression, fraction=fraction)
+
+
+def _serializer_pairs(rows):
+    """
+    (key, expression) pairs reproducing a lean.ValuesSerializer's output.
+
+    Raises ValueError for fields with no SQL equivalent here.
+    """
+    pairs = []
+    for name, source, field, _ in rows.columns:
+        if isinstance(field, serializers.DateTimeField) and getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601:
+            pairs.append((name, UTCTimestamp(F(source))))
+        elif isinstance(field, serializers.DateField) and getattr(field, 'format', api_settings.DATE_FORMAT) == ISO_8601:
+            pairs.append((name, F(source)))
+        elif isinstance(field, (serializers.CharField, serializers.IntegerField, serializers.BooleanField, relations.PrimaryKeyRelatedField)):
+            pairs.append((name, F(source)))
+        else:
+            raise ValueError(f"{rows.serializer_class.__name__}.{name} cannot be built in SQL.")
+    return pairs
+
+
+def json_array(page, rows, ordering):
+    """
+    Return the rows of an unevaluated, sliced values() queryset as JSON array
+    text, shaped like rows.serialize(page).
+
+    `ordering` is the page's order_by(), used to keep the array in order.
+    """
+    pairs = _serializer_pairs(rows)
+    order_by = [F(name[1:]).desc() if name.startswith('-') else F(name).asc() for name in ordering]
+    page = page.values(json_row=JSONBuildObject(pairs), json_position=Window(RowNumber(), order_by=order_by))
+    sql, params = page.query.sql_with_params()
+    # On the database the router picked for the page, as evaluating it would
+    with connections[page.db].cursor() as cursor:
+        cursor.execute(
+            f"SELECT coalesce(json_agg(page.json_row ORDER BY page.json_position), '[]')::text FROM ({sql}) page",
+            params,
+        )
+        return cursor.fetchone()[0]
+
+
+def json_lines(queryset):
+    """
+    Turn a values() queryset into a flat values_list of one JSON object text per
+    row, encoded like DjangoJSONEncoder would encode the row dict.
+    """
+    pairs = []
+    for name in list(queryset.query.values_select) + list(queryset.query.annotation_select):
+        if name in queryset.query.annotation_select:
+            internal_type = queryset.query.annotation_select[name].output_field.get_internal_type()
+        else:
+            internal_type = queryset.model._meta.get_field(name).get_internal_type()
+        if internal_type == 'DateTimeField':
+            expression = UTCTimestamp(F(name), fraction='MS')
+        elif internal_type == 'DecimalField':
+            # DjangoJSONEncoder writes Decimals as strings
+            expression = Cast(F(name), TextField())
+        else:
+            expression = F(name)
+        pairs.append((name, expression))
+    # Cast to text so the driver hands over the JSON instead of decoding it.
+    return queryset.annotate(json_line=Cast(JSONBuildObject(pairs), TextField())).values_list('json_line', flat=True)
+
+
+def render_around(data, array_text):
+    """
+    Return a JSON response rendering `data` with PLACEHOLDER replaced by the
+    JSON array text produced by the database.
+    """
+    head, tail = JSONRenderer().render(data).split(JSONRenderer().render(PLACEHOLDER))
+    return HttpResponse(head + array_text.encode() + tail, content_type='application/json')
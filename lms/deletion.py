@@ -0,0 +1,116 @@
+"""
+Deleting users and books with long loan histories.
+
+Model.delete() leaves the loans to the cascade and the statistics to
+stats.forget_loans() in one transaction, which holds its locks for as long as
+the whole history takes. Here the loans go first, LMS_DELETE_CHUNK_SIZE at a
+time, each chunk in its own short transaction and covering a run of books (or,
+for a book, of users) so successive chunks touch different summary rows:
+
+- the chunk's rows are locked, so a concurrent return cannot slip in;
+- stats.forget_loans() takes them out of the counts with a fixed number of
+  queries, and (for a user) circulation.release_copies() puts their open
+  copies back on the shelf;
+- one DELETE removes them.
+
+Archived loans (lms.archive) go the same way, after the current ones.
+
+The last loans, fewer than a chunk, go in one transaction with the user or
+book itself, along with any loan added meanwhile. Should the job stop halfway,
+every committed chunk is fully accounted for: the user or book is simply still
+there with fewer loans, and deleting it again finishes the job. A user is
+deactivated first, so their token stops working straight away.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from . import circulation, stats
+from .authentication import token_cache
+from .models import ArchivedLoan, BorrowedBooks, CustomUser
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _chunk_size(chunk_size):
+    return chunk_size or getattr(settings, 'LMS_DELETE_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def _forget(loans, release_copies):
+    if release_copies:
+        circulation.release_copies(loans)
+    stats.forget_loans(loans)
+    return loans.delete()[0]
+
+
+def _delete_loans(loans, chunk_size, release_copies, group_by):
+    """
+    Delete a queryset of loans in chunks of about `chunk_size`, one transaction
+    each, until fewer than `chunk_size` are left. Returns the number deleted.
+
+    Chunks are ranges of `group_by` (the other side of the loans: books for a
+    user, users for a book), so each chunk changes the summary rows of
+    different books or users, and each statement filters on a range, served by
+    the (userID, bookID) and (bookID, userID) indexes, rather than a list of
+    thousands of IDs. A chunk ends with the book (or user) of its
+    `chunk_size`-th loan, so it can run over by that book's loans.
+    """
+    deleted = 0
+    remaining = loans
+    while True:
+        last = remaining.order_by(group_by).values_list(group_by, flat=True)[chunk_size - 1:chunk_size].first()
+        if last is None:
+            return deleted
+        with transaction.atomic():
+            chunk = remaining.filter(**{f'{group_by}__lte': last})
+            # Lock the chunk so no return or delete changes it under the counts
+            if list(chunk.select_for_update().values_list('id', flat=True)):
+                deleted += _forget(chunk, release_copies)
+        # Start the next scan past the deleted rows' (dead) index entries
+        remaining = loans.filter(**{f'{group_by}__gt': last})
+
+
+def _delete_owner(owner, histories):
+    """
+    Delete the last loans (those short of a chunk, and any added meanwhile) and
+    the user or book itself in one transaction.
+    """
+    deleted = 0
+    with transaction.atomic():
+        for loans, release_copies in histories:
+            if list(loans.select_for_update().values_list('id', flat=True)):
+                deleted += _forget(loans, release_copies)
+        owner.delete()
+    return deleted
+
+
+def _delete(owner, histories, chunk_size, group_by):
+    chunk_size = _chunk_size(chunk_size)
+    deleted = sum(_delete_loans(loans, chunk_size, release_copies, group_by) for loans, release_copies in histories)
+    return deleted + _delete_owner(owner, histories)
+
+
+def delete_user(user, chunk_size=None):
+    """
+    Deactivate a user, delete their loans (archived ones too) in chunks, then
+    the user. Returns the number of loans deleted.
+    """
+    CustomUser.objects.filter(pk=user.pk).update(is_active=False)
+    token_cache.invalidate_user(user.pk)
+    histories = [
+        (BorrowedBooks.objects.filter(userID=user.pk), True),
+        # Archived loans are all returned: no copies to put back
+        (ArchivedLoan.objects.filter(userID=user.pk), False),
+    ]
+    return _delete(user, histories, chunk_size, group_by='bookID')
+
+
+def delete_book(book, chunk_size=None):
+    """
+    Delete a book's loans (archived ones too) in chunks, then the book. Returns
+    the number of loans deleted.
+    """
+    histories = [
+        (BorrowedBooks.objects.filter(bookID=book.pk), False),
+        (ArchivedLoan.objects.filter(bookID=book.pk), False),
+    ]
+    return _delete(book, histories, chunk_size, group_by='userID')
@@ -0,0 +1,165 @@
+"""
+Streaming exports of the catalog, users and loans as NDJSON or CSV.
+
+Rows are read with QuerySet.values().iterator(chunk_size=...), so memory use stays
+flat however large the table is (PostgreSQL uses a server-side cursor), and they
+are encoded into batches of lines as they arrive.
+
+The loans export covers both tables: current loans by id, then the loans
+lms.archive moved to ArchivedLoan, by id, with "archived" telling them apart.
+"""
+import csv
+import datetime
+from itertools import chain
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import BooleanField, F, Value
+
+from . import dbjson
+from .models import ArchivedLoan, Book, BorrowedBooks, CustomUser
+
+DEFAULT_CHUNK_SIZE = 2000
+
+# Lines are joined into one chunk before being handed to the response so the
+# WSGI server is not asked to write millions of tiny strings.
+LINES_PER_CHUNK = 500
+
+FORMATS = ('ndjson', 'csv')
+
+
+def _books():
+    return [Book.objects.order_by('bookID').values(
+        'bookID', 'title', 'isbn', 'published_date', 'genre', 'copies', 'available_copies', 'modified_at',
+        number_of_pages=F('details__number_of_pages'),
+        publisher=F('details__publisher'),
+        language=F('details__language'),
+    )]
+
+
+def _users():
+    # Never export password hashes
+    return [CustomUser.objects.order_by('userID').values(
+        'userID', 'name', 'email', 'membership_date', 'is_active', 'is_staff', 'modified_at',
+    )]
+
+
+def _loans():
+    return [
+        model.objects.order_by('id').values(
+            'id', 'userID', 'bookID', 'borrow_date', 'due_date', 'return_date', 'fine',
+            archived=Value(archived, output_field=BooleanField()),
+        )
+        for model, archived in ((BorrowedBooks, False), (ArchivedLoan, True))
+    ]
+
+
+# Each returns the values() querysets, with the same columns, exported one after another
+
+
+RESOURCES = {
+    'books': _books,
+    'users': _users,
+    'loans': _loans,
+}
+
+
+def export_rows(resource, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Return (field_names, row_iterator) for an exportable resource.
+    """
+    querysets = RESOURCES[resource]()
+    fields = list(querysets[0].query.values_select) + list(querysets[0].query.annotation_select)
+    return fields, chain.from_iterable(queryset.iterator(chunk_size=chunk_size) for queryset in querysets)
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Return True when an Accept-Encoding header value allows gzip: listed (or
+    covered by "*") with a non-zero q-value, so "gzip;q=0" refuses it.
+    """
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def _batched(lines):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= LINES_PER_CHUNK:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+def _ndjson_lines(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + "\n"
+
+
+class _Echo:
+    """
+    File-like object whose write() returns the line instead of storing it.
+    """
+    def write(self, value):
+        return value
+
+
+def _csv_value(value, encoder=DjangoJSONEncoder()):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return encoder.default(value)
+    return value
+
+
+def _csv_lines(fields, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([_csv_value(row[field]) for field in fields])
+
+
+class ExportStream:
+    """
+    Iterable of text chunks exporting `resource` in 'ndjson' or 'csv' format.
+
+    `rows` counts the rows written so far.
+    """
+    def __init__(self, resource, file_format, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.resource = resource
+        self.file_format = file_format
+        self.chunk_size = chunk_size
+        self.rows = 0
+
+    def _counted(self, rows):
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    def __iter__(self):
+        querysets = RESOURCES[self.resource]()
+        if self.file_format == 'ndjson' and all(dbjson.enabled(queryset) for queryset in querysets):
+            # PostgreSQL encodes each row; Python only joins the lines.
+            lines = chain.from_iterable(
+                dbjson.json_lines(queryset).iterator(chunk_size=self.chunk_size) for queryset in querysets
+            )
+            return _batched(line + "\n" for line in self._counted(lines))
+
+        fields, rows = export_rows(self.resource, chunk_size=self.chunk_size)
+        rows = self._counted(rows)
+        lines = _csv_lines(fields, rows) if self.file_format == 'csv' else _ndjson_lines(rows)
+        return _batched(lines)
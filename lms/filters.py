@@ -0,0 +1,108 @@
+"""
+Query-string filtering and ordering for book lists.
+
+Every accepted combination includes a filter with an index declared on Book
+or BookDetails (see their Meta.indexes) that finds its books already in the
+requested order, so no request scans or sorts the whole table. A combination
+without one, e.g. language with ordering=title, is rejected with a 400 naming
+the orderings that are supported; add the index before allowing one.
+"""
+import django_filters
+from django import forms
+
+from .models import Book, BookDetails
+
+# Values accepted by ?ordering=. Ties are broken on bookID in the same
+# direction, which keeps pages stable and lets the composite indexes
+# (<column>, bookID) return rows already sorted.
+ORDERING_FIELDS = ('bookID', 'title', 'published_date')
+ORDERING_CHOICES = [(value, value) for field in ORDERING_FIELDS for value in (field, f'-{field}')]
+DEFAULT_ORDERING = '-bookID'
+
+# For each ordering field, the filters with an index that returns their matches
+# in that order: genre (genre, <field>, bookID), available=true|false (partial
+# indexes), language/publisher ((<column>, bookID) on BookDetails) and the
+# published_date range (published_date, bookID). A request without filters
+# can use any ordering.
+INDEXED_ORDERINGS = {
+    'bookID': {'genre', 'available', 'language', 'publisher'},
+    'title': {'genre', 'available'},
+    'published_date': {'genre', 'available', 'published_date'},
+}
+
+DETAILS_FILTERS = ('language', 'publisher')
+
+
+def get_ordering(value):
+    """
+    Return the order_by() arguments for an ?ordering= value.
+    """
+    descending = value.startswith('-')
+    field = value.lstrip('-')
+    if field == 'bookID':
+        return (value,)
+    return (value, '-bookID' if descending else 'bookID')
+
+
+class BookFilterForm(forms.Form):
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.has_error('ordering'):
+            return cleaned_data
+        used = {
+            name for name, value in cleaned_data.items()
+            if name != 'ordering' and value not in (None, '') and not (isinstance(value, slice) and value.start is None and value.stop is None)
+        }
+        ordering = cleaned_data.get('ordering') or DEFAULT_ORDERING
+        field = ordering.lstrip('-')
+        if used and not used & INDEXED_ORDERINGS[field]:
+            supported = [name for name in ORDERING_FIELDS if used & INDEXED_ORDERINGS[name]]
+            raise forms.ValidationError({'ordering': (
+                f"ordering={ordering} cannot be combined with {', '.join(sorted(used))}: no index returns those books "
+                f"in that order. Order by {' or '.join(supported)} instead, or add a genre or available filter."
+            )})
+        return cleaned_data
+
+
+class BookFilter(django_filters.FilterSet):
+    """
+    GET /api/books/list/?genre=Fiction&published_date_after=2000-01-01&published_date_before=2009-12-31&ordering=published_date
+    GET /api/books/list/?language=English&publisher=Penguin%20Books&available=true&ordering=-bookID
+    """
+    genre = django_filters.CharFilter(field_name='genre')
+    published_date = django_filters.DateFromToRangeFilter(field_name='published_date')
+    language = django_filters.CharFilter(method='filter_details')
+    publisher = django_filters.CharFilter(method='filter_details')
+    available = django_filters.BooleanFilter(method='filter_available', help_text="Only books with a copy on the shelf (true) or none (false).")
+    ordering = django_filters.ChoiceFilter(choices=ORDERING_CHOICES, method='filter_ordering')
+
+    class Meta:
+        model = Book
+        fields = []
+        form = BookFilterForm
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        details = {name: self.form.cleaned_data[name] for name in DETAILS_FILTERS if self.form.cleaned_data.get(name)}
+        if details:
+            # One `bookID IN (...)` over the (<column>, bookID) index rather than
+            # a join: SQLite then walks the IDs in order instead of sorting
+            # (PostgreSQL merge-joins either way).
+            queryset = queryset.filter(bookID__in=BookDetails.objects.filter(**details).values('bookID'))
+        return queryset
+
+    def filter_details(self, queryset, name, value):
+        # Applied together in filter_queryset
+        return queryset
+
+    def filter_available(self, queryset, name, value):
+        return queryset.filter(available_copies__gt=0) if value else queryset.filter(available_copies=0)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*get_ordering(value))
+
+    def error_messages(self):
+        """
+        Return the validation errors as {field: [message, ...]}.
+        """
+        return {field: list(messages) for field, messages in self.errors.items()}
@@ -0,0 +1,174 @@
+"""
+Idempotency keys for write endpoints.
+
+A client that may retry a POST or PUT (flaky mobile networks) sends an
+`Idempotency-Key` header, e.g. a UUID, and reuses it for every retry of the same
+request. The @idempotent view decorator then runs the view once per user and key:
+
+- the first request claims the key with an INSERT, so of two concurrent
+  duplicates only one can win; the other gets 409 Conflict and should retry;
+- the response (anything but a 5xx) is stored, compressed, with the key;
+- a retry is answered from the store, with an `Idempotent-Replayed: true`
+  header, without running the view: no second loan, no second password hash;
+- reusing a key for a different request (method, path or body) is a 422.
+
+Keys are kept for LMS_IDEMPOTENCY_TTL seconds; `python manage.py
+purge_idempotency_keys` deletes the expired ones. A key whose first request
+died without storing a response (a 5xx, a crashed worker) is released so the
+request can be retried; a crashed worker's claim lapses once its locked_until
+has passed. That is LMS_IDEMPOTENCY_LOCK_SECONDS after the claim, or
+LMS_IDEMPOTENCY_BULK_LOCK_SECONDS for the bulk endpoints (@idempotent(bulk=True)),
+which may run for minutes. A request still running when its claim lapses can
+be run a second time by a retry, so keep both above the longest a worker may
+spend on such a request (e.g. gunicorn's --timeout).
+
+Requests without the header are not affected and cost no extra queries. With it,
+the body is read into memory to fingerprint it, so a keyed request larger than
+DATA_UPLOAD_MAX_MEMORY_SIZE is refused with 413; send big bulk uploads without
+a key, or split them.
+"""
+import datetime
+import functools
+import hashlib
+import json
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def _ttl():
+    return datetime.timedelta(seconds=getattr(settings, 'LMS_IDEMPOTENCY_TTL', 24 * 60 * 60))
+
+
+def _lock_timeout(bulk=False):
+    if bulk:
+        return datetime.timedelta(seconds=getattr(settings, 'LMS_IDEMPOTENCY_BULK_LOCK_SECONDS', 30 * 60))
+    return datetime.timedelta(seconds=getattr(settings, 'LMS_IDEMPOTENCY_LOCK_SECONDS', 60))
+
+
+def fingerprint(request):
+    """
+    SHA-256 of the request's method, path (with query string) and body.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.get_full_path()}\n".encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _claim(user, key, request_fingerprint, lock_timeout):
+    """
+    Claim `key` for a new request, for `lock_timeout`. Returns (record, None)
+    when the caller should run the view, or (None, response) when the request
+    is answered already.
+    """
+    for _ in range(2):
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=request_fingerprint,
+                    created_at=now, locked_until=now + lock_timeout, expires_at=now + _ttl(),
+                )
+            return record, None
+        except IntegrityError:
+            pass
+
+        existing = IdempotencyKey.objects.filter(user=user, key=key).first()
+        if existing is None:
+            # Released in the meantime
+            continue
+        abandoned = existing.status_code is None and existing.locked_until <= now
+        if existing.expires_at <= now or abandoned:
+            # Only one of several retries can remove the old claim and take the key
+            IdempotencyKey.objects.filter(pk=existing.pk, created_at=existing.created_at).delete()
+            continue
+        if existing.fingerprint != request_fingerprint:
+            return None, Response({"error": f"This {HEADER} was already used for a different request."}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        if existing.status_code is None:
+            break
+        response = Response(json.loads(zlib.decompress(existing.response)), status=existing.status_code)
+        response[REPLAYED_HEADER] = 'true'
+        return None, response
+
+    response = Response({"error": f"A request with this {HEADER} is in progress; retry later."}, status=status.HTTP_409_CONFLICT)
+    response['Retry-After'] = '1'
+    return None, response
+
+
+def _store(record, response):
+    if response.status_code >= 500 or not isinstance(response, Response):
+        # Nothing to replay: let the client retry the request for real
+        record.delete()
+        return
+    body = zlib.compress(JSONRenderer().render(response.data) or b'null', 1)
+    IdempotencyKey.objects.filter(pk=record.pk).update(status_code=response.status_code, response=body)
+
+
+def idempotent(view=None, *, bulk=False):
+    """
+    Make a function view honour the Idempotency-Key header; see the module docstring.
+
+    Use @idempotent(bulk=True) on views that may run for minutes, so their
+    claim is held for LMS_IDEMPOTENCY_BULK_LOCK_SECONDS. Goes below @api_view
+    and @permission_classes, so it runs for authenticated requests only.
+    """
+    if view is None:
+        return functools.partial(idempotent, bulk=bulk)
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            request_fingerprint = fingerprint(request)
+        except RequestDataTooBig:
+            return Response(
+                {"error": f"Requests with an {HEADER} are limited to {settings.DATA_UPLOAD_MAX_MEMORY_SIZE} bytes; send larger uploads without one or split them."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+        record, response = _claim(request.user, key, request_fingerprint, _lock_timeout(bulk))
+        if response is not None:
+            return response
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            record.delete()
+            raise
+        _store(record, response)
+        return response
+    return wrapper
+
+
+def purge(chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Delete expired keys, `chunk_size` per statement so no long transaction or
+    lock is held. Returns the number deleted.
+    """
+    now = timezone.now()
+    expired = IdempotencyKey.objects.filter(expires_at__lte=now)
+    deleted = 0
+    while True:
+        pks = list(expired.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=pks).delete()[0]
+        if progress:
+            progress(deleted)
@@ -0,0 +1,100 @@
+"""
+A small asyncio HTTP/1.1 load generator for benchmarking a running server.
+
+It only needs the standard library: each request opens a connection, sends a
+GET with `Connection: close` and reads the response to EOF, so a fixed number
+of workers keeps exactly that many connections in flight.
+"""
+import asyncio
+import math
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    """
+    Reduce per-request latencies (seconds) to throughput and latency percentiles (ms).
+    """
+    latencies = sorted(latencies)
+    completed = len(latencies)
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "requests": completed,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(completed / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+    }
+
+
+async def _get(host, port, request_bytes):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(request_bytes)
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+    return int(status_line.split()[1])
+
+
+async def _run(url, headers, concurrency, total, timeout):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    lines = [f"GET {target} HTTP/1.1", f"Host: {parts.netloc}", "Connection: close"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    request_bytes = ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal errors, remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(_get(host, port, request_bytes), timeout)
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                errors += 1
+                continue
+            if status >= 400:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def run_load(url, headers=None, concurrency=500, total=5000, timeout=30.0):
+    """
+    GET `url` `total` times over `concurrency` simultaneous connections.
+
+    Returns the summarize() dict; responses with a 4xx/5xx status, timeouts and
+    connection failures are counted as errors and left out of the latencies.
+    """
+    return asyncio.run(_run(url, headers or {}, concurrency, total, timeout))
@@ -0,0 +1,45 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move returned loans older than LMS_ARCHIVE_AFTER_DAYS from BorrowedBooks into the archive table, "
+        "in primary-key chunks with one short transaction per chunk. An interrupted run resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=datetime.date.fromisoformat, help="Archive as of this date (YYYY-MM-DD) instead of today.")
+        parser.add_argument('--after-days', type=int, default=None, help="Archive loans returned more than this many days ago (default: LMS_ARCHIVE_AFTER_DAYS).")
+        parser.add_argument('--chunk-size', type=int, default=archive.DEFAULT_CHUNK_SIZE, help="Loans moved per transaction.")
+        parser.add_argument('--restart', action='store_true', help="Start this cutoff's run over instead of resuming it.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        if options['after_days'] is not None and options['after_days'] < 0:
+            raise CommandError("--after-days cannot be negative.")
+        started = time.monotonic()
+
+        def progress(result):
+            if options['verbosity'] > 1:
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"{result['loans']} loans, {result['loans'] / elapsed if elapsed else 0:.0f} rows/s")
+
+        result = archive.archive(options['date'], options['after_days'], options['chunk_size'], restart=options['restart'], progress=progress)
+        if result is None:
+            before = archive.cutoff(options['date'], options['after_days'])
+            self.stdout.write(f"Loans returned before {before} were already archived; pass --restart to run again.")
+            return
+
+        elapsed = time.monotonic() - started
+        rate = result['loans'] / elapsed if elapsed else 0
+        resumed = f" (resumed after loan {result['resumed_after']})" if result['resumed_after'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {result['loans']} loans returned before {result['cutoff']}{resumed} "
+            f"in {elapsed:.1f}s ({rate:.0f} rows/s)."
+        ))
@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms import loadgen
+
+# (label, sync path, async path); {book}, {user} and {loan} are filled from the options.
+ENDPOINTS = [
+    ("list_books", "books/list/", "async/books/list/"),
+    ("get_book_by_id", "books/{book}/", "async/books/{book}/"),
+    ("list_users", "users/list/", "async/users/list/"),
+    ("get_user_by_id", "users/{user}/", "async/users/{user}/"),
+    ("get_borrowed_book_by_id", "borrowed/{loan}/", "async/borrowed/{loan}/"),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/sec and latency percentiles of the sync and async read endpoints "
+        "on a running server, e.g. one started with `uvicorn config.asgi:application`. "
+        "Only sends GET requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000/api/', help="URL the lms API is mounted at.")
+        parser.add_argument('--token', required=True, help="API token to authenticate with.")
+        parser.add_argument('--concurrency', type=int, default=500, help="Connections kept in flight.")
+        parser.add_argument('--requests', type=int, default=5000, help="Requests per endpoint and variant.")
+        parser.add_argument('--timeout', type=float, default=30.0, help="Seconds before a request counts as an error.")
+        parser.add_argument('--book-id', type=int, default=1)
+        parser.add_argument('--user-id', type=int, default=1)
+        parser.add_argument('--loan-id', type=int, default=1)
+        parser.add_argument('--endpoint', action='append', choices=[label for label, _, _ in ENDPOINTS], help="Only benchmark these endpoints (repeatable).")
+        parser.add_argument('--output', help="Also write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['requests'] < 1:
+            raise CommandError("--concurrency and --requests must be at least 1.")
+
+        base_url = options['base_url'].rstrip('/') + '/'
+        headers = {"Authorization": f"Token {options['token']}", "Accept": "application/json"}
+        ids = {"book": options['book_id'], "user": options['user_id'], "loan": options['loan_id']}
+        selected = options['endpoint']
+
+        results = []
+        self.stdout.write(f"{'endpoint':<26}{'variant':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for label, sync_path, async_path in ENDPOINTS:
+            if selected and label not in selected:
+                continue
+            for variant, path in (("sync", sync_path), ("async", async_path)):
+                url = base_url + path.format(**ids)
+                result = loadgen.run_load(
+                    url, headers, concurrency=options['concurrency'], total=options['requests'], timeout=options['timeout'],
+                )
+                if not result["requests"]:
+                    raise CommandError(f"Every request to {url} failed; is the server running and the token valid?")
+                results.append({"endpoint": label, "variant": variant, "url": url, **result})
+                self.stdout.write(
+                    f"{label:<26}{variant:<8}{result['requests_per_second']:>10}{result['p50_ms']:>10}"
+                    f"{result['p99_ms']:>10}{result['errors']:>8}"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump({"concurrency": options['concurrency'], "results": results}, handle, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
@@ -0,0 +1,89 @@
+import datetime
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from lms import deletion, stats
+from lms.models import Book, BorrowedBooks, CustomUser
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Time deleting a user (or a book) with a long loan history through lms.deletion. Creates the "
+        "user or book, its loans spread over --spread books (or users) of its own, counts them in the "
+        "statistics, deletes it and removes the helper rows again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=['user', 'book'], default='user', help="What to delete.")
+        parser.add_argument('--loans', type=int, default=100_000, help="Loans of the deleted user or book.")
+        parser.add_argument('--spread', type=int, default=1000, help="Books (or users) the loans are spread over.")
+        parser.add_argument('--chunk-size', type=int, default=None, help="Loans deleted per transaction (default: LMS_DELETE_CHUNK_SIZE).")
+        parser.add_argument('--seed', type=int, default=1, help="Seed for the loan dates.")
+
+    def handle(self, *args, **options):
+        if options['loans'] < 0 or options['spread'] < 1 or (options['chunk_size'] is not None and options['chunk_size'] < 1):
+            raise CommandError("--loans must be positive, --spread and --chunk-size at least 1.")
+
+        suffix = uuid.uuid4().hex[:8]
+        started = time.monotonic()
+        owner, others = self._create(options['target'], options['loans'], options['spread'], suffix, random.Random(options['seed']))
+        self.stdout.write(f"Created a {options['target']} with {options['loans']} loans in {time.monotonic() - started:.1f}s.")
+
+        delete = deletion.delete_user if options['target'] == 'user' else deletion.delete_book
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            deleted = delete(owner, chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - started
+        others.delete()
+
+        rate = deleted / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted the {options['target']} and {deleted} loans in {elapsed:.2f}s "
+            f"({rate:,.0f} loans/s, {len(queries)} queries)."
+        ))
+
+    def _create(self, target, loans, spread, suffix, rng):
+        """
+        Create the user or book to delete and its counterparts; return (owner, counterpart queryset).
+        """
+        if target == 'user':
+            owner = CustomUser.objects.create(name="Benchmark borrower", email=f"delete-{suffix}@example.com")
+            Book.objects.bulk_create(
+                Book(title=f"Benchmark book {i}", isbn=f"D{suffix[:4]}{i}", published_date="2000-01-01", genre="Benchmark")
+                for i in range(spread)
+            )
+            others = Book.objects.filter(isbn__startswith=f"D{suffix[:4]}")
+            owner_field, other_field = 'userID_id', 'bookID_id'
+        else:
+            owner = Book.objects.create(title="Benchmark book", isbn=f"D{suffix[:8]}", published_date="2000-01-01", genre="Benchmark")
+            CustomUser.objects.bulk_create(
+                CustomUser(name=f"Benchmark borrower {i}", email=f"delete-{suffix}-{i}@example.com")
+                for i in range(spread)
+            )
+            others = CustomUser.objects.filter(email__startswith=f"delete-{suffix}-")
+            owner_field, other_field = 'bookID_id', 'userID_id'
+
+        other_ids = list(others.values_list('pk', flat=True))
+        start = datetime.date(2000, 1, 1)
+        for first in range(0, loans, BATCH_SIZE):
+            batch = []
+            for _ in range(min(BATCH_SIZE, loans - first)):
+                borrow_date = start + datetime.timedelta(days=rng.randrange(9000))
+                batch.append(BorrowedBooks(**{
+                    owner_field: owner.pk,
+                    other_field: rng.choice(other_ids),
+                    'borrow_date': borrow_date,
+                    'due_date': borrow_date + datetime.timedelta(days=14),
+                    'return_date': borrow_date + datetime.timedelta(days=rng.randrange(1, 30)),
+                }))
+            BorrowedBooks.objects.bulk_create(batch)
+        # Written around lms.circulation, so count them for the delete to take out
+        stats.record_loans(BorrowedBooks.objects.filter(**{owner_field: owner.pk}))
+        return owner, others
@@ -0,0 +1,82 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.test import APIClient
+
+from lms import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every lms endpoint in-process with the Django test client, reporting requests/sec, "
+        "p50/p95/p99 latency and SQL queries per request, and fail when an endpoint exceeds its "
+        "query or latency budget (lms.benchmarks.ENDPOINTS). Writes are rolled back. Run seed_data "
+        "first for realistic volumes. With --live, the GET endpoints are benchmarked on a running "
+        "server instead, without query counts or budgets."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help="Measured requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=2, help="Unmeasured requests per endpoint (in-process only).")
+        parser.add_argument('--endpoint', action='append', help="Only benchmark these URL names (repeatable; 'root' for the redirect).")
+        parser.add_argument('--live', metavar='URL', help="Benchmark the server at this URL, e.g. http://127.0.0.1:8000, instead.")
+        parser.add_argument('--token', help="API token of a staff user for --live.")
+        parser.add_argument('--concurrency', type=int, default=1, help="Connections kept in flight with --live.")
+        parser.add_argument('--output', help="Also write the results to this JSON file.")
+        parser.add_argument('--no-budgets', action='store_true', help="Report budget violations without failing.")
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['warmup'] < 0 or options['concurrency'] < 1:
+            raise CommandError("--requests and --concurrency must be at least 1 and --warmup cannot be negative.")
+        if options['live'] and not options['token']:
+            raise CommandError("--live needs --token.")
+
+        endpoints = benchmarks.ENDPOINTS
+        if options['endpoint']:
+            known = {endpoint.url_name or 'root' for endpoint in endpoints}
+            unknown = set(options['endpoint']) - known
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}.")
+            endpoints = [endpoint for endpoint in endpoints if (endpoint.url_name or 'root') in options['endpoint']]
+
+        self.stdout.write(f"{'endpoint':<32}{'method':<8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'errors':>8}")
+
+        def progress(result):
+            queries = '-' if result['queries'] is None else result['queries']
+            self.stdout.write(
+                f"{result['endpoint']:<32}{result['method']:<8}{result['requests_per_second']:>9}{result['p50_ms']!s:>9}"
+                f"{result['p95_ms']!s:>9}{result['p99_ms']!s:>9}{queries:>9}{result['errors']:>8}"
+            )
+
+        if options['live']:
+            try:
+                fixture = benchmarks.Fixture.existing(options['token'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            results = benchmarks.run_live(
+                options['live'], fixture, requests=options['requests'], concurrency=options['concurrency'],
+                endpoints=endpoints, progress=progress,
+            )
+        else:
+            with transaction.atomic():
+                fixture = benchmarks.Fixture.create()
+                results = benchmarks.run_in_process(
+                    APIClient(), fixture, requests=options['requests'], warmup=options['warmup'],
+                    endpoints=endpoints, progress=progress,
+                )
+                transaction.set_rollback(True)
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump({"mode": "live" if options['live'] else "in-process", "results": results}, handle, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        failures = benchmarks.over_budget(results)
+        if not failures:
+            checked = "answered without errors" if options['live'] else "within budget"
+            self.stdout.write(self.style.SUCCESS(f"All {len(results)} endpoints {checked}."))
+        elif options['no_budgets']:
+            self.stdout.write(self.style.WARNING("\n".join(failures)))
+        else:
+            raise CommandError("Over budget:\n" + "\n".join(failures))
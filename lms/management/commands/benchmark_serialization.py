@@ -0,0 +1,77 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from lms.models import Book, CustomUser
+from lms.serializers import BookSerializer, CustomUserSerializer
+from lms.views import BOOK_ROWS, USER_ROWS
+
+RESOURCES = {
+    'books': (Book, '-bookID', BookSerializer, BOOK_ROWS),
+    'users': (CustomUser, '-userID', CustomUserSerializer, USER_ROWS),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the ModelSerializer and values() list paths for one page of books and users at "
+        "several page sizes, checking that both render identical JSON. Tops the tables up with "
+        "generated rows inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help="Page sizes to measure.")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs per path and size; the best is reported.")
+
+    def handle(self, *args, **options):
+        sizes, repeat = options['sizes'], options['repeat']
+        if min(sizes) < 1 or repeat < 1:
+            raise CommandError("--sizes and --repeat must be at least 1.")
+
+        renderer = JSONRenderer()
+        self.stdout.write(f"{'resource':<10}{'rows':>6}{'model ms':>12}{'values ms':>12}{'speedup':>10}")
+        with transaction.atomic():
+            self._top_up(max(sizes))
+            for resource, (model, ordering, serializer_class, rows) in RESOURCES.items():
+                queryset = model.objects.order_by(ordering)
+                for size in sizes:
+                    def model_path():
+                        return renderer.render(serializer_class(queryset[:size], many=True).data)
+
+                    def values_path():
+                        return renderer.render(rows.serialize(rows.values(queryset)[:size]))
+
+                    if model_path() != values_path():
+                        raise CommandError(f"The values() path rendered different JSON for {size} {resource}.")
+                    model_ms = self._best_of(model_path, repeat)
+                    values_ms = self._best_of(values_path, repeat)
+                    self.stdout.write(
+                        f"{resource:<10}{size:>6}{model_ms:>12.2f}{values_ms:>12.2f}{model_ms / values_ms:>9.1f}x"
+                    )
+            transaction.set_rollback(True)
+
+    def _best_of(self, path, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            path()
+            timings.append(time.perf_counter() - started)
+        return min(timings) * 1000
+
+    def _top_up(self, count):
+        suffix = uuid.uuid4().hex[:8]
+        missing_books = count - Book.objects.count()
+        if missing_books > 0:
+            Book.objects.bulk_create(
+                Book(title=f"Benchmark book {i}", isbn=f"{suffix}{i}"[:13], published_date="2000-01-01", genre="benchmark")
+                for i in range(missing_books)
+            )
+        missing_users = count - CustomUser.objects.count()
+        if missing_users > 0:
+            CustomUser.objects.bulk_create(
+                CustomUser(name=f"Benchmark user {i}", email=f"benchmark-{suffix}-{i}@example.com")
+                for i in range(missing_users)
+            )
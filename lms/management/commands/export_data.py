@@ -0,0 +1,48 @@
+import gzip
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms import export
+
+
+class Command(BaseCommand):
+    help = "Stream a full export of books (with details), users or loans as NDJSON or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('resource', choices=sorted(export.RESOURCES), help="What to export.")
+        parser.add_argument('--format', choices=export.FORMATS, default='ndjson', help="Output format.")
+        parser.add_argument('--output', default='-', help="File to write, or '-' for stdout.")
+        parser.add_argument('--gzip', action='store_true', help="Compress the output with gzip.")
+        parser.add_argument('--chunk-size', type=int, default=export.DEFAULT_CHUNK_SIZE, help="Rows fetched from the database per round trip.")
+
+    def handle(self, *args, **options):
+        path = options['output']
+        if path == '-':
+            stream = sys.stdout.buffer
+        else:
+            try:
+                stream = open(path, 'wb')
+            except OSError as e:
+                raise CommandError(f"Cannot open {path}: {e}")
+        output = gzip.GzipFile(fileobj=stream, mode='wb') if options['gzip'] else stream
+
+        exported = export.ExportStream(options['resource'], options['format'], chunk_size=options['chunk_size'])
+        started = time.monotonic()
+        try:
+            for chunk in exported:
+                output.write(chunk.encode())
+        finally:
+            if output is not stream:
+                output.close()
+            if path != '-':
+                stream.close()
+            else:
+                stream.flush()
+        elapsed = time.monotonic() - started
+
+        rate = exported.rows / elapsed if elapsed else 0
+        self.stderr.write(self.style.SUCCESS(
+            f"Exported {exported.rows} {options['resource']} in {elapsed:.1f}s ({rate:.0f} rows/s)."
+        ))
@@ -0,0 +1,53 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms import bulk
+
+
+class Command(BaseCommand):
+    help = "Bulk-import books from an NDJSON or CSV file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' to read from stdin.")
+        parser.add_argument('--format', choices=['ndjson', 'csv'], help="Input format. Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=bulk.DEFAULT_BATCH_SIZE, help="Rows validated and inserted per batch.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format']
+        if file_format is None:
+            file_format = 'csv' if path.endswith('.csv') else 'ndjson'
+        parse_rows = bulk.get_row_parser(file_format)
+
+        try:
+            batch_size = bulk.parse_batch_size(options['batch_size'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if path == '-':
+            stream = sys.stdin
+        else:
+            try:
+                stream = open(path, newline='', encoding='utf-8', errors='replace')
+            except OSError as e:
+                raise CommandError(f"Cannot open {path}: {e}")
+
+        started = time.monotonic()
+        try:
+            result = bulk.import_books(parse_rows(stream), batch_size=batch_size)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        elapsed = time.monotonic() - started
+
+        for error in result["errors"]:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+
+        rows = result["created"] + result["failed"]
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} books, {result['failed']} failed "
+            f"({rows} rows in {elapsed:.1f}s, {rate:.0f} rows/s)."
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms import idempotency
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key records, in primary-key chunks. Run it daily."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=idempotency.DEFAULT_CHUNK_SIZE, help="Keys deleted per statement.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+
+        def progress(done):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"deleted: {done}")
+
+        started = time.monotonic()
+        deleted = idempotency.purge(options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys in {time.monotonic() - started:.1f}s."))
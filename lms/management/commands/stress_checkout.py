@@ -0,0 +1,96 @@
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from lms import circulation
+from lms.models import Book, BorrowedBooks, CustomUser
+from lms.serializers import BorrowedBooksSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer the checkout path with concurrent borrowers against the configured database "
+        "and verify that no copy is lent twice. Creates and removes its own book and user."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--copies', type=int, default=5, help="Copies of the contested book.")
+        parser.add_argument('--workers', type=int, default=16, help="Concurrent borrowing threads.")
+        parser.add_argument('--attempts', type=int, default=10, help="Checkout attempts per thread.")
+
+    def handle(self, *args, **options):
+        copies, workers, attempts = options['copies'], options['workers'], options['attempts']
+        suffix = uuid.uuid4().hex[:8]
+        book = Book.objects.create(
+            title="Checkout stress test", isbn=suffix, published_date="2000-01-01", genre="stress",
+            copies=copies, available_copies=copies,
+        )
+        user = CustomUser.objects.create(name="Checkout stress test", email=f"stress-{suffix}@example.com")
+
+        outcomes = {"borrowed": 0, "rejected": 0, "retries": 0}
+        errors = []
+        lock = threading.Lock()
+        start = threading.Barrier(workers)
+
+        def borrower():
+            try:
+                start.wait()
+                for _ in range(attempts):
+                    outcome, retries = self._attempt(book.bookID, user.userID)
+                    with lock:
+                        outcomes[outcome] += 1
+                        outcomes["retries"] += retries
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=borrower) for _ in range(workers)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        book.refresh_from_db()
+        open_loans = BorrowedBooks.objects.filter(bookID=book, return_date__isnull=True).count()
+        BorrowedBooks.objects.filter(bookID=book).delete()
+        book.delete()
+        user.delete()
+
+        if errors:
+            raise CommandError(f"{len(errors)} borrower threads failed: {errors[0]!r}")
+        if outcomes["borrowed"] != copies or open_loans != copies or book.available_copies != 0:
+            raise CommandError(
+                f"Inventory violated: {outcomes['borrowed']} checkouts and {open_loans} open loans "
+                f"for {copies} copies, {book.available_copies} left on the shelf."
+            )
+
+        total = workers * attempts
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} checkout attempts from {workers} threads in {elapsed:.2f}s "
+            f"({total / elapsed:.0f}/s): {outcomes['borrowed']} borrowed, {outcomes['rejected']} rejected, "
+            f"{outcomes['retries']} lock retries. No copy was lent twice."
+        ))
+
+    def _attempt(self, book_id, user_id):
+        retries = 0
+        while True:
+            try:
+                serializer = BorrowedBooksSerializer(data={"userID": user_id, "bookID": book_id, "borrow_date": "2000-01-01"})
+                serializer.is_valid(raise_exception=True)
+                circulation.checkout(serializer)
+                return "borrowed", retries
+            except circulation.NoCopiesAvailable:
+                return "rejected", retries
+            except OperationalError as e:
+                # SQLite allows one writer at a time and reports contention as an
+                # error instead of waiting; the checkout rolled back, so retry it.
+                if connection.vendor != 'sqlite' or 'locked' not in str(e):
+                    raise
+                retries += 1
+                time.sleep(0.001)
@@ -0,0 +1,14 @@
+from django.db import migrations
+
+from lms.migrations import _search_index_0002 as search
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(search.create_search_index, search.drop_search_index),
+    ]
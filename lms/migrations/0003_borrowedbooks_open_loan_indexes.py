@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0002_book_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowedbooks',
+            index=models.Index(condition=models.Q(('return_date__isnull', True)), fields=['userID', 'borrow_date'], name='lms_loan_open_by_user'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowedbooks',
+            index=models.Index(condition=models.Q(('return_date__isnull', True)), fields=['bookID', 'borrow_date'], name='lms_loan_open_by_book'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:22
+
+from django.db import migrations, models
+
+from lms.migrations import _search_index_0002 as search
+
+
+def take_copies_on_loan(apps, schema_editor):
+    # Every existing book starts with one copy; it is off the shelf if it has an open loan
+    Book = apps.get_model('lms', 'Book')
+    BorrowedBooks = apps.get_model('lms', 'BorrowedBooks')
+    db = schema_editor.connection.alias
+    open_loans = BorrowedBooks.objects.using(db).filter(return_date__isnull=True)
+    Book.objects.using(db).filter(bookID__in=open_loans.values('bookID')).update(available_copies=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0003_borrowedbooks_open_loan_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='available_copies',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='copies',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.CheckConstraint(condition=models.Q(('available_copies__lte', models.F('copies'))), name='lms_book_available_lte_copies'),
+        ),
+        migrations.RunPython(take_copies_on_loan, migrations.RunPython.noop),
+        # SQLite rebuilt lms_book above, dropping its search triggers
+        migrations.RunPython(search.restore_search_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+from lms.migrations import _search_index_0002 as search
+
+
+def create_books_version(apps, schema_editor):
+    CatalogVersion = apps.get_model('lms', 'CatalogVersion')
+    CatalogVersion.objects.using(schema_editor.connection.alias).get_or_create(name='books')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0004_book_copies'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('modified_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='bookdetails',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(create_books_version, migrations.RunPython.noop),
+        # SQLite rebuilt lms_book and lms_bookdetails above, dropping their search triggers
+        migrations.RunPython(search.restore_search_triggers, migrations.RunPython.noop),
+    ]
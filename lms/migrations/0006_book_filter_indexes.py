@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0005_modified_at_and_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['genre', 'bookID'], name='lms_book_genre_id'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['genre', 'title', 'bookID'], name='lms_book_genre_title'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['genre', 'published_date', 'bookID'], name='lms_book_genre_published'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'bookID'], name='lms_book_title'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['published_date', 'bookID'], name='lms_book_published'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('available_copies__gt', 0)), fields=['bookID'], name='lms_book_available_id'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('available_copies__gt', 0)), fields=['title', 'bookID'], name='lms_book_available_title'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('available_copies__gt', 0)), fields=['published_date', 'bookID'], name='lms_book_available_published'),
+        ),
+        migrations.AddIndex(
+            model_name='bookdetails',
+            index=models.Index(fields=['language', 'bookID'], name='lms_details_language'),
+        ),
+        migrations.AddIndex(
+            model_name='bookdetails',
+            index=models.Index(fields=['publisher', 'bookID'], name='lms_details_publisher'),
+        ),
+    ]
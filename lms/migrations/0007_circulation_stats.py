@@ -0,0 +1,97 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def count_existing_loans(apps, schema_editor):
+    # One pass over the loans; later drift is repaired by `manage.py rebuild_circulation_stats`
+    BorrowedBooks = apps.get_model('lms', 'BorrowedBooks')
+    BookCirculation = apps.get_model('lms', 'BookCirculation')
+    GenreCirculation = apps.get_model('lms', 'GenreCirculation')
+    BorrowerCirculation = apps.get_model('lms', 'BorrowerCirculation')
+    CirculationTotals = apps.get_model('lms', 'CirculationTotals')
+    db = schema_editor.connection.alias
+    is_open = models.Q(return_date__isnull=True)
+
+    books, genres = [], {}
+    per_book = BorrowedBooks.objects.using(db).order_by().values('bookID', 'bookID__genre').annotate(
+        total=models.Count('id'),
+        open=models.Count('id', filter=is_open),
+        days=models.Sum(models.F('return_date') - models.F('borrow_date'), filter=~is_open),
+    )
+    for row in per_book:
+        books.append(BookCirculation(
+            book_id=row['bookID'], total_loans=row['total'], open_loans=row['open'],
+            returned_loans=row['total'] - row['open'], loan_days=row['days'].days if row['days'] else 0,
+        ))
+        genre = genres.setdefault(row['bookID__genre'], GenreCirculation(genre=row['bookID__genre']))
+        genre.total_loans += row['total']
+        genre.open_loans += row['open']
+    BookCirculation.objects.using(db).bulk_create(books, batch_size=1000)
+    GenreCirculation.objects.using(db).bulk_create(genres.values(), batch_size=1000)
+
+    per_borrower = BorrowedBooks.objects.using(db).filter(is_open).order_by().values('userID').annotate(open=models.Count('id'))
+    BorrowerCirculation.objects.using(db).bulk_create(
+        (BorrowerCirculation(user_id=row['userID'], open_loans=row['open']) for row in per_borrower), batch_size=1000
+    )
+
+    CirculationTotals.objects.using(db).create(
+        id=1,
+        total_loans=sum(book.total_loans for book in books),
+        open_loans=sum(book.open_loans for book in books),
+        returned_loans=sum(book.returned_loans for book in books),
+        loan_days=sum(book.loan_days for book in books),
+        active_borrowers=BorrowerCirculation.objects.using(db).count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0006_book_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BorrowerCirculation',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='circulation', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('open_loans', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CirculationTotals',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(default=1, primary_key=True, serialize=False)),
+                ('total_loans', models.PositiveBigIntegerField(default=0)),
+                ('open_loans', models.PositiveBigIntegerField(default=0)),
+                ('returned_loans', models.PositiveBigIntegerField(default=0)),
+                ('loan_days', models.BigIntegerField(default=0)),
+                ('active_borrowers', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GenreCirculation',
+            fields=[
+                ('genre', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('total_loans', models.PositiveIntegerField(default=0)),
+                ('open_loans', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BookCirculation',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='circulation', serialize=False, to='lms.book')),
+                ('total_loans', models.PositiveIntegerField(default=0)),
+                ('open_loans', models.PositiveIntegerField(default=0)),
+                ('returned_loans', models.PositiveIntegerField(default=0)),
+                ('loan_days', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-total_loans', 'book'], name='lms_book_circ_total')],
+            },
+        ),
+        migrations.RunPython(count_existing_loans, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:52
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_due_dates(apps, schema_editor):
+    # Existing loans were due LMS_LOAN_DAYS after borrowing; one set-based UPDATE
+    days = getattr(settings, 'LMS_LOAN_DAYS', 14)
+    table = schema_editor.quote_name(apps.get_model('lms', 'BorrowedBooks')._meta.db_table)
+    if schema_editor.connection.vendor == 'sqlite':
+        sql = f"UPDATE {table} SET due_date = date(borrow_date, '+' || %s || ' days')"
+    else:
+        sql = f"UPDATE {table} SET due_date = borrow_date + %s"
+    schema_editor.execute(sql, [days])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0007_circulation_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=50)),
+                ('run', models.CharField(max_length=50)),
+                ('last_pk', models.BigIntegerField(default=0)),
+                ('rows', models.PositiveBigIntegerField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='borrowedbooks',
+            name='due_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(set_due_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='borrowedbooks',
+            name='due_date',
+            field=models.DateField(),
+        ),
+        migrations.AddField(
+            model_name='borrowedbooks',
+            name='fine',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=8),
+        ),
+        migrations.AddIndex(
+            model_name='borrowedbooks',
+            index=models.Index(condition=models.Q(('return_date__isnull', True)), fields=['id'], name='lms_loan_open_by_id'),
+        ),
+        migrations.AddConstraint(
+            model_name='jobcheckpoint',
+            constraint=models.UniqueConstraint(fields=('job', 'run'), name='lms_job_checkpoint_run'),
+        ),
+    ]
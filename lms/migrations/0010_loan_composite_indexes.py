@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0009_idempotency_key'),
+    ]
+
+    operations = [
+        # Build the composite indexes before dropping the plain foreign key ones
+        migrations.AddIndex(
+            model_name='borrowedbooks',
+            index=models.Index(fields=['userID', 'bookID'], name='lms_loan_by_user_book'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowedbooks',
+            index=models.Index(fields=['bookID', 'userID'], name='lms_loan_by_book_user'),
+        ),
+        migrations.AlterField(
+            model_name='borrowedbooks',
+            name='bookID',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='borrowed_books', to='lms.book'),
+        ),
+        migrations.AlterField(
+            model_name='borrowedbooks',
+            name='userID',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='borrowed_books', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
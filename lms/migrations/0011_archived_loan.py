@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0010_loan_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedLoan',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('borrow_date', models.DateField()),
+                ('return_date', models.DateField()),
+                ('due_date', models.DateField()),
+                ('fine', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=8)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('bookID', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_loans', to='lms.book')),
+                ('userID', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_loans', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['userID', 'bookID'], name='lms_archive_by_user_book'), models.Index(fields=['bookID', 'userID'], name='lms_archive_by_book_user')],
+            },
+        ),
+    ]
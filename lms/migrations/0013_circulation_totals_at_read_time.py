@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0012_book_modified_at_index'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='CirculationTotals',
+        ),
+        migrations.DeleteModel(
+            name='GenreCirculation',
+        ),
+        migrations.AddIndex(
+            model_name='borrowercirculation',
+            index=models.Index(condition=models.Q(('open_loans__gt', 0)), fields=['user'], name='lms_borrower_circ_active'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0013_circulation_totals_at_read_time'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('available_copies', 0)), fields=['bookID'], name='lms_book_unavailable_id'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('available_copies', 0)), fields=['title', 'bookID'], name='lms_book_unavailable_title'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('available_copies', 0)), fields=['published_date', 'bookID'], name='lms_book_unavailable_published'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:33
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_shard_zero(apps, schema_editor):
+    """
+    Start the striped counters from the per-book and per-user rows, as stats.rebuild() does.
+    """
+    BookCirculation = apps.get_model('lms', 'BookCirculation')
+    BorrowerCirculation = apps.get_model('lms', 'BorrowerCirculation')
+    GenreCirculation = apps.get_model('lms', 'GenreCirculation')
+    CirculationTotals = apps.get_model('lms', 'CirculationTotals')
+
+    genres = BookCirculation.objects.filter(total_loans__gt=0).order_by().values('book__genre').annotate(
+        total=Sum('total_loans'), open=Sum('open_loans'),
+    )
+    GenreCirculation.objects.bulk_create(
+        GenreCirculation(genre=row['book__genre'], shard=0, total_loans=row['total'], open_loans=row['open']) for row in genres
+    )
+    sums = BookCirculation.objects.aggregate(
+        total=Sum('total_loans'), open=Sum('open_loans'), returned=Sum('returned_loans'), days=Sum('loan_days'),
+    )
+    CirculationTotals.objects.create(
+        shard=0,
+        total_loans=sums['total'] or 0,
+        open_loans=sums['open'] or 0,
+        returned_loans=sums['returned'] or 0,
+        loan_days=sums['days'] or 0,
+        active_borrowers=BorrowerCirculation.objects.filter(open_loans__gt=0).count(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0015_idempotency_key_locked_until'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CirculationTotals',
+            fields=[
+                ('shard', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('total_loans', models.BigIntegerField(default=0)),
+                ('open_loans', models.BigIntegerField(default=0)),
+                ('returned_loans', models.BigIntegerField(default=0)),
+                ('loan_days', models.BigIntegerField(default=0)),
+                ('active_borrowers', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GenreCirculation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('genre', models.CharField(max_length=100)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('total_loans', models.BigIntegerField(default=0)),
+                ('open_loans', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('genre', 'shard'), name='lms_genre_circ_shard')],
+            },
+        ),
+        migrations.RunPython(fill_shard_zero, migrations.RunPython.noop),
+    ]
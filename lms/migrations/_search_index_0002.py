@@ -0,0 +1,185 @@
+"""
+The full-text search index as migration 0002 created it: its DDL and the
+RunPython functions that apply it.
+
+Migrations 0002, 0004 and 0005 run these, so the SQL stays frozen here rather
+than following lms.search. A later change to the index belongs in a new
+module next to this one and a migration that uses it. The leading underscore
+keeps the migration loader from treating this file as a migration.
+"""
+
+SQLITE_TABLE = [
+    """
+    CREATE VIRTUAL TABLE lms_book_search USING fts5(
+        title, genre, publisher, language, tokenize = 'unicode61'
+    )
+    """,
+    # Rank title matches above genre, and both above publisher/language
+    "INSERT INTO lms_book_search (lms_book_search, rank) VALUES ('rank', 'bm25(4.0, 2.0, 1.0, 1.0)')",
+    """
+    INSERT INTO lms_book_search (rowid, title, genre, publisher, language)
+    SELECT b.bookID, b.title, b.genre, coalesce(d.publisher, ''), coalesce(d.language, '')
+    FROM lms_book b LEFT JOIN lms_bookdetails d ON d.bookID_id = b.bookID
+    """,
+]
+
+# SQLite drops a table's triggers when a migration rebuilds that table, so
+# migrations that alter lms_book or lms_bookdetails run restore_search_triggers
+# afterwards.
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS lms_book_search_book_insert AFTER INSERT ON lms_book BEGIN
+        INSERT INTO lms_book_search (rowid, title, genre, publisher, language)
+        VALUES (new.bookID, new.title, new.genre, '', '');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lms_book_search_book_update AFTER UPDATE OF title, genre ON lms_book BEGIN
+        UPDATE lms_book_search SET title = new.title, genre = new.genre WHERE rowid = new.bookID;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lms_book_search_book_delete AFTER DELETE ON lms_book BEGIN
+        DELETE FROM lms_book_search WHERE rowid = old.bookID;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lms_book_search_details_insert AFTER INSERT ON lms_bookdetails BEGIN
+        UPDATE lms_book_search SET publisher = new.publisher, language = new.language WHERE rowid = new.bookID_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lms_book_search_details_update AFTER UPDATE ON lms_bookdetails BEGIN
+        UPDATE lms_book_search SET publisher = '', language = '' WHERE rowid = old.bookID_id;
+        UPDATE lms_book_search SET publisher = new.publisher, language = new.language WHERE rowid = new.bookID_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lms_book_search_details_delete AFTER DELETE ON lms_bookdetails BEGIN
+        UPDATE lms_book_search SET publisher = '', language = '' WHERE rowid = old.bookID_id;
+    END
+    """,
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS lms_book_search_details_delete",
+    "DROP TRIGGER IF EXISTS lms_book_search_details_update",
+    "DROP TRIGGER IF EXISTS lms_book_search_details_insert",
+    "DROP TRIGGER IF EXISTS lms_book_search_book_delete",
+    "DROP TRIGGER IF EXISTS lms_book_search_book_update",
+    "DROP TRIGGER IF EXISTS lms_book_search_book_insert",
+    "DROP TABLE IF EXISTS lms_book_search",
+]
+
+# lms_book_search holds no foreign key to lms_book: PostgreSQL refuses to
+# TRUNCATE a referenced table, which would break `manage.py flush` and test
+# teardown. Deletes and truncates are mirrored by triggers instead.
+POSTGRES_FORWARDS = [
+    """
+    CREATE TABLE lms_book_search (
+        book_id integer PRIMARY KEY,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX lms_book_search_document_gin ON lms_book_search USING GIN (document)",
+    """
+    CREATE FUNCTION lms_book_search_refresh(target integer) RETURNS void AS $$
+        INSERT INTO lms_book_search (book_id, document)
+        SELECT b."bookID",
+               setweight(to_tsvector('simple', coalesce(b.title, '')), 'A') ||
+               setweight(to_tsvector('simple', coalesce(b.genre, '')), 'B') ||
+               setweight(to_tsvector('simple', coalesce(d.publisher, '')), 'C') ||
+               setweight(to_tsvector('simple', coalesce(d.language, '')), 'C')
+        FROM lms_book b LEFT JOIN lms_bookdetails d ON d."bookID_id" = b."bookID"
+        WHERE b."bookID" = target
+        ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document;
+    $$ LANGUAGE sql
+    """,
+    """
+    CREATE FUNCTION lms_book_search_book_trigger() RETURNS trigger AS $$
+    BEGIN
+        PERFORM lms_book_search_refresh(NEW."bookID");
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE FUNCTION lms_book_search_details_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM lms_book_search_refresh(OLD."bookID_id");
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM lms_book_search_refresh(NEW."bookID_id");
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE FUNCTION lms_book_search_delete_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            TRUNCATE lms_book_search;
+        ELSE
+            DELETE FROM lms_book_search WHERE book_id = OLD."bookID";
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER lms_book_search_book AFTER INSERT OR UPDATE OF title, genre ON lms_book
+    FOR EACH ROW EXECUTE FUNCTION lms_book_search_book_trigger()
+    """,
+    """
+    CREATE TRIGGER lms_book_search_book_delete AFTER DELETE ON lms_book
+    FOR EACH ROW EXECUTE FUNCTION lms_book_search_delete_trigger()
+    """,
+    """
+    CREATE TRIGGER lms_book_search_book_truncate AFTER TRUNCATE ON lms_book
+    FOR EACH STATEMENT EXECUTE FUNCTION lms_book_search_delete_trigger()
+    """,
+    """
+    CREATE TRIGGER lms_book_search_details AFTER INSERT OR UPDATE OR DELETE ON lms_bookdetails
+    FOR EACH ROW EXECUTE FUNCTION lms_book_search_details_trigger()
+    """,
+    'SELECT lms_book_search_refresh("bookID") FROM lms_book',
+]
+
+POSTGRES_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS lms_book_search_details ON lms_bookdetails",
+    "DROP TRIGGER IF EXISTS lms_book_search_book_truncate ON lms_book",
+    "DROP TRIGGER IF EXISTS lms_book_search_book_delete ON lms_book",
+    "DROP TRIGGER IF EXISTS lms_book_search_book ON lms_book",
+    "DROP FUNCTION IF EXISTS lms_book_search_details_trigger()",
+    "DROP FUNCTION IF EXISTS lms_book_search_delete_trigger()",
+    "DROP FUNCTION IF EXISTS lms_book_search_book_trigger()",
+    "DROP FUNCTION IF EXISTS lms_book_search_refresh(integer)",
+    "DROP TABLE IF EXISTS lms_book_search",
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        statements = SQLITE_TABLE + SQLITE_TRIGGERS
+    elif vendor == 'postgresql':
+        statements = POSTGRES_FORWARDS
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement, params=None)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_BACKWARDS, 'postgresql': POSTGRES_BACKWARDS}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement, params=None)
+
+
+def restore_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_TRIGGERS:
+            schema_editor.execute(statement, params=None)
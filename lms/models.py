@@ -1,4 +1,9 @@
+import datetime
+from decimal import Decimal
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
 class CustomUserManager(BaseUserManager):
@@ -34,6 +39,7 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     email = models.EmailField(unique=True)
     membership_date = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
 
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
@@ -51,6 +57,30 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
 
 
+class BookQuerySet(models.QuerySet):
+    """
+    QuerySet helpers for Book.
+    """
+    def with_expansions(self, expand):
+        """
+        Load the relations named in `expand` up front so serializing a page of
+        books costs a fixed number of queries.
+
+        - details: joined in with select_related.
+        - borrowed_books: the open loans (no return_date), prefetched into `active_loans`.
+        """
+        queryset = self
+        if 'details' in expand:
+            queryset = queryset.select_related('details')
+        if 'borrowed_books' in expand:
+            queryset = queryset.prefetch_related(models.Prefetch(
+                'borrowed_books',
+                queryset=BorrowedBooks.objects.filter(return_date__isnull=True).order_by('id'),
+                to_attr='active_loans',
+            ))
+        return queryset
+
+
 class Book(models.Model):
     """
     Represents a book in the library.
@@ -61,12 +91,50 @@ class Book(models.Model):
     - isbn: ISBN (International Standard Book Number) of the book, unique.
     - published_date: Date when the book was published.
     - genre: Genre of the book.
+    - copies: Number of copies the library owns.
+    - available_copies: Copies currently on the shelf. Only changed through lms.circulation.
+    - modified_at: When the book last changed, including its available copies;
+      used to answer conditional GETs.
     """
     bookID = models.AutoField(primary_key=True)
     title = models.CharField(max_length=255)
     isbn = models.CharField(max_length=13, unique=True)
     published_date = models.DateField()
     genre = models.CharField(max_length=100)
+    copies = models.PositiveIntegerField(default=1)
+    available_copies = models.PositiveIntegerField(default=1)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(available_copies__lte=models.F('copies')),
+                name='lms_book_available_lte_copies',
+            ),
+        ]
+        # One index per lms.filters.BookFilter filter/ordering pair it accepts
+        # (INDEXED_ORDERINGS). Each ends in bookID, the ordering tie-breaker, so
+        # filtered pages come back sorted.
+        indexes = [
+            models.Index(fields=['genre', 'bookID'], name='lms_book_genre_id'),
+            models.Index(fields=['genre', 'title', 'bookID'], name='lms_book_genre_title'),
+            models.Index(fields=['genre', 'published_date', 'bookID'], name='lms_book_genre_published'),
+            models.Index(fields=['title', 'bookID'], name='lms_book_title'),
+            # Also serves published_date ranges
+            models.Index(fields=['published_date', 'bookID'], name='lms_book_published'),
+            # "Available now", kept small by skipping books with every copy out
+            models.Index(fields=['bookID'], condition=models.Q(available_copies__gt=0), name='lms_book_available_id'),
+            models.Index(fields=['title', 'bookID'], condition=models.Q(available_copies__gt=0), name='lms_book_available_title'),
+            models.Index(fields=['published_date', 'bookID'], condition=models.Q(available_copies__gt=0), name='lms_book_available_published'),
+            # And "all copies out"
+            models.Index(fields=['bookID'], condition=models.Q(available_copies=0), name='lms_book_unavailable_id'),
+            models.Index(fields=['title', 'bookID'], condition=models.Q(available_copies=0), name='lms_book_unavailable_title'),
+            models.Index(fields=['published_date', 'bookID'], condition=models.Q(available_copies=0), name='lms_book_unavailable_published'),
+            # Latest change, for CatalogVersion.current(stamped=Book)
+            models.Index(fields=['modified_at'], name='lms_book_modified_at'),
+        ]
 
 
 class BookDetails(models.Model):
@@ -79,12 +147,21 @@ class BookDetails(models.Model):
     - number_of_pages: Number of pages in the book.
     - publisher: Publisher of the book.
     - language: Language in which the book is written.
+    - modified_at: When the details last changed; used to answer conditional GETs.
     """
     detailsID = models.AutoField(primary_key=True)
     bookID = models.OneToOneField(Book, on_delete=models.CASCADE, related_name='details')
     number_of_pages = models.PositiveIntegerField()
     publisher = models.CharField(max_length=255)
     language = models.CharField(max_length=50)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # language/publisher filters on book lists (lms.filters.BookFilter)
+        indexes = [
+            models.Index(fields=['language', 'bookID'], name='lms_details_language'),
+            models.Index(fields=['publisher', 'bookID'], name='lms_details_publisher'),
+        ]
 
 class BorrowedBooks(models.Model):
     """
@@ -95,8 +172,285 @@ class BorrowedBooks(models.Model):
     - BookID: Foreign key referring to the Book that was borrowed.
     - borrow_date: Date when the book was borrowed.
     - return_date: Date when the book is returned. Nullable for ongoing borrowings.
+    - due_date: Date the book should be back by; LMS_LOAN_DAYS after borrow_date unless given.
+    - fine: Late fine, kept up to date by lms.overdue and settled on return.
     """
-    userID = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='borrowed_books')
-    bookID = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='borrowed_books')
+    # Indexed by the composite indexes in Meta
+    userID = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='borrowed_books', db_index=False)
+    bookID = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='borrowed_books', db_index=False)
     borrow_date = models.DateField()
     return_date = models.DateField(null=True, blank=True)
+    due_date = models.DateField()
+    fine = models.DecimalField(max_digits=8, decimal_places=2, default=Decimal('0.00'))
+
+    def save(self, *args, **kwargs):
+        if self.due_date is None:
+            borrow_date = self._meta.get_field('borrow_date').to_python(self.borrow_date)
+            self.due_date = borrow_date + datetime.timedelta(days=getattr(settings, 'LMS_LOAN_DAYS', 14))
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # Serve lookups by user or book like the plain foreign key indexes
+            # they replace, and let lms.deletion walk a user's loans book by
+            # book (and a book's loans user by user) without sorting them.
+            models.Index(fields=['userID', 'bookID'], name='lms_loan_by_user_book'),
+            models.Index(fields=['bookID', 'userID'], name='lms_loan_by_book_user'),
+            # Partial indexes over open loans only, so "what is out right now"
+            # stays small however much returned history piles up.
+            models.Index(
+                fields=['userID', 'borrow_date'],
+                condition=models.Q(return_date__isnull=True),
+                name='lms_loan_open_by_user',
+            ),
+            models.Index(
+                fields=['bookID', 'borrow_date'],
+                condition=models.Q(return_date__isnull=True),
+                name='lms_loan_open_by_book',
+            ),
+            # Primary-key walk over open loans for the overdue job
+            models.Index(
+                fields=['id'],
+                condition=models.Q(return_date__isnull=True),
+                name='lms_loan_open_by_id',
+            ),
+        ]
+
+
+class ArchivedLoan(models.Model):
+    """
+    A returned loan moved out of BorrowedBooks by lms.archive once it is older
+    than LMS_ARCHIVE_AFTER_DAYS. It keeps the loan's id and columns, so history
+    endpoints can list both tables as one. On PostgreSQL the table may be range
+    partitioned by borrow_date (`python manage.py partition_loan_archive`).
+
+    Attributes:
+    - id: The loan's id in BorrowedBooks.
+    - userID, bookID, borrow_date, return_date, due_date, fine: As on BorrowedBooks.
+    - archived_at: When the loan was moved.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    # Indexed by the composite indexes in Meta
+    userID = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='archived_loans', db_index=False)
+    bookID = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='archived_loans', db_index=False)
+    borrow_date = models.DateField()
+    return_date = models.DateField()
+    due_date = models.DateField()
+    fine = models.DecimalField(max_digits=8, decimal_places=2, default=Decimal('0.00'))
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # As on BorrowedBooks: history by user or book, and lms.deletion's walk
+            models.Index(fields=['userID', 'bookID'], name='lms_archive_by_user_book'),
+            models.Index(fields=['bookID', 'userID'], name='lms_archive_by_book_user'),
+        ]
+
+
+class CatalogVersion(models.Model):
+    """
+    Version counter for a whole collection, used to validate cached list responses.
+
+    Rows that are saved or deleted bump it (lms.signals, lms.bulk). lms.circulation
+    changes books on every loan; bumping this single row there would serialize
+    all checkouts, so it only stamps Book.modified_at, and current() takes the
+    latest stamp into account.
+
+    Attributes:
+    - name: Collection name, e.g. "books".
+    - version: Incremented on every bumped change to the collection.
+    - modified_at: When the collection was last bumped.
+    """
+    BOOKS = 'books'
+
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    modified_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def bump(cls, name):
+        """
+        Record a change to the collection. Call it inside the writing transaction.
+        """
+        now = timezone.now()
+        updated = cls.objects.filter(name=name).update(version=models.F('version') + 1, modified_at=now)
+        if not updated:
+            cls.objects.get_or_create(name=name, defaults={'version': 1, 'modified_at': now})
+
+    @classmethod
+    def current(cls, name, stamped=None):
+        """
+        Return the collection's (version, modified_at) with a single primary-key lookup.
+
+        `stamped` is a model whose rows may change without a bump but always
+        stamp their indexed modified_at; modified_at is then the latest of those
+        stamps too (read from the index in the same query), so it moves on every
+        change.
+        """
+        return cls._version(cls._current_row(name, stamped).first())
+
+    @classmethod
+    async def acurrent(cls, name, stamped=None):
+        """
+        Async version of current().
+        """
+        return cls._version(await cls._current_row(name, stamped).afirst())
+
+    @classmethod
+    def _current_row(cls, name, stamped):
+        rows = cls.objects.filter(name=name)
+        if stamped is None:
+            return rows.values_list('version', 'modified_at')
+        latest = stamped.objects.order_by('-modified_at').values('modified_at')[:1]
+        return rows.annotate(stamped_at=models.Subquery(latest)).values_list('version', 'modified_at', 'stamped_at')
+
+    @staticmethod
+    def _version(row):
+        if row is None:
+            return (0, None)
+        version, *stamps = row
+        return version, max(stamp for stamp in stamps if stamp is not None)
+
+
+class JobCheckpoint(models.Model):
+    """
+    Progress of a resumable batch job that walks a table in primary-key order.
+
+    Attributes:
+    - job: Job name, e.g. "assess_overdue".
+    - run: Identifies one run of the job, e.g. the date it assesses.
+    - last_pk: Highest primary key fully processed.
+    - rows: Rows processed so far.
+    - finished: Whether the run completed.
+    - modified_at: When the checkpoint last moved.
+    """
+    job = models.CharField(max_length=50)
+    run = models.CharField(max_length=50)
+    last_pk = models.BigIntegerField(default=0)
+    rows = models.PositiveBigIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'run'], name='lms_job_checkpoint_run'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    The outcome of a write request sent with an Idempotency-Key header, kept so
+    retries get the same response without running the view again (lms.idempotency).
+
+    Attributes:
+    - user: Who sent the request; keys are scoped per user.
+    - key: The client's Idempotency-Key.
+    - fingerprint: SHA-256 of the method, path and body, so a key cannot be reused for another request.
+    - status_code: Status of the stored response; null while the first request is still running.
+    - response: The response body as zlib-compressed JSON.
+    - created_at: When the key was claimed.
+    - locked_until: When the claim lapses if the first request never stores a response.
+    - expires_at: When the key may be forgotten (LMS_IDEMPOTENCY_TTL after created_at).
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.BinaryField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='lms_idempotency_user_key'),
+        ]
+        indexes = [
+            # Purging expired keys
+            models.Index(fields=['expires_at'], name='lms_idempotency_expiry'),
+        ]
+
+
+class BookCirculation(models.Model):
+    """
+    Running loan counts for one book, maintained by lms.stats.
+
+    Attributes:
+    - book: The book the counts belong to.
+    - total_loans: Loans recorded for the book.
+    - open_loans: Loans without a return date.
+    - returned_loans: Loans with a return date.
+    - loan_days: Sum of (return_date - borrow_date) over returned loans.
+    """
+    book = models.OneToOneField(Book, primary_key=True, on_delete=models.CASCADE, related_name='circulation')
+    total_loans = models.PositiveIntegerField(default=0)
+    open_loans = models.PositiveIntegerField(default=0)
+    returned_loans = models.PositiveIntegerField(default=0)
+    loan_days = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Most-borrowed books
+            models.Index(fields=['-total_loans', 'book'], name='lms_book_circ_total'),
+        ]
+
+
+class GenreCirculation(models.Model):
+    """
+    Running loan counts per genre, maintained by lms.stats. Each genre's counts
+    are striped over several rows (shards) so loans of different books rarely
+    wait on the same row; the genre's figures are the sum of its shards.
+
+    Attributes:
+    - genre: Book.genre the counts belong to.
+    - shard: Stripe number; a book's loans always go to the same one.
+    - total_loans: Loans of books in the genre.
+    - open_loans: Of those, loans without a return date.
+    """
+    genre = models.CharField(max_length=100)
+    shard = models.PositiveSmallIntegerField()
+    # Signed: only the sum over the shards is meaningful
+    total_loans = models.BigIntegerField(default=0)
+    open_loans = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['genre', 'shard'], name='lms_genre_circ_shard'),
+        ]
+
+
+class BorrowerCirculation(models.Model):
+    """
+    Open loan count per user, maintained by lms.stats to track active borrowers.
+
+    Attributes:
+    - user: The borrower.
+    - open_loans: Loans the user has not returned yet.
+    """
+    user = models.OneToOneField(CustomUser, primary_key=True, on_delete=models.CASCADE, related_name='circulation')
+    open_loans = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Counting active borrowers (stats.rebuild)
+            models.Index(fields=['user'], condition=models.Q(open_loans__gt=0), name='lms_borrower_circ_active'),
+        ]
+
+
+class CirculationTotals(models.Model):
+    """
+    Library-wide loan counts, maintained by lms.stats and striped over several
+    rows (shards) like GenreCirculation; the figures are the sum of the rows.
+
+    Attributes:
+    - shard: Stripe number; a book's loans always go to the same one.
+    - total_loans, open_loans, returned_loans, loan_days: As on BookCirculation, summed over all books.
+    - active_borrowers: Users with at least one open loan.
+    """
+    shard = models.PositiveSmallIntegerField(primary_key=True)
+    # Signed: only the sum over the shards is meaningful
+    total_loans = models.BigIntegerField(default=0)
+    open_loans = models.BigIntegerField(default=0)
+    returned_loans = models.BigIntegerField(default=0)
+    loan_days = models.BigIntegerField(default=0)
+    active_borrowers = models.BigIntegerField(default=0)
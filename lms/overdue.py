@@ -0,0 +1,98 @@
+"""
+Overdue loans and their fines.
+
+A loan is overdue once its due date has passed while it is still open. It is
+fined LMS_FINE_PER_DAY for every day past the due date, up to LMS_FINE_CAP, and
+the fine is settled when the loan is returned (lms.circulation.set_return_date).
+
+assess() brings the fines of all open loans up to date for one day. It walks the
+open loans in primary-key chunks (served by the lms_loan_open_by_id partial
+index), computes a whole chunk's fines in one pass and writes the changed ones
+with one UPDATE per distinct fine amount (at most cap / rate + 1 of them). The
+UPDATEs re-check that the loan is still open, so a loan returned meanwhile keeps
+its settled fine. Each chunk commits on its own together with the run's
+JobCheckpoint, so no lock outlives a chunk and an interrupted run resumes after
+the last committed chunk.
+"""
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import BorrowedBooks, JobCheckpoint
+
+JOB = 'assess_overdue'
+DEFAULT_CHUNK_SIZE = 5000
+ZERO = Decimal('0.00')
+
+
+def fine_rates():
+    """
+    Return the configured (fine per day, fine cap) as Decimals.
+    """
+    return (
+        Decimal(str(getattr(settings, 'LMS_FINE_PER_DAY', '0.25'))),
+        Decimal(str(getattr(settings, 'LMS_FINE_CAP', '20.00'))),
+    )
+
+
+def fine_for(due_date, as_of, rates=None):
+    """
+    Return the fine for a loan due on `due_date` that is returned (or still out) on `as_of`.
+    """
+    per_day, cap = rates or fine_rates()
+    days = (as_of - due_date).days
+    return min(per_day * days, cap) if days > 0 else ZERO
+
+
+def assess(as_of=None, chunk_size=DEFAULT_CHUNK_SIZE, restart=False, progress=None):
+    """
+    Set the fine of every open loan as of `as_of` (default: today).
+
+    Resumes an unfinished run for the same date unless `restart` is given; a
+    finished run is not repeated. `progress(result)` is called after every
+    chunk. Returns {"loans": n, "overdue": n, "changed": n, "resumed_after": pk}
+    counting this invocation only, or None when the run had already finished.
+    """
+    as_of = as_of or datetime.date.today()
+    rates = fine_rates()
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(job=JOB, run=as_of.isoformat())
+    if restart:
+        checkpoint.last_pk, checkpoint.rows, checkpoint.finished = 0, 0, False
+        checkpoint.save()
+    elif checkpoint.finished:
+        return None
+
+    result = {"loans": 0, "overdue": 0, "changed": 0, "resumed_after": checkpoint.last_pk}
+    open_loans = BorrowedBooks.objects.filter(return_date__isnull=True).order_by('id')
+    while True:
+        chunk = list(open_loans.filter(id__gt=checkpoint.last_pk).values_list('id', 'due_date', 'fine')[:chunk_size])
+        if not chunk:
+            break
+
+        by_fine = defaultdict(list)
+        for loan_id, due_date, current_fine in chunk:
+            fine = fine_for(due_date, as_of, rates)
+            if fine:
+                result["overdue"] += 1
+            if fine != current_fine:
+                by_fine[fine].append(loan_id)
+
+        # The id range keeps each UPDATE on the chunk's slice of the primary key
+        in_chunk = open_loans.filter(id__range=(chunk[0][0], chunk[-1][0]))
+        with transaction.atomic():
+            for fine, ids in by_fine.items():
+                result["changed"] += in_chunk.filter(id__in=ids).update(fine=fine)
+            checkpoint.last_pk = chunk[-1][0]
+            checkpoint.rows += len(chunk)
+            checkpoint.save(update_fields=['last_pk', 'rows', 'modified_at'])
+
+        result["loans"] += len(chunk)
+        if progress:
+            progress(result)
+
+    checkpoint.finished = True
+    checkpoint.save(update_fields=['finished', 'modified_at'])
+    return result
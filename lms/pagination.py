@@ -1,6 +1,92 @@
+from django.core.paginator import InvalidPage
 from rest_framework import serializers, pagination
+from rest_framework.exceptions import NotFound
 
 
 class CustomPagination(pagination.PageNumberPagination):
     page_size = 10  # Set the number of items per page
 
+    def is_empty(self):
+        """
+        Return True when the paginated queryset has no rows at all.
+
+        Reuses the COUNT(*) the paginator already ran, so no extra query is needed.
+        """
+        return self.page.paginator.count == 0
+
+    def paginate_lazily(self, queryset, request):
+        """
+        Like paginate_queryset(), but return the page as an unevaluated queryset
+        slice so the caller decides how its rows are fetched.
+        """
+        self.request = request
+        paginator = self.django_paginator_class(queryset, self.page_size)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        return self.page.object_list
+
+
+class AsyncPagination(CustomPagination):
+    """
+    CustomPagination for async views.
+
+    The COUNT(*) and the page slice run through the async ORM; links, errors and
+    the response body are the same as the sync paginator's.
+    """
+
+    async def apaginate_queryset(self, queryset, request):
+        self.request = request
+        paginator = self.django_paginator_class(queryset, self.page_size)
+        paginator.count = await queryset.acount()
+
+        page_number = request.GET.get(self.page_query_param) or 1
+        if page_number in self.last_page_strings:
+            page_number = paginator.num_pages
+
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        self.page.object_list = [obj async for obj in self.page.object_list]
+        return self.page.object_list
+
+    def get_paginated_data(self, data):
+        """
+        Return the paginated body as a dict instead of a Response.
+        """
+        return self.get_paginated_response(data).data
+
+
+class CustomCursorPagination(pagination.CursorPagination):
+    """
+    Keyset pagination for large tables.
+
+    Pages are fetched with `WHERE pk < <position> ORDER BY pk DESC LIMIT n + 1`,
+    so there is no COUNT(*) and deep pages cost the same as the first one.
+    The next/previous links carry an opaque base64 cursor.
+    """
+    page_size = 10
+
+    def is_empty(self):
+        """
+        Return True when the first page came back empty.
+        """
+        return self.cursor is None and not self.page
+
+
+def get_paginator(request, ordering):
+    """
+    Pick the paginator for a list endpoint.
+
+    Clients opt into cursor mode with `?pagination=cursor`; the `cursor` parameter
+    in the returned links keeps them there. Page-number mode stays the default.
+    """
+    if request.query_params.get('pagination') == 'cursor' or CustomCursorPagination.cursor_query_param in request.query_params:
+        paginator = CustomCursorPagination()
+        paginator.ordering = ordering
+        return paginator
+    return CustomPagination()
@@ -0,0 +1,261 @@
+"""
+Sampled per-request profiling.
+
+ProfilingMiddleware profiles a random LMS_PROFILING_SAMPLE_RATE share of
+requests (at the default of 0 it removes itself): the number and total duration
+of their SQL queries, the time spent in the view, serializing and rendering the
+response, and the total. Profiled responses carry a Server-Timing header, e.g.
+
+    Server-Timing: db;dur=3.1;desc="4 queries", view;dur=5.2, serialize;dur=2.7, render;dur=0.8, total;dur=9.4
+
+`serialize` is the time spent in Serializer.data, ListSerializer.to_representation
+and lean.ValuesSerializer.serialize, the outermost call only when they nest; it
+is taken out of `view`, and includes any queries the serializers run. `render`
+is DRF's renderer encoding response.data as JSON. Views that encode the body
+themselves (the lms.async_views, database-built JSON pages) have no render
+entry at all.
+
+and one JSON log line is written to the "lms.profiling" logger. With
+LMS_PROFILING_DUPLICATE_QUERIES the log line also lists SQL statements run more
+than once, the usual sign of an N+1 query.
+
+Queries are counted by an execute wrapper installed on every database
+connection, which returns straight away unless the current request is being
+profiled; the profile lives in a context variable, so queries run by async
+views through sync_to_async are attributed to their request too. Unsampled
+requests cost a random() call and a context variable lookup per query, cheap
+enough to leave sampling at 1%. Queries run while a streaming response is
+consumed fall outside the profile.
+"""
+import functools
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+
+logger = logging.getLogger('lms.profiling')
+
+# Duplicate statements listed per log line
+MAX_DUPLICATES = 10
+# Length SQL is cut to in the log
+MAX_SQL_LENGTH = 300
+
+_current = ContextVar('lms_profile', default=None)
+
+# Collapses IN (%s, %s, ...) lists so lookups of different sizes share a signature
+_PLACEHOLDER_LIST = re.compile(r'%s(?:, %s)+')
+
+
+class RequestProfile:
+    """
+    Timings and query statistics of one profiled request, in seconds.
+    """
+
+    def __init__(self, capture_duplicates=False):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_finished = None
+        self.render_finished = None
+        self.serialize_time = 0.0
+        self.serializing = False
+        self.queries = 0
+        self.db_time = 0.0
+        self.signatures = Counter() if capture_duplicates else None
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        if self.signatures is not None:
+            self.signatures[_PLACEHOLDER_LIST.sub('%s', sql)] += 1
+
+    def duplicates(self):
+        """
+        Return [{"sql": ..., "count": n}] for statements run more than once, most repeated first.
+        """
+        if self.signatures is None:
+            return None
+        return [
+            {"sql": sql[:MAX_SQL_LENGTH], "count": count}
+            for sql, count in self.signatures.most_common(MAX_DUPLICATES) if count > 1
+        ]
+
+    def timings(self, finished):
+        """
+        Return the durations in milliseconds, given the perf_counter() the request finished at.
+        """
+        view_finished = self.view_finished or finished
+        view = max(view_finished - self.view_started - self.serialize_time, 0) if self.view_started else None
+        render = self.render_finished - self.view_finished if self.render_finished and self.view_finished else None
+
+        def ms(value):
+            return round(value * 1000, 2) if value is not None else None
+
+        serialize = self.serialize_time if self.view_started else None
+        return {
+            "db": ms(self.db_time), "view": ms(view), "serialize": ms(serialize), "render": ms(render),
+            "total": ms(finished - self.started),
+        }
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - started)
+
+
+def _install(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def timed_serialization(serialize):
+    """
+    Wrap a serializing function so the current profile counts its time as `serialize`.
+    """
+    @functools.wraps(serialize)
+    def wrapper(*args, **kwargs):
+        profile = _current.get()
+        # Nested serializers are already inside the outer call's time
+        if profile is None or profile.serializing:
+            return serialize(*args, **kwargs)
+        profile.serializing = True
+        started = time.perf_counter()
+        try:
+            return serialize(*args, **kwargs)
+        finally:
+            profile.serializing = False
+            profile.serialize_time += time.perf_counter() - started
+    wrapper.timed = True
+    return wrapper
+
+
+def _install_serializer_timing():
+    # Serializer.data and ListSerializer.data both go through BaseSerializer.data
+    if not getattr(serializers.BaseSerializer.data.fget, 'timed', False):
+        serializers.BaseSerializer.data = property(timed_serialization(serializers.BaseSerializer.data.fget))
+    if not getattr(serializers.ListSerializer.to_representation, 'timed', False):
+        serializers.ListSerializer.to_representation = timed_serialization(serializers.ListSerializer.to_representation)
+
+
+def server_timing(timings, queries):
+    """
+    Format timings (ms) as a Server-Timing header value.
+    """
+    entries = [f'db;dur={timings["db"]};desc="{queries} queries"']
+    entries += [f'{name};dur={timings[name]}' for name in ('view', 'serialize', 'render', 'total') if timings[name] is not None]
+    return ", ".join(entries)
+
+
+class ProfilingMiddleware:
+    """
+    Profile a sample of requests; see the module docstring.
+
+    Put it first in MIDDLEWARE so `total` covers the other middleware as well.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, 'LMS_PROFILING_SAMPLE_RATE', 0.0)
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+        self.capture_duplicates = getattr(settings, 'LMS_PROFILING_DUPLICATE_QUERIES', False)
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Hooks matching the handler's mode, so unprofiled requests never
+            # pay for a sync/async switch
+            self.process_view = self._aprocess_view
+            self.process_template_response = self._aprocess_template_response
+        else:
+            self.process_view = self._process_view
+            self.process_template_response = self._process_template_response
+
+        connection_created.connect(_install, dispatch_uid='lms.profiling')
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        _install_serializer_timing()
+
+    def _start(self):
+        if random.random() >= self.sample_rate:
+            return None
+        return RequestProfile(self.capture_duplicates)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        profile = self._start()
+        if profile is None:
+            return self.get_response(request)
+        token = _current.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, profile)
+
+    async def __acall__(self, request):
+        profile = self._start()
+        if profile is None:
+            return await self.get_response(request)
+        token = _current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, profile)
+
+    def _process_view(self, request, view_func, view_args, view_kwargs):
+        profile = _current.get()
+        if profile is not None:
+            profile.view_started = time.perf_counter()
+        return None
+
+    async def _aprocess_view(self, request, view_func, view_args, view_kwargs):
+        return self._process_view(request, view_func, view_args, view_kwargs)
+
+    def _process_template_response(self, request, response):
+        # Called once the view has returned, before the response is rendered
+        profile = _current.get()
+        if profile is not None:
+            profile.view_finished = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: setattr(profile, 'render_finished', time.perf_counter()))
+        return response
+
+    async def _aprocess_template_response(self, request, response):
+        return self._process_template_response(request, response)
+
+    def _finish(self, request, response, profile):
+        timings = profile.timings(time.perf_counter())
+        response['Server-Timing'] = server_timing(timings, profile.queries)
+
+        match = request.resolver_match
+        line = {
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "queries": profile.queries,
+            **{f"{name}_ms": value for name, value in timings.items()},
+        }
+        duplicates = profile.duplicates()
+        if duplicates is not None:
+            line["duplicate_queries"] = duplicates
+        logger.info(json.dumps(line))
+        return response
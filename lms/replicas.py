@@ -0,0 +1,109 @@
+"""
+Read replicas with read-your-writes stickiness.
+
+ReplicaRouter sends writes to the primary ("default") and, during requests that
+ReplicaPinningMiddleware marks as safe for it, spreads reads over the
+LMS_READ_REPLICAS aliases. A request may read from a replica when:
+
+- it uses a safe method (GET, HEAD, OPTIONS);
+- the client has not written in the last LMS_REPLICA_PIN_SECONDS: every
+  unsafe request (borrow_book, update_book, ...) sets a short-lived cookie
+  that pins the client's following requests to the primary, so it reads its
+  own writes despite replication lag. API clients must send cookies back to
+  benefit.
+
+Everything else reads from the primary: writing requests, management commands
+and the shell, reads inside a transaction on the primary (they may be followed
+by writes based on them), auth token lookups (cached per process anyway, and a
+revoked token must not outlive its deletion on a lagging replica) and streamed
+response bodies, which are read after the middleware has returned.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'lms_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Always read from the primary
+PRIMARY_ONLY_MODELS = {'authtoken.Token'}
+
+# Whether the current request may read from a replica
+_replica_reads = ContextVar('lms_replica_reads', default=False)
+
+
+def replicas():
+    return getattr(settings, 'LMS_READ_REPLICAS', ())
+
+
+class ReplicaRouter:
+    """
+    Route reads to a random replica when the current request allows it, everything else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or not _replica_reads.get() or model._meta.label in PRIMARY_ONLY_MODELS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """
+    Let safe requests from clients that have not written recently read from
+    replicas, and pin clients to the primary after they write.
+
+    Removes itself when LMS_READ_REPLICAS is empty.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.pin_seconds = getattr(settings, 'LMS_REPLICA_PIN_SECONDS', 10)
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _replica_reads.set(self._may_use_replicas(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+        return self._pin(request, response)
+
+    async def __acall__(self, request):
+        token = _replica_reads.set(self._may_use_replicas(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+        return self._pin(request, response)
+
+    def _may_use_replicas(self, request):
+        return request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+
+    def _pin(self, request, response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(PIN_COOKIE, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
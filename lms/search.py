@@ -0,0 +1,65 @@
+"""
+Full-text search over the book catalog.
+
+The index covers Book.title, Book.genre, BookDetails.publisher and
+BookDetails.language. It is an FTS5 table on SQLite and a tsvector table with a GIN
+index on PostgreSQL. Database triggers keep it in sync, so bulk_create and
+QuerySet.update() are covered as well as save() and delete(). The tables and
+triggers are created by migrations (lms/migrations/_search_index_0002.py);
+this module only queries them.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+
+from .models import Book
+
+
+def _tokens(query):
+    return [token.lower() for token in re.findall(r'\w+', query)]
+
+
+def search_book_ids(query, limit, offset=0):
+    """
+    Return the IDs of books matching every word in `query`, best match first.
+
+    Each word also matches as a prefix ("gats" finds "Gatsby"). Backends without
+    a full-text index fall back to a case-insensitive substring scan.
+    """
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+
+    # The database the books themselves will be read from, so a replica
+    # returns IDs it has the rows for
+    connection = connections[router.db_for_read(Book)]
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        sql = (
+            "SELECT rowid FROM lms_book_search WHERE lms_book_search MATCH %s "
+            "ORDER BY rank, rowid DESC LIMIT %s OFFSET %s"
+        )
+        params = [" ".join(f'"{token}"*' for token in tokens), limit, offset]
+    elif vendor == 'postgresql':
+        sql = (
+            "SELECT book_id FROM lms_book_search, to_tsquery('simple', %s) query "
+            "WHERE document @@ query ORDER BY ts_rank(document, query) DESC, book_id DESC LIMIT %s OFFSET %s"
+        )
+        params = [" & ".join(f"{token}:*" for token in tokens), limit, offset]
+    else:
+        return _fallback_search_book_ids(tokens, limit, offset)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fallback_search_book_ids(tokens, limit, offset):
+    books = Book.objects.all()
+    for token in tokens:
+        books = books.filter(
+            Q(title__icontains=token) | Q(genre__icontains=token)
+            | Q(details__publisher__icontains=token) | Q(details__language__icontains=token)
+        )
+    return list(books.order_by('-bookID').values_list('bookID', flat=True)[offset:offset + limit])
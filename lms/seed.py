@@ -0,0 +1,228 @@
+"""
+Deterministic synthetic datasets for load and scale testing.
+
+generate() writes users, books with their details and loans through
+bulk_create in large batches, one transaction per batch. Every value is drawn
+from random.Random(seed), so the same arguments (batch size included) always
+produce the same rows, whatever the number of workers, apart from
+auto-generated timestamps and primary keys.
+
+Popularity is skewed the way circulation is: the book of popularity rank r is
+borrowed in proportion to 1 / r ** BOOK_SKEW and borrowers follow a milder
+USER_SKEW, with ranks shuffled so popularity is unrelated to primary keys.
+Loans are written in independently seeded batches, optionally by several
+worker processes. Open loans beyond a book's copies are then marked returned
+with one UPDATE, and available_copies, the circulation statistics and the
+books CatalogVersion are brought up to date.
+"""
+import datetime
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, islice
+
+import django
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Window
+from django.db.models.functions import RowNumber
+
+from . import overdue, stats
+from .models import Book, BookDetails, BorrowedBooks, CatalogVersion, CustomUser
+
+DEFAULT_BATCH_SIZE = 10000
+EMAIL_DOMAIN = 'seed.example.com'
+
+BOOK_SKEW = 1.1
+USER_SKEW = 0.7
+# Loans are spread over this many days before `as_of` and last a few weeks.
+HISTORY_DAYS = 3 * 365
+MEAN_LOAN_DAYS = 12
+
+WORDS = [
+    'Silent', 'Hidden', 'Broken', 'Golden', 'Last', 'Distant', 'Winter', 'Secret', 'Burning', 'Lost',
+    'River', 'Garden', 'Empire', 'Shadow', 'Kingdom', 'Letters', 'Harbor', 'Machine', 'Forest', 'City',
+]
+GENRES = ['Fiction', 'Mystery', 'Fantasy', 'Science Fiction', 'Romance', 'History', 'Biography', 'Science', 'Poetry', 'Children']
+GENRE_WEIGHTS = [30, 15, 12, 10, 10, 8, 6, 5, 2, 2]
+PUBLISHERS = ['Penguin Books', 'HarperCollins', 'Macmillan', 'Hachette', 'Simon & Schuster', 'Vintage', 'Orbit', 'Tor']
+LANGUAGES = ['English', 'Spanish', 'French', 'German', 'Nepali']
+LANGUAGE_WEIGHTS = [70, 10, 8, 7, 5]
+COPIES = [1, 2, 3, 5, 10]
+COPIES_WEIGHTS = [40, 25, 15, 12, 8]
+
+
+def _popularity(ids, exponent, rng):
+    """
+    Shuffle `ids` into popularity order and return (ids, cumulative Zipf weights).
+    """
+    ids = list(ids)
+    rng.shuffle(ids)
+    return ids, list(accumulate(rank ** -exponent for rank in range(1, len(ids) + 1)))
+
+
+def _insert(model, objects, batch_size, stage, progress):
+    """
+    bulk_create `objects` in batches; return the primary keys in insertion order.
+    """
+    pks = []
+    objects = iter(objects)
+    while batch := list(islice(objects, batch_size)):
+        with transaction.atomic():
+            pks += [obj.pk for obj in model.objects.bulk_create(batch)]
+        if progress:
+            progress(stage, len(pks))
+    return pks
+
+
+def _users(count, rng):
+    for i in range(count):
+        yield CustomUser(name=f"{rng.choice(WORDS)} Reader {i}", email=f"user{i}@{EMAIL_DOMAIN}", password='!')
+
+
+def _books(count, rng, as_of):
+    for i in range(count):
+        copies = rng.choices(COPIES, weights=COPIES_WEIGHTS)[0]
+        published = min(as_of, datetime.date(1950, 1, 1) + datetime.timedelta(days=rng.randrange(27000)))
+        yield Book(
+            title=f"The {rng.choice(WORDS)} {rng.choice(WORDS)} {i}",
+            isbn=f"S{i:08d}",
+            published_date=published,
+            genre=rng.choices(GENRES, weights=GENRE_WEIGHTS)[0],
+            copies=copies,
+            available_copies=copies,
+        )
+
+
+def _details(book_ids, rng):
+    for book_id in book_ids:
+        yield BookDetails(
+            bookID_id=book_id,
+            number_of_pages=rng.randint(80, 900),
+            publisher=rng.choice(PUBLISHERS),
+            language=rng.choices(LANGUAGES, weights=LANGUAGE_WEIGHTS)[0],
+        )
+
+
+# Set in each process that writes loans (see _loan_batch).
+_loan_context = None
+
+
+def _init_loan_writer(context):
+    global _loan_context
+    # Worker processes need configured settings when the platform spawns
+    # rather than forks them; setup() is a no-op once Django is configured.
+    django.setup()
+    _loan_context = context
+
+
+def _loan_batch(index, size):
+    """
+    Write loan batch `index`. Each batch draws from its own Random, so batches
+    can be written in any order and by any process with the same result.
+    """
+    users, user_weights, books, book_weights, seed, as_of = _loan_context
+    rng = random.Random(f"{seed}:loans:{index}")
+    loan_days = datetime.timedelta(days=getattr(settings, 'LMS_LOAN_DAYS', 14))
+    rates = overdue.fine_rates()
+
+    rows = []
+    for user_id, book_id in zip(
+        rng.choices(users, cum_weights=user_weights, k=size),
+        rng.choices(books, cum_weights=book_weights, k=size),
+    ):
+        borrow_date = as_of - datetime.timedelta(days=rng.randrange(HISTORY_DAYS))
+        due_date = borrow_date + loan_days
+        return_date = borrow_date + datetime.timedelta(days=1 + int(rng.expovariate(1 / MEAN_LOAN_DAYS)))
+        if return_date > as_of:
+            return_date = None  # still out
+        rows.append(BorrowedBooks(
+            userID_id=user_id, bookID_id=book_id, borrow_date=borrow_date, due_date=due_date,
+            return_date=return_date, fine=overdue.fine_for(due_date, return_date or as_of, rates),
+        ))
+    with transaction.atomic():
+        BorrowedBooks.objects.bulk_create(rows)
+    return size
+
+
+def _write_loans(count, user_ids, book_ids, rng, seed, as_of, batch_size, workers, progress):
+    users, user_weights = _popularity(user_ids, USER_SKEW, rng)
+    books, book_weights = _popularity(book_ids, BOOK_SKEW, rng)
+    context = (users, user_weights, books, book_weights, seed, as_of)
+    sizes = [min(batch_size, count - start) for start in range(0, count, batch_size)]
+
+    if workers <= 1:
+        _init_loan_writer(context)
+        _report_loans(map(_loan_batch, range(len(sizes)), sizes), progress)
+        return
+
+    # Forked workers must open their own connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_loan_writer, initargs=(context,)) as pool:
+        _report_loans(pool.map(_loan_batch, range(len(sizes)), sizes), progress)
+
+
+def _report_loans(sizes, progress):
+    written = 0
+    for size in sizes:
+        written += size
+        if progress:
+            progress("loans", written)
+
+
+def _close_excess_loans(first_book_id, as_of):
+    """
+    Mark loans beyond a book's copies as returned on `as_of`, keeping the
+    earliest open loans, and set available_copies from the ones that remain.
+    """
+    seeded_open = BorrowedBooks.objects.filter(bookID__gte=first_book_id, return_date__isnull=True)
+    # Not ordered by id, which depends on how workers interleaved; rows tied on
+    # these columns are identical anyway.
+    excess = seeded_open.annotate(
+        position=Window(RowNumber(), partition_by=F('bookID'), order_by=[F('borrow_date').asc(), F('userID').asc(), F('id').asc()]),
+    ).filter(position__gt=F('bookID__copies')).values('id')
+    # Their fine as of `as_of` is the one they were written with
+    BorrowedBooks.objects.filter(id__in=Subquery(excess)).update(return_date=as_of)
+
+    per_book = seeded_open.filter(bookID=OuterRef('pk')).order_by().values('bookID').annotate(count=Count('*')).values('count')
+    Book.objects.filter(bookID__in=seeded_open.values('bookID')).update(available_copies=F('copies') - Subquery(per_book))
+    return seeded_open.count()
+
+
+def generate(users, books, loans, seed=0, as_of=None, batch_size=DEFAULT_BATCH_SIZE, workers=1, progress=None):
+    """
+    Seed `users` users, `books` books with details and `loans` loans.
+
+    `as_of` (default: today) is the last day of the loan history; pass it
+    explicitly for datasets that are identical from one day to the next.
+    Loans are written by `workers` processes (1 writes them inline; each worker
+    uses its own connection, so use 1 on SQLite and inside tests).
+    `progress(stage, rows)` is called after every batch. Raises ValueError if
+    the database already holds a seeded dataset or loans are requested without
+    users or books. Returns the row counts, seconds and rows per second.
+    """
+    if loans and not (users and books):
+        raise ValueError("Loans need at least one user and one book.")
+    if CustomUser.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}").exists():
+        raise ValueError(f"The database already holds a seeded dataset (users @{EMAIL_DOMAIN}).")
+
+    rng = random.Random(seed)
+    as_of = as_of or datetime.date.today()
+    result = {"users": users, "books": books, "details": books, "loans": loans}
+    started = time.monotonic()
+
+    user_ids = _insert(CustomUser, _users(users, rng), batch_size, "users", progress)
+    book_ids = _insert(Book, _books(books, rng, as_of), batch_size, "books", progress)
+    _insert(BookDetails, _details(book_ids, rng), batch_size, "details", progress)
+    _write_loans(loans, user_ids, book_ids, rng, seed, as_of, batch_size, workers, progress)
+
+    with transaction.atomic():
+        result["open_loans"] = _close_excess_loans(book_ids[0], as_of) if loans else 0
+        CatalogVersion.bump(CatalogVersion.BOOKS)
+    stats.rebuild()
+
+    elapsed = time.monotonic() - started
+    rows = users + 2 * books + loans
+    result["seconds"] = round(elapsed, 3)
+    result["rows_per_second"] = round(rows / elapsed, 1) if elapsed else 0.0
+    return result
@@ -1,4 +1,6 @@
+from django.db import transaction
 from rest_framework import serializers
+from . import stats
 from .models import CustomUser, Book, BookDetails, BorrowedBooks
 
 class CreateCustomUserSerializer(serializers.ModelSerializer):
@@ -17,6 +19,22 @@ class CreateCustomUserSerializer(serializers.ModelSerializer):
         if existing_users.exists():
             raise serializers.ValidationError("Email address must be unique.")
         return value
+
+
+class UserProvisionSerializer(serializers.ModelSerializer):
+    """
+    Row-level validation for bulk user provisioning.
+
+    Email uniqueness is checked per batch by the provisioner, not per row.
+    """
+    class Meta:
+        model = CustomUser
+        fields = ['name', 'email', 'password']
+        extra_kwargs = {
+            'email': {'validators': []},
+            'password': {'write_only': True},
+        }
+
     
 class CustomUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -41,18 +59,66 @@ class BookDetailsSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+def validate_isbn_length(value):
+    """
+    Validate that the ISBN has a length less than 10.
+    """
+    if len(value) >= 10:
+        raise serializers.ValidationError("ISBN length must be less than 10 characters.")
+
+
+def _check_copies(value, book, field=None):
+    """
+    Raise a ValidationError (keyed by `field`, if given) when `value` copies
+    would be fewer than `book` has on loan.
+    """
+    on_loan = book.copies - book.available_copies
+    if value < on_loan:
+        message = f"copies cannot be less than the {on_loan} currently on loan."
+        raise serializers.ValidationError({field: [message]} if field else message)
+
+
 class BookSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Book
         fields = '__all__'
-    
+        read_only_fields = ['available_copies']
+
+    def validate_copies(self, value):
+        """
+        Validate that the library does not own fewer copies than are on loan.
+        """
+        if self.instance is not None:
+            _check_copies(value, self.instance)
+        return value
+
+    def create(self, validated_data):
+        validated_data['available_copies'] = validated_data.get('copies', 1)
+        return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            # `instance` was read before the request took any lock, and save()
+            # writes every column: take the copy counts from the locked row so a
+            # checkout or return since then is not overwritten.
+            locked = Book.objects.select_for_update().only('copies', 'available_copies', 'genre').get(pk=instance.pk)
+            instance.copies, instance.available_copies = locked.copies, locked.available_copies
+            if 'copies' in validated_data:
+                # A checkout may have taken a copy since validate_copies ran, so check
+                # again; the CHECK constraint would otherwise fail.
+                _check_copies(validated_data['copies'], locked, field='copies')
+                # Shift the shelf count by the same amount
+                instance.available_copies += validated_data['copies'] - locked.copies
+            instance = super().update(instance, validated_data)
+            stats.move_genre(instance.pk, locked.genre, instance.genre)
+        return instance
+
     def validate_isbn(self, value):
         """
         Validate that the ISBN is unique and has a length less than 10.
         """
-        if len(value) >= 10:
-            raise serializers.ValidationError("ISBN length must be less than 10 characters.")
+        validate_isbn_length(value)
 
         existing_books = Book.objects.filter(isbn=value)
         if self.instance:
@@ -64,8 +130,91 @@ class BookSerializer(serializers.ModelSerializer):
         return value
 
 
+class BookImportSerializer(serializers.ModelSerializer):
+    """
+    Row-level validation for bulk imports.
+
+    ISBN uniqueness is not checked here; the importer checks a whole batch with a
+    single `isbn IN (...)` query instead of one SELECT per row.
+    """
+    class Meta:
+        model = Book
+        fields = ['title', 'isbn', 'published_date', 'genre', 'copies']
+        extra_kwargs = {'isbn': {'validators': []}}
+
+    def validate_isbn(self, value):
+        validate_isbn_length(value)
+        return value
+
+
+class BookBulkUpdateSerializer(BookSerializer):
+    """
+    Row-level validation for bulk partial updates of books.
+
+    Like BookImportSerializer, ISBN uniqueness is checked per batch by the updater.
+    """
+    class Meta(BookSerializer.Meta):
+        extra_kwargs = {'isbn': {'validators': []}}
+
+    def validate_isbn(self, value):
+        validate_isbn_length(value)
+        return value
+
+
+class BookDetailsBulkUpdateSerializer(BookDetailsSerializer):
+    """
+    Row-level validation for bulk partial updates of book details; the book they
+    belong to cannot be changed.
+    """
+    class Meta(BookDetailsSerializer.Meta):
+        read_only_fields = ['bookID']
+
+
+class LoanReturnSerializer(serializers.Serializer):
+    """
+    One row of a bulk return: the loan and the day it came back (today if omitted).
+    """
+    id = serializers.IntegerField(min_value=1)
+    return_date = serializers.DateField(required=False)
+
+
+class ReturnDateSerializer(serializers.Serializer):
+    """
+    Body of a single return: the day the loan came back, or null to re-open it.
+    """
+    return_date = serializers.DateField(allow_null=True)
+
 
 class BorrowedBooksSerializer(serializers.ModelSerializer):
     class Meta:
         model = BorrowedBooks
         fields = '__all__'
+        read_only_fields = ['fine']
+        # Defaults to LMS_LOAN_DAYS after borrow_date (see BorrowedBooks.save)
+        extra_kwargs = {'due_date': {'required': False}}
+
+    def validate(self, attrs):
+        borrow_date = attrs.get('borrow_date', getattr(self.instance, 'borrow_date', None))
+        due_date = attrs.get('due_date')
+        if due_date is not None and borrow_date is not None and due_date < borrow_date:
+            raise serializers.ValidationError({"due_date": ["due_date cannot be before borrow_date."]})
+        return attrs
+
+
+class ExpandableBookSerializer(BookSerializer):
+    """
+    BookSerializer that can inline the book's details and its open loans.
+
+    Pass the requested names as `expand`; the instances should come from
+    `Book.objects.with_expansions(expand)` so nothing is fetched per book.
+    """
+    EXPANSIONS = ('details', 'borrowed_books')
+
+    details = BookDetailsSerializer(read_only=True, allow_null=True)
+    borrowed_books = BorrowedBooksSerializer(source='active_loans', many=True, read_only=True)
+
+    def __init__(self, *args, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in self.EXPANSIONS:
+            if name not in expand:
+                self.fields.pop(name)
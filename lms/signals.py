@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .models import Book, BookDetails, CatalogVersion, CustomUser
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate_key(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    # Covers deactivation as well as any other change to the cached user object
+    token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=BookDetails)
+@receiver(post_delete, sender=BookDetails)
+def bump_books_version(sender, instance, **kwargs):
+    CatalogVersion.bump(CatalogVersion.BOOKS)
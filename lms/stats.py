@@ -0,0 +1,478 @@
+"""
+Incrementally maintained circulation statistics.
+
+lms.circulation records every loan, return and delete in the summary tables
+(BookCirculation per book, BorrowerCirculation per user, GenreCirculation and
+CirculationTotals) inside the transaction that changes the loan, so the /stats/
+endpoint reads a fixed number of rows instead of aggregating BorrowedBooks.
+
+A single library-wide or per-genre row would be updated by every loan, so all
+circulation would queue on its lock. Those counters are striped instead: each
+genre and the totals have up to LMS_STATS_SHARDS rows, a loan updates the
+shard of its book (bookID modulo the shard count) and snapshot() sums the
+shards. Loans of the same book already wait on the book's row; loans of books
+in different shards never wait on each other. Rows are locked in one order:
+the book's, its genre shard, the borrower's, the totals shard (after the loan
+and the book itself, see lms.circulation); bulk changes lock each table's rows
+in primary-key order.
+
+Deleting a user or book removes its loans by cascade; forget_loans() takes them
+out of the counts first. Loans moved to the archive (lms.archive) are still
+counted. rebuild() recomputes everything from BorrowedBooks and ArchivedLoan.
+
+Counts never go below zero, so loans written outside lms.circulation (admin,
+shell) only skew the figures until the next rebuild instead of failing the
+request.
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import BigIntegerField, Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import (
+    ArchivedLoan, BookCirculation, Book, BorrowedBooks, BorrowerCirculation, CirculationTotals, CustomUser, GenreCirculation,
+)
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_TOP = 10
+MAX_TOP = 100
+
+# Signed running sums; every other counter is clamped at zero, except on the
+# striped tables, where only the sum over a genre's or the totals' shards
+# has to stay positive.
+_SIGNED_FIELDS = {'loan_days'}
+_STRIPED_MODELS = {GenreCirculation, CirculationTotals}
+
+_OPEN = Q(return_date__isnull=True)
+
+# Summary rows changed per UPDATE statement by _add_many
+_ROWS_PER_UPDATE = 1000
+
+
+def _loan_days(borrow_date, return_date):
+    return (return_date - borrow_date).days
+
+
+def shard_of(book_id):
+    """
+    Return the GenreCirculation and CirculationTotals shard a book's loans are counted in.
+    """
+    return book_id % getattr(settings, 'LMS_STATS_SHARDS', 16)
+
+
+def _signed(model, field):
+    return field in _SIGNED_FIELDS or model in _STRIPED_MODELS
+
+
+def _add(model, key, **deltas):
+    """
+    Add `deltas` to the counters of one summary row, creating it if needed,
+    with one INSERT ... ON CONFLICT DO UPDATE (PostgreSQL, SQLite 3.24+).
+    `key` is the row's primary key or a dict of its unique fields' values.
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    lookup = key if isinstance(key, dict) else {model._meta.pk.name: key}
+
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    keys = [quote(model._meta.get_field(name).column) for name in lookup]
+    # A new row gets every counter, as the defaults are not in the schema
+    counters = [field for field in model._meta.concrete_fields if not field.primary_key and field.name not in lookup]
+    inserted = [
+        field.get_default() if field.name not in deltas
+        else deltas[field.name] if _signed(model, field.name) else max(deltas[field.name], 0)
+        for field in counters
+    ]
+    assignments, params = [], []
+    for field, delta in deltas.items():
+        column = quote(model._meta.get_field(field).column)
+        total = f"{table}.{column} + %s"
+        if delta > 0 or _signed(model, field):
+            assignments.append(f"{column} = {total}")
+            params.append(delta)
+        else:
+            assignments.append(f"{column} = CASE WHEN {total} < 0 THEN 0 ELSE {total} END")
+            params += [delta, delta]
+    columns = keys + [quote(field.column) for field in counters]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+            f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(assignments)}",
+            [*lookup.values(), *inserted, *params],
+        )
+
+
+def case_by_pk(values, output_field):
+    """
+    Return a CASE expression giving each primary key in `values` ({pk: value})
+    its value, with one WHEN per distinct value rather than per row; bulk
+    changes mostly share a handful of values and compile much faster that way.
+    """
+    groups = defaultdict(list)
+    for pk, value in values.items():
+        groups[value].append(pk)
+    return Case(*[When(pk__in=pks, then=Value(value)) for value, pks in groups.items()], default=None, output_field=output_field)
+
+
+def _add_many(model, deltas, create=True):
+    """
+    Add per-row deltas {pk: {field: delta}} to a summary table with one INSERT
+    of the missing rows (unless `create` is false) and one UPDATE ... FROM
+    (VALUES ...) join per _ROWS_PER_UPDATE rows. A join stays linear where a
+    CASE with a branch per row would be quadratic; both PostgreSQL and SQLite
+    (3.33+) support it.
+    """
+    deltas = {pk: changes for pk, changes in deltas.items() if any(changes.values())}
+    if not deltas:
+        return
+    if create:
+        model.objects.bulk_create([model(pk=pk) for pk in sorted(deltas)], ignore_conflicts=True)
+
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    fields = sorted({field for changes in deltas.values() for field, delta in changes.items() if delta})
+    assignments = []
+    for number, field in enumerate(fields, start=2):
+        column = quote(model._meta.get_field(field).column)
+        total = f"{table}.{column} + v.column{number}"
+        assignments.append(f"{column} = {total}" if _signed(model, field) else f"{column} = CASE WHEN {total} < 0 THEN 0 ELSE {total} END")
+    pk_column = quote(model._meta.pk.column)
+    row = "(" + ", ".join(["%s"] * (len(fields) + 1)) + ")"
+
+    # Sorted, so concurrent writers lock rows in the same order
+    rows = sorted(deltas.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), _ROWS_PER_UPDATE):
+            batch = rows[start:start + _ROWS_PER_UPDATE]
+            params = [value for pk, changes in batch for value in (pk, *(changes.get(field, 0) for field in fields))]
+            cursor.execute(
+                f"UPDATE {table} SET {', '.join(assignments)} "
+                f"FROM (VALUES {', '.join([row] * len(batch))}) AS v WHERE {table}.{pk_column} = v.column1",
+                params,
+            )
+
+
+def _add_to_genres(deltas):
+    """
+    Add deltas {(genre, shard): {field: delta}} to the GenreCirculation rows
+    with a fixed number of queries.
+    """
+    deltas = {key: changes for key, changes in deltas.items() if any(changes.values())}
+    if not deltas:
+        return
+    GenreCirculation.objects.bulk_create([GenreCirculation(genre=genre, shard=shard) for genre, shard in sorted(deltas)], ignore_conflicts=True)
+    rows = GenreCirculation.objects.filter(genre__in={genre for genre, _ in deltas}).values_list('pk', 'genre', 'shard')
+    pks = {(genre, shard): pk for pk, genre, shard in rows}
+    _add_many(GenreCirculation, {pks[key]: changes for key, changes in deltas.items()}, create=False)
+
+
+def _change_borrower(user_id, delta):
+    """
+    Change a user's open loan count; return the change in active borrowers.
+    """
+    borrower, _ = BorrowerCirculation.objects.select_for_update().get_or_create(user_id=user_id)
+    before = borrower.open_loans
+    borrower.open_loans = max(before + delta, 0)
+    borrower.save(update_fields=['open_loans'])
+    return (borrower.open_loans > 0) - (before > 0)
+
+
+def _change_borrowers(deltas):
+    """
+    Change many users' open loan counts ({user_id: delta}) with a fixed number
+    of queries; return the change in active borrowers.
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+    BorrowerCirculation.objects.bulk_create([BorrowerCirculation(user_id=user_id) for user_id in sorted(deltas)], ignore_conflicts=True)
+    rows = BorrowerCirculation.objects.select_for_update().filter(user_id__in=list(deltas)).order_by('pk')
+    open_loans = {}
+    active = 0
+    for user_id, before in rows.values_list('user_id', 'open_loans'):
+        open_loans[user_id] = max(before + deltas[user_id], 0)
+        active += (open_loans[user_id] > 0) - (before > 0)
+    BorrowerCirculation.objects.filter(pk__in=list(open_loans)).update(open_loans=case_by_pk(open_loans, BigIntegerField()))
+    return active
+
+
+def _count(loan, sign):
+    is_open = loan.return_date is None
+    opened = sign if is_open else 0
+    returned = 0 if is_open else sign
+    days = 0 if is_open else sign * _loan_days(loan.borrow_date, loan.return_date)
+    shard = shard_of(loan.bookID_id)
+
+    _add(BookCirculation, loan.bookID_id, total_loans=sign, open_loans=opened, returned_loans=returned, loan_days=days)
+    _add(GenreCirculation, {'genre': loan.bookID.genre, 'shard': shard}, total_loans=sign, open_loans=opened)
+    active = _change_borrower(loan.userID_id, opened) if opened else 0
+    _add(CirculationTotals, shard, total_loans=sign, open_loans=opened, returned_loans=returned, loan_days=days, active_borrowers=active)
+
+
+def record_loan(loan):
+    """
+    Count a new loan. Call inside the transaction that creates it.
+    """
+    _count(loan, 1)
+
+
+def record_delete(loan):
+    """
+    Stop counting a deleted loan. Call inside the transaction that deletes it.
+    """
+    _count(loan, -1)
+
+
+def record_return(loan, previous_return_date):
+    """
+    Count a change to a loan's return date; `loan` already holds the new one.
+    """
+    was_open = previous_return_date is None
+    is_open = loan.return_date is None
+    opened = is_open - was_open  # 1 when reopened, -1 when returned
+    old_days = 0 if was_open else _loan_days(loan.borrow_date, previous_return_date)
+    new_days = 0 if is_open else _loan_days(loan.borrow_date, loan.return_date)
+    days = new_days - old_days
+    shard = shard_of(loan.bookID_id)
+
+    _add(BookCirculation, loan.bookID_id, open_loans=opened, returned_loans=-opened, loan_days=days)
+    _add(GenreCirculation, {'genre': loan.bookID.genre, 'shard': shard}, open_loans=opened)
+    active = _change_borrower(loan.userID_id, opened) if opened else 0
+    _add(CirculationTotals, shard, open_loans=opened, returned_loans=-opened, loan_days=days, active_borrowers=active)
+
+
+def record_returns(loans):
+    """
+    Count the return of many loans that were open, e.g. a bulk return; each
+    loan already holds its return date. Costs a fixed number of queries.
+    """
+    books = defaultdict(Counter)
+    genres = defaultdict(Counter)
+    totals = defaultdict(Counter)
+    borrowers = Counter()
+    for loan in loans:
+        shard = shard_of(loan.bookID_id)
+        days = _loan_days(loan.borrow_date, loan.return_date)
+        books[loan.bookID_id].update(open_loans=-1, returned_loans=1, loan_days=days)
+        genres[loan.bookID.genre, shard].update(open_loans=-1)
+        totals[shard].update(open_loans=-1, returned_loans=1, loan_days=days)
+        borrowers[loan.userID_id] -= 1
+    if not books:
+        return
+    _add_many(BookCirculation, books)
+    _add_to_genres(genres)
+    # Active borrowers are not tied to a book; count them in the lowest shard touched
+    totals[min(totals)]['active_borrowers'] += _change_borrowers(borrowers)
+    _add_many(CirculationTotals, totals)
+
+
+def _count_loans(loans, sign):
+    per_book = loans.order_by().values('bookID', 'bookID__genre').annotate(
+        total=Count('id'),
+        open=Count('id', filter=_OPEN),
+        days=Sum(F('return_date') - F('borrow_date'), filter=~_OPEN),
+    )
+    books = {}
+    genres = defaultdict(Counter)
+    totals = defaultdict(Counter)
+    for row in per_book:
+        counts = {
+            'total_loans': sign * row['total'],
+            'open_loans': sign * row['open'],
+            'returned_loans': sign * (row['total'] - row['open']),
+            'loan_days': sign * (row['days'].days if row['days'] else 0),
+        }
+        shard = shard_of(row['bookID'])
+        books[row['bookID']] = counts
+        genres[row['bookID__genre'], shard].update(total_loans=counts['total_loans'], open_loans=counts['open_loans'])
+        totals[shard].update(counts)
+    if not books:
+        return
+    _add_many(BookCirculation, books)
+    _add_to_genres(genres)
+
+    per_borrower = loans.filter(_OPEN).order_by().values_list('userID').annotate(open=Count('id'))
+    # Active borrowers are not tied to a book; count them in the lowest shard touched
+    totals[min(totals)]['active_borrowers'] += _change_borrowers({user_id: sign * count for user_id, count in per_borrower})
+    _add_many(CirculationTotals, totals)
+
+
+def record_loans(loans):
+    """
+    Count a queryset of loans that were written in bulk, bypassing record_loan.
+    Costs a fixed number of queries however many books and users they touch.
+    """
+    _count_loans(loans, 1)
+
+
+def forget_loans(loans):
+    """
+    Stop counting a queryset of loans (BorrowedBooks or ArchivedLoan) that is
+    about to be deleted in bulk, e.g. by the cascade from deleting their user
+    or book. Costs a fixed number of queries however many books and users
+    they touch.
+    """
+    _count_loans(loans, -1)
+
+
+def move_genre(book_id, old_genre, new_genre):
+    """
+    Move a book's loans between genres after its genre changed.
+    """
+    if old_genre != new_genre:
+        move_genres({book_id: (old_genre, new_genre)})
+
+
+def move_genres(changes):
+    """
+    Move the loans of many books between genres; `changes` maps book ID to
+    (old genre, new genre) for books whose genre changed.
+    """
+    genres = defaultdict(Counter)
+    counts = BookCirculation.objects.filter(pk__in=list(changes)).values_list('book', 'total_loans', 'open_loans')
+    for book_id, total, open_ in counts:
+        old_genre, new_genre = changes[book_id]
+        shard = shard_of(book_id)
+        genres[old_genre, shard].update(total_loans=-total, open_loans=-open_)
+        genres[new_genre, shard].update(total_loans=total, open_loans=open_)
+    _add_to_genres(genres)
+
+
+def snapshot(top=DEFAULT_TOP):
+    """
+    Read the dashboard figures: the library-wide and per-genre shards summed,
+    and the most borrowed books. Three queries over at most LMS_STATS_SHARDS
+    rows per genre, whatever the size of the catalog. Shards are signed, so a
+    loan deleted before it was counted can take a sum below zero until the
+    next rebuild; it reads as zero meanwhile.
+    """
+    totals = CirculationTotals.objects.aggregate(**{
+        field: Coalesce(Sum(field), 0)
+        for field in ('total_loans', 'open_loans', 'returned_loans', 'loan_days', 'active_borrowers')
+    })
+    totals = {field: max(value, 0) for field, value in totals.items()}
+    average = round(totals['loan_days'] / totals['returned_loans'], 2) if totals['returned_loans'] else None
+    genres = (
+        GenreCirculation.objects.values('genre')
+        .annotate(total=Sum('total_loans'), open=Sum('open_loans'))
+        .filter(total__gt=0)
+        .order_by('-total', 'genre')
+    )
+    books = (
+        BookCirculation.objects.filter(total_loans__gt=0)
+        .select_related('book').only('total_loans', 'open_loans', 'book__title')
+        .order_by('-total_loans', 'book')[:top]
+    )
+    return {
+        "total_loans": totals['total_loans'],
+        "open_loans": totals['open_loans'],
+        "returned_loans": totals['returned_loans'],
+        "active_borrowers": totals['active_borrowers'],
+        "average_loan_days": average,
+        "loans_per_genre": [
+            {"genre": row['genre'], "total_loans": row['total'], "open_loans": max(row['open'], 0)} for row in genres
+        ],
+        "most_borrowed_books": [
+            {"bookID": row.book_id, "title": row.book.title, "total_loans": row.total_loans, "open_loans": row.open_loans}
+            for row in books
+        ],
+    }
+
+
+def _pk_chunks(queryset, chunk_size):
+    """
+    Yield lists of up to `chunk_size` primary keys in ascending order.
+    """
+    last = None
+    while True:
+        page = queryset.order_by('pk')
+        if last is not None:
+            page = page.filter(pk__gt=last)
+        ids = list(page.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def rebuild(chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Recompute every summary table from BorrowedBooks and ArchivedLoan.
+
+    Books and users are processed in primary-key chunks, one short transaction
+    each; the genre and total rows are then derived from the per-book and
+    per-user rows, into shard 0. Loans changed while a chunk is being
+    recomputed may be counted twice or not at all, so run it while circulation
+    is quiet.
+    `progress(stage, done)` is called after every chunk.
+    Returns {"books": n, "users": n}.
+    """
+    done = {"books": 0, "users": 0}
+
+    for ids in _pk_chunks(Book.objects.all(), chunk_size):
+        with transaction.atomic():
+            counts = defaultdict(Counter)
+            # Archived loans are still counted (lms.archive)
+            for model in (BorrowedBooks, ArchivedLoan):
+                for row in model.objects.filter(bookID__in=ids).order_by().values('bookID').annotate(
+                    total=Count('id'),
+                    open=Count('id', filter=_OPEN),
+                    days=Sum(F('return_date') - F('borrow_date'), filter=~_OPEN),
+                ):
+                    counts[row['bookID']].update(total=row['total'], open=row['open'], days=row['days'].days if row['days'] else 0)
+            rows = [
+                BookCirculation(
+                    book_id=book_id, total_loans=book['total'], open_loans=book['open'],
+                    returned_loans=book['total'] - book['open'], loan_days=book['days'],
+                )
+                for book_id, book in counts.items()
+            ]
+            BookCirculation.objects.filter(book_id__in=ids).exclude(book_id__in=[row.book_id for row in rows]).delete()
+            BookCirculation.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['book'],
+                update_fields=['total_loans', 'open_loans', 'returned_loans', 'loan_days'],
+            )
+        done["books"] += len(ids)
+        if progress:
+            progress("books", done["books"])
+
+    for ids in _pk_chunks(CustomUser.objects.all(), chunk_size):
+        with transaction.atomic():
+            rows = [
+                BorrowerCirculation(user_id=row['userID'], open_loans=row['open'])
+                for row in BorrowedBooks.objects.filter(_OPEN, userID__in=ids).order_by().values('userID').annotate(open=Count('id'))
+            ]
+            BorrowerCirculation.objects.filter(user_id__in=ids).exclude(user_id__in=[row.user_id for row in rows]).delete()
+            BorrowerCirculation.objects.bulk_create(rows, update_conflicts=True, unique_fields=['user'], update_fields=['open_loans'])
+        done["users"] += len(ids)
+        if progress:
+            progress("users", done["users"])
+
+    with transaction.atomic():
+        genres = BookCirculation.objects.filter(total_loans__gt=0).order_by().values('book__genre').annotate(
+            total=Sum('total_loans'), open=Sum('open_loans'),
+        )
+        GenreCirculation.objects.all().delete()
+        GenreCirculation.objects.bulk_create(
+            GenreCirculation(genre=row['book__genre'], shard=0, total_loans=row['total'], open_loans=row['open']) for row in genres
+        )
+
+        sums = BookCirculation.objects.aggregate(
+            total=Sum('total_loans'), open=Sum('open_loans'), returned=Sum('returned_loans'), days=Sum('loan_days'),
+        )
+        CirculationTotals.objects.all().delete()
+        CirculationTotals.objects.create(
+            shard=0,
+            total_loans=sums['total'] or 0,
+            open_loans=sums['open'] or 0,
+            returned_loans=sums['returned'] or 0,
+            loan_days=sums['days'] or 0,
+            active_borrowers=BorrowerCirculation.objects.filter(open_loans__gt=0).count(),
+        )
+    return done
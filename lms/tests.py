@@ -1,9 +1,32 @@
-from rest_framework.test import APITestCase
-from rest_framework import status
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Count, Q
+from django.http import QueryDict
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APITestCase
+from rest_framework import serializers, status
 from django.urls import reverse
 from django.contrib.auth import get_user_model
-from .models import CustomUser, Book, BookDetails, BorrowedBooks
+from .models import ArchivedLoan, CustomUser, Book, BookCirculation, BookDetails, BorrowedBooks, CatalogVersion, CirculationTotals, GenreCirculation, IdempotencyKey, JobCheckpoint
 from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from django.utils import timezone
+from . import archive, benchmarks, bulk, circulation, deletion, idempotency, lean, overdue, profiling, replicas, seed, stats
+from .filters import BookFilter
+from .serializers import BookSerializer, BorrowedBooksSerializer, CustomUserSerializer, ExpandableBookSerializer
+from .authentication import TokenCache, token_cache
 
 class LMSTestCase(APITestCase):
     def setUp(self):
@@ -159,3 +182,1816 @@ class LMSTestCase(APITestCase):
 
 
 
+class CursorPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.list_books_url = reverse('list-books')
+        self.list_users_url = reverse('list-users')
+
+        Book.objects.bulk_create([
+            Book(title=f"Book {i}", isbn=f"isbn{i}", published_date="2022-01-30", genre="Fiction")
+            for i in range(15)
+        ])
+
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_list_books_cursor_mode_skips_count(self):
+        # Token lookup, catalog version check and the page itself
+        with self.assertNumQueries(3):
+            response = self.client.get(self.list_books_url, {"pagination": "cursor"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", response.data)
+        self.assertIsNone(response.data["previous"])
+        self.assertIsNotNone(response.data["next"])
+
+        first_page = [book["bookID"] for book in response.data["results"]["data"]]
+        self.assertEqual(first_page, sorted(first_page, reverse=True))
+        self.assertEqual(len(first_page), 10)
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        second_page = [book["bookID"] for book in response.data["results"]["data"]]
+        self.assertEqual(len(second_page), 5)
+        self.assertLess(max(second_page), min(first_page))
+        self.assertIsNone(response.data["next"])
+        self.assertIsNotNone(response.data["previous"])
+
+    def test_list_users_cursor_mode(self):
+        response = self.client.get(self.list_users_url, {"pagination": "cursor"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"]["data"][0]["userID"], self.user.userID)
+
+    def test_list_books_page_mode_has_no_exists_probe(self):
+        # Token lookup, catalog version check, COUNT(*) and the page query
+        with self.assertNumQueries(4):
+            response = self.client.get(self.list_books_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 15)
+
+    def test_list_books_cursor_mode_empty(self):
+        Book.objects.all().delete()
+        response = self.client.get(self.list_books_url, {"pagination": "cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BookImportTestCase(APITestCase):
+    def setUp(self):
+        self.import_books_url = reverse('import-books')
+        Book.objects.create(title="The Great Adventure", published_date="2022-01-30", genre="comedy", isbn="123457890")
+
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_import_books_ndjson_reports_row_errors(self):
+        body = "\n".join([
+            '{"title": "Book A", "isbn": "111", "published_date": "2022-01-30", "genre": "Fiction"}',
+            '{"title": "Book B", "isbn": "123457890", "published_date": "2022-01-30", "genre": "Fiction"}',
+            'not json',
+            '{"title": "Book C", "isbn": "111", "published_date": "2022-01-30", "genre": "Fiction"}',
+            '{"title": "Book D", "isbn": "222", "published_date": "not a date", "genre": "Fiction"}',
+            '{"title": "Book E", "isbn": "333", "published_date": "2022-01-30", "genre": "Fiction"}',
+        ])
+        response = self.client.post(self.import_books_url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["data"]["created"], 2)
+        self.assertEqual(response.data["data"]["failed"], 4)
+        self.assertEqual(sorted(error["row"] for error in response.data["data"]["errors"]), [2, 3, 4, 5])
+        self.assertEqual(Book.objects.filter(isbn__in=["111", "333"]).count(), 2)
+
+    def test_import_books_csv_batches_queries(self):
+        rows = ["title,isbn,published_date,genre"]
+        rows += [f"Book {i},i{i},2022-01-30,Fiction" for i in range(10)]
+        # Token lookup, then per batch of 5: one uniqueness check, one INSERT and
+        # the catalog version bump (wrapped in a SAVEPOINT/RELEASE pair inside the
+        # test transaction)
+        with self.assertNumQueries(1 + 2 * 5):
+            response = self.client.post(f"{self.import_books_url}?batch_size=5", "\n".join(rows), content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["data"]["created"], 10)
+        self.assertEqual(Book.objects.count(), 11)
+
+    def test_import_books_rejects_unknown_content_type(self):
+        response = self.client.post(self.import_books_url, {"title": "Book"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_import_books_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write("title,isbn,published_date,genre\nBook A,111,2022-01-30,Fiction\n")
+        self.addCleanup(os.remove, handle.name)
+
+        call_command('import_books', handle.name, stdout=io.StringIO())
+        self.assertTrue(Book.objects.filter(isbn="111").exists())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserProvisionTestCase(APITestCase):
+    def setUp(self):
+        self.provision_users_url = reverse('provision-users')
+        self.addCleanup(bulk.shutdown_password_pool)
+
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_provision_users_creates_users_and_tokens(self):
+        body = "\n".join([
+            '{"name": "Alice Doe", "email": "alice@example.com", "password": "secret_one"}',
+            '{"name": "Bob Doe", "email": "john.doe@example.com", "password": "secret_two"}',
+            '{"name": "Carol Doe", "email": "carol@example.com"}',
+            '{"name": "Dan Doe", "email": "dan@example.com", "password": "secret_three"}',
+        ])
+        response = self.client.post(self.provision_users_url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["data"]["created"], 2)
+        self.assertEqual(sorted(error["row"] for error in response.data["data"]["errors"]), [2, 3])
+        self.assertIn("users_per_second", response.data["data"])
+
+        alice = CustomUser.objects.get(email="alice@example.com")
+        self.assertTrue(alice.check_password("secret_one"))
+        # Same flags as create_user
+        self.assertEqual((alice.is_staff, alice.is_superuser), (True, False))
+        self.assertTrue(Token.objects.filter(user=alice).exists())
+        self.assertTrue(Token.objects.filter(user__email="dan@example.com").exists())
+
+    def test_provision_users_hashes_in_process_pool(self):
+        rows = [(i, {"name": f"User {i}", "email": f"user{i}@example.com", "password": f"password{i}"}) for i in range(6)]
+        result = bulk.provision_users(rows, batch_size=4, workers=2)
+        self.assertEqual(result["created"], 6)
+        self.assertTrue(CustomUser.objects.get(email="user5@example.com").check_password("password5"))
+        self.assertEqual(Token.objects.filter(user__email__startswith="user").count(), 6)
+
+    @override_settings(LMS_PASSWORD_HASH_WORKERS=2)
+    def test_requests_share_one_bounded_pool(self):
+        for n in range(2):
+            rows = [(i, {"name": f"User {n}-{i}", "email": f"user{n}-{i}@example.com", "password": "password"}) for i in range(3)]
+            self.assertEqual(bulk.provision_users(rows)["created"], 3)
+            if n == 0:
+                pool = bulk._shared_pool
+        self.assertIs(bulk._shared_pool, pool)
+        self.assertEqual(pool._max_workers, 2)
+
+
+class CachedTokenAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+
+        self.book = Book.objects.create(title="The Great Adventure", published_date="2022-01-30", genre="comedy", isbn="123457890")
+        self.get_book_by_id_url = reverse('get-book-by-id', args=[self.book.bookID])
+
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password", is_staff=True)
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_token_skips_auth_query(self):
+        with self.assertNumQueries(2):
+            self.client.get(self.get_book_by_id_url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.get_book_by_id_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        stats = self.client.get(reverse('token-cache-stats')).data["data"]
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 2)
+
+    def test_deleted_token_is_invalidated(self):
+        self.client.get(self.get_book_by_id_url)
+        self.token.delete()
+        response = self.client.get(self.get_book_by_id_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_invalidated(self):
+        self.client.get(self.get_book_by_id_url)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.get_book_by_id_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_delete_user_invalidates_own_token(self):
+        self.client.get(self.get_book_by_id_url)
+        response = self.client.delete(reverse('delete-user', args=[self.user.userID]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(self.get_book_by_id_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_is_bounded(self):
+        cache = TokenCache(max_size=2, ttl=60)
+        for key in ("a", "b", "c"):
+            cache.set(key, (self.user, self.token), cache.generation)
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_cache_entries_expire(self):
+        cache = TokenCache(max_size=2, ttl=0)
+        cache.set("a", (self.user, self.token), cache.generation)
+        self.assertIsNone(cache.get("a"))
+
+    def test_cache_hands_out_copies(self):
+        cache = TokenCache(max_size=2, ttl=60)
+        cache.set("a", (self.user, self.token), cache.generation)
+        first_user, first_token = cache.get("a")
+        second_user, second_token = cache.get("a")
+        self.assertIsNot(first_user, second_user)
+        self.assertIs(first_token.user, first_user)
+        first_user.name = "Changed"
+        self.assertEqual(second_user.name, "John Doe")
+        self.assertEqual(cache.get("a")[0].name, "John Doe")
+
+    def test_invalidate_user_drops_only_their_tokens(self):
+        other = CustomUser.objects.create(name="Jane Doe", email="jane.doe@example.com", password="test_password")
+        other_token = Token.objects.create(user=other)
+        cache = TokenCache(max_size=10, ttl=60)
+        cache.set("a", (self.user, self.token), cache.generation)
+        cache.set("b", (self.user, self.token), cache.generation)
+        cache.set("c", (other, other_token), cache.generation)
+        cache.invalidate_user(self.user.pk)
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual(cache.stats()["size"], 1)
+
+
+class BookExpandTestCase(APITestCase):
+    def setUp(self):
+        self.list_books_url = reverse('list-books')
+
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        for i in range(10):
+            book = Book.objects.create(title=f"Book {i}", isbn=f"isbn{i}", published_date="2022-01-30", genre="Fiction")
+            BookDetails.objects.create(bookID=book, number_of_pages=100 + i, publisher="Penguin Books", language="English")
+            BorrowedBooks.objects.create(userID=self.user, bookID=book, borrow_date="2022-01-30")
+            BorrowedBooks.objects.create(userID=self.user, bookID=book, borrow_date="2022-01-01", return_date="2022-01-15")
+        self.book = book
+
+    def test_list_books_expand_details_fixed_queries(self):
+        # Token lookup, catalog version check, COUNT(*) and one joined page query
+        with self.assertNumQueries(4):
+            response = self.client.get(self.list_books_url, {"expand": "details"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first = response.data["results"]["data"][0]
+        self.assertEqual(first["details"]["number_of_pages"], 109)
+        self.assertNotIn("borrowed_books", first)
+
+    def test_list_books_expand_borrowed_books(self):
+        # No version lookup: pages with loans are not validated
+        with self.assertNumQueries(4):
+            response = self.client.get(self.list_books_url, {"expand": "details,borrowed_books"})
+        first = response.data["results"]["data"][0]
+        self.assertEqual(len(first["borrowed_books"]), 1)
+        self.assertIsNone(first["borrowed_books"][0]["return_date"])
+
+    def test_get_book_by_id_expand(self):
+        response = self.client.get(reverse('get-book-by-id', args=[self.book.bookID]), {"expand": "details"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["details"]["publisher"], "Penguin Books")
+
+    def test_get_book_by_id_without_expand_is_unchanged(self):
+        response = self.client.get(reverse('get-book-by-id', args=[self.book.bookID]))
+        self.assertEqual(set(response.data), {"bookID", "title", "isbn", "published_date", "genre", "copies", "available_copies", "modified_at"})
+
+    def test_expand_book_without_details(self):
+        book = Book.objects.create(title="Bare", isbn="bare1", published_date="2022-01-30", genre="Fiction")
+        response = self.client.get(reverse('get-book-by-id', args=[book.bookID]), {"expand": "details"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data["details"])
+
+    def test_unknown_expand_is_rejected(self):
+        response = self.client.get(self.list_books_url, {"expand": "author"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BookSearchTestCase(APITestCase):
+    def setUp(self):
+        self.search_books_url = reverse('search-books')
+
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        self.gatsby = Book.objects.create(title="The Great Gatsby", isbn="111", published_date="2022-01-30", genre="Fiction")
+        self.atlas = Book.objects.create(title="World Atlas", isbn="222", published_date="2022-01-30", genre="Reference")
+        BookDetails.objects.create(bookID=self.atlas, number_of_pages=300, publisher="Gatsby Press", language="English")
+
+    def search(self, q, **params):
+        response = self.client.get(self.search_books_url, {"q": q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book["bookID"] for book in response.data["results"]["data"]]
+
+    def test_search_ranks_title_matches_first(self):
+        self.assertEqual(self.search("gatsby"), [self.gatsby.bookID, self.atlas.bookID])
+
+    def test_search_matches_prefixes_and_all_words(self):
+        self.assertEqual(self.search("gats engl"), [self.atlas.bookID])
+
+    def test_search_index_follows_updates_and_deletes(self):
+        self.gatsby.title = "Tender Is the Night"
+        self.gatsby.save()
+        self.assertEqual(self.search("gatsby"), [self.atlas.bookID])
+        self.assertEqual(self.search("tender"), [self.gatsby.bookID])
+
+        self.atlas.details.delete()
+        self.assertEqual(self.search("gatsby"), [])
+
+        self.gatsby.delete()
+        self.assertEqual(self.search("tender"), [])
+
+    def test_search_indexes_bulk_created_books(self):
+        Book.objects.bulk_create([
+            Book(title=f"Cookbook {i}", isbn=f"c{i}", published_date="2022-01-30", genre="Food")
+            for i in range(12)
+        ])
+        response = self.client.get(self.search_books_url, {"q": "cookbook"})
+        self.assertEqual(len(response.data["results"]["data"]), 10)
+        self.assertIsNotNone(response.data["next"])
+        self.assertEqual(len(self.search("cookbook", page=2)), 2)
+
+    def test_search_requires_query(self):
+        response = self.client.get(self.search_books_url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CurrentLoansTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        self.book = Book.objects.create(title="The Great Adventure", published_date="2022-01-30", genre="comedy", isbn="123457890")
+        self.returned = BorrowedBooks.objects.create(userID=self.user, bookID=self.book, borrow_date="2022-01-01", return_date="2022-01-10")
+        self.open_loan = BorrowedBooks.objects.create(userID=self.user, bookID=self.book, borrow_date="2022-01-30")
+
+    def test_list_user_current_loans(self):
+        response = self.client.get(reverse('list-user-current-loans', args=[self.user.userID]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([loan["id"] for loan in response.data["data"]], [self.open_loan.id])
+
+    def test_list_user_current_loans_unknown_user(self):
+        response = self.client.get(reverse('list-user-current-loans', args=[999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_book_current_borrowers(self):
+        response = self.client.get(reverse('list-book-current-borrowers', args=[self.book.bookID]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["data"]), 1)
+        self.assertEqual(response.data["data"][0]["borrower"]["email"], self.user.email)
+
+        self.open_loan.return_date = "2022-02-15"
+        self.open_loan.save()
+        response = self.client.get(reverse('list-book-current-borrowers', args=[self.book.bookID]))
+        self.assertEqual(response.data["data"], [])
+
+    def test_open_loan_queries_use_partial_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("Query plan assertions are written for SQLite.")
+        for field, index in (("userID", "lms_loan_open_by_user"), ("bookID", "lms_loan_open_by_book")):
+            queryset = BorrowedBooks.objects.filter(**{field: 1, "return_date__isnull": True}).order_by('-borrow_date')
+            self.assertIn(index, queryset.explain())
+
+
+class CheckoutTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        self.book = Book.objects.create(title="The Great Adventure", published_date="2022-01-30", genre="comedy", isbn="123457890", copies=2, available_copies=2)
+
+    def borrow(self):
+        return self.client.post(reverse('borrow-book'), {"userID": self.user.userID, "bookID": self.book.bookID, "borrow_date": "2022-01-30"}, format='json')
+
+    def test_borrow_book_stops_at_zero_copies(self):
+        self.assertEqual(self.borrow().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.borrow().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.borrow().status_code, status.HTTP_409_CONFLICT)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(BorrowedBooks.objects.filter(bookID=self.book).count(), 2)
+
+    def test_return_and_delete_put_copies_back(self):
+        first = self.borrow().data["data"]["id"]
+        second = self.borrow().data["data"]["id"]
+
+        self.client.put(reverse('return-borrowed-book', args=[first]), {"return_date": "2022-02-15"}, format='json')
+        # Returning the same loan twice only frees one copy
+        self.client.put(reverse('return-borrowed-book', args=[first]), {"return_date": "2022-02-16"}, format='json')
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+        self.client.delete(reverse('delete-borrowed-book', args=[second]))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+
+    def test_delete_user_puts_copies_back(self):
+        borrower = CustomUser.objects.create(name="Alice Doe", email="alice@example.com", password="another_password")
+        BorrowedBooks.objects.create(userID=borrower, bookID=self.book, borrow_date="2022-01-30")
+        BorrowedBooks.objects.create(userID=borrower, bookID=self.book, borrow_date="2022-01-31")
+        Book.objects.filter(pk=self.book.pk).update(available_copies=0)
+
+        self.client.delete(reverse('delete-user', args=[borrower.userID]))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+
+    def test_update_book_copies_shifts_available(self):
+        self.borrow()
+        data = {"title": self.book.title, "isbn": self.book.isbn, "published_date": "2022-01-30", "genre": "comedy", "copies": 5}
+        response = self.client.put(reverse('update-book', args=[self.book.bookID]), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["data"]["available_copies"], 4)
+
+        data["copies"] = 0
+        response = self.client.put(reverse('update-book', args=[self.book.bookID]), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update_book_copies_checks_the_locked_row(self):
+        stale = Book.objects.get(pk=self.book.pk)
+        # Both copies go out after `stale` was read, as in a concurrent checkout
+        self.borrow()
+        self.borrow()
+        data = {"title": self.book.title, "isbn": self.book.isbn, "published_date": "2022-01-30", "genre": "comedy", "copies": 1}
+        serializer = BookSerializer(stale, data=data)
+        self.assertTrue(serializer.is_valid())
+        with self.assertRaises(serializers.ValidationError) as raised:
+            serializer.save()
+        self.assertIn("copies", raised.exception.detail)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies, self.book.available_copies), (2, 0))
+
+    def test_update_book_keeps_concurrent_checkouts(self):
+        stale = Book.objects.get(pk=self.book.pk)
+        # A copy goes out after `stale` was read, as in a concurrent checkout
+        self.borrow()
+        data = {"title": "Renamed", "isbn": self.book.isbn, "published_date": "2022-01-30", "genre": "comedy"}
+        serializer = BookSerializer(stale, data=data, partial=True)
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.title, self.book.copies, self.book.available_copies), ("Renamed", 2, 1))
+
+        # Changing copies shifts the shelf count of the locked row
+        stale = Book.objects.get(pk=self.book.pk)
+        self.borrow()
+        serializer = BookSerializer(stale, data={**data, "copies": 3}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.save().available_copies, 1)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.copies, self.book.available_copies), (3, 1))
+
+    def test_return_date_is_validated(self):
+        loan_id = self.borrow().data["data"]["id"]
+        url = reverse('return-borrowed-book', args=[loan_id])
+        for body in ({"return_date": "not-a-date"}, {"return_date": ""}, {}):
+            response = self.client.put(url, body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+            self.assertIn("return_date", response.data["errors"])
+        self.assertIsNone(BorrowedBooks.objects.get(id=loan_id).return_date)
+
+        # Borrowed on 2022-01-30 (self.borrow)
+        response = self.client.put(url, {"return_date": "2022-01-29"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("return_date", response.data["errors"])
+        self.assertIsNone(BorrowedBooks.objects.get(id=loan_id).return_date)
+        self.assertEqual(BookCirculation.objects.get(book=self.book).loan_days, 0)
+        response = self.client.put(url, {"return_date": "2022-01-30"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_delete_missing_loan(self):
+        response = self.client.delete(reverse('delete-borrowed-book', args=[999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_create_book_starts_with_all_copies_available(self):
+        data = {"title": "New", "isbn": "555", "published_date": "2022-01-30", "genre": "Fiction", "copies": 3}
+        response = self.client.post(reverse('create-book'), data, format='json')
+        self.assertEqual(response.data["data"]["available_copies"], 3)
+
+
+class CheckoutConcurrencyTestCase(TransactionTestCase):
+    def test_concurrent_checkouts_never_oversell(self):
+        out = io.StringIO()
+        call_command('stress_checkout', copies=5, workers=8, attempts=5, stdout=out)
+        self.assertIn("No copy was lent twice", out.getvalue())
+
+    def test_concurrent_checkouts_returns_and_deletes_do_not_deadlock(self):
+        if connection.vendor == 'sqlite':
+            self.skipTest("Concurrent writers need PostgreSQL.")
+        book = Book.objects.create(title="The Great Adventure", published_date="2022-01-30", genre="Fiction", isbn="123457890", copies=3, available_copies=3)
+        users = [CustomUser.objects.create(name=f"User {i}", email=f"user{i}@example.com") for i in range(8)]
+
+        def circulate(user):
+            try:
+                for attempt in range(10):
+                    serializer = BorrowedBooksSerializer(data={"userID": user.userID, "bookID": book.bookID, "borrow_date": "2022-01-01"})
+                    serializer.is_valid(raise_exception=True)
+                    try:
+                        loan = circulation.checkout(serializer)
+                    except circulation.NoCopiesAvailable:
+                        continue
+                    if attempt % 2:
+                        circulation.delete_loan(loan.id)
+                    else:
+                        circulation.set_return_date(loan.id, datetime.date(2022, 1, 5))
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(users)) as pool:
+            # Re-raises the first failure, e.g. a deadlock
+            list(pool.map(circulate, users))
+
+        book.refresh_from_db()
+        self.assertEqual(book.available_copies, 3)
+        self.assertEqual(BorrowedBooks.objects.filter(return_date__isnull=True).count(), 0)
+        incremental = stats.snapshot()
+        stats.rebuild()
+        self.assertEqual(incremental, stats.snapshot())
+
+
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        self.book = Book.objects.create(title="The Great Adventure", published_date="2022-01-30", genre="comedy", isbn="123457890")
+        self.details = BookDetails.objects.create(bookID=self.book, number_of_pages=300, publisher="Penguin Books", language="English")
+
+    def assert_revalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        return etag
+
+    def test_get_book_by_id_not_modified(self):
+        url = reverse('get-book-by-id', args=[self.book.bookID])
+        etag = self.assert_revalidates(url)
+        # One query for the book; the serializer never runs
+        with self.assertNumQueries(1):
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.book.title = "Updated Title"
+        self.book.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_checkout_changes_book_etag(self):
+        url = reverse('get-book-by-id', args=[self.book.bookID])
+        etag = self.assert_revalidates(url)
+        self.client.post(reverse('borrow-book'), {"userID": self.user.userID, "bookID": self.book.bookID, "borrow_date": "2022-01-30"}, format='json')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_get_user_by_id_if_modified_since(self):
+        url = reverse('get-user-by-id', args=[self.user.userID])
+        response = self.client.get(url)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_get_book_details_by_id_not_modified(self):
+        url = reverse('get-book-details-by-id', args=[self.details.detailsID])
+        etag = self.assert_revalidates(url)
+        self.details.language = "Nepali"
+        self.details.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_list_books_uses_catalog_version(self):
+        url = reverse('list-books')
+        etag = self.assert_revalidates(url)
+        # Version lookup only: no COUNT(*), no page query, no serializer
+        with self.assertNumQueries(1):
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        # Different query parameters are different representations
+        self.assertEqual(self.client.get(url, {"expand": "details"}, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+        Book.objects.create(title="Another", published_date="2022-01-30", genre="comedy", isbn="999")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_checkout_changes_list_etag_without_bumping_the_version(self):
+        url = reverse('list-books')
+        etag = self.assert_revalidates(url)
+        version = CatalogVersion.current(CatalogVersion.BOOKS)[0]
+        self.client.post(reverse('borrow-book'), {"userID": self.user.userID, "bookID": self.book.bookID, "borrow_date": "2022-01-30"}, format='json')
+        self.assertEqual(CatalogVersion.current(CatalogVersion.BOOKS)[0], version)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"]["data"][0]["available_copies"], 0)
+
+    def test_loan_expansions_are_not_validated(self):
+        self.client.post(reverse('borrow-book'), {"userID": self.user.userID, "bookID": self.book.bookID, "borrow_date": "2022-01-01"}, format='json')
+        for url in (reverse('list-books'), reverse('get-book-by-id', args=[self.book.bookID])):
+            response = self.client.get(url, {"expand": "borrowed_books"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("ETag", response)
+            self.assertNotIn("Last-Modified", response)
+
+        # Fines change without touching the book, and show up straight away
+        overdue.assess(as_of=datetime.date(2022, 2, 1))
+        response = self.client.get(reverse('get-book-by-id', args=[self.book.bookID]), {"expand": "borrowed_books"}, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertNotEqual(response.data["borrowed_books"][0]["fine"], "0.00")
+
+
+class ExportTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password", is_staff=True)
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        self.book = Book.objects.create(title="The Great Adventure", published_date="2022-01-30", genre="comedy", isbn="123457890")
+        BookDetails.objects.create(bookID=self.book, number_of_pages=300, publisher="Penguin Books", language="English")
+        Book.objects.create(title="Mystery of the Lost Key", published_date="2022-01-30", genre="romantic", isbn="09854321")
+        BorrowedBooks.objects.create(userID=self.user, bookID=self.book, borrow_date="2022-01-30")
+
+    def test_export_books_ndjson(self):
+        response = self.client.get(reverse('export-resource', args=['books']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["isbn"] for row in rows], ["123457890", "09854321"])
+        self.assertEqual(rows[0]["publisher"], "Penguin Books")
+        self.assertEqual(rows[0]["published_date"], "2022-01-30")
+        self.assertIsNone(rows[1]["publisher"])
+
+    def test_export_users_csv_has_no_passwords(self):
+        response = self.client.get(reverse('export-resource', args=['users']), {"output": "csv"})
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual(rows[0]["email"], "john.doe@example.com")
+        self.assertNotIn("password", rows[0])
+
+    def test_export_loans_gzip(self):
+        response = self.client.get(reverse('export-resource', args=['loans']), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response["Content-Encoding"], 'gzip')
+        body = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertEqual(json.loads(body)["bookID"], self.book.bookID)
+        self.assertIs(json.loads(body)["archived"], False)
+
+    def test_export_loans_includes_archived_loans(self):
+        ArchivedLoan.objects.create(id=999, userID=self.user, bookID=self.book, borrow_date="2020-01-01", return_date="2020-01-10", due_date="2020-01-15")
+        for output in ('ndjson', 'csv'):
+            response = self.client.get(reverse('export-resource', args=['loans']), {"output": output})
+            body = b"".join(response.streaming_content).decode()
+            if output == 'csv':
+                rows = [(int(row["id"]), row["archived"]) for row in csv.DictReader(io.StringIO(body))]
+                self.assertEqual(rows[-1], (999, "True"))
+            else:
+                rows = [json.loads(line) for line in body.splitlines()]
+                self.assertEqual([(row["id"], row["archived"]) for row in rows][-1], (999, True))
+                self.assertEqual(rows[-1]["return_date"], "2020-01-10")
+            self.assertEqual(len(rows), 2)
+
+    def test_export_honours_accept_encoding_q_values(self):
+        url = reverse('export-resource', args=['loans'])
+        for header, compressed in (("gzip;q=0", False), ("gzip;q=0.5, br", True), ("br, *;q=0.1", True), ("identity, gzip;q=0, *", False), ("deflate", False)):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(response.get("Content-Encoding") == 'gzip', compressed, header)
+
+    def test_export_unknown_resource(self):
+        response = self.client.get(reverse('export-resource', args=['secrets']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_export_data_command(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv.gz', delete=False) as handle:
+            pass
+        self.addCleanup(os.remove, handle.name)
+        call_command('export_data', 'books', format='csv', output=handle.name, gzip=True, chunk_size=1, stderr=io.StringIO())
+        with gzip.open(handle.name, 'rt') as exported:
+            rows = list(csv.DictReader(exported))
+        self.assertEqual(len(rows), 2)
+
+
+class AsyncReadViewsTestCase(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(name="John Doe", email="john.doe@example.com", password="password123")
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        for i in range(12):
+            Book.objects.create(title=f"Book {i}", isbn=f"97800000{i:02d}", published_date="2022-01-30", genre="Fiction", copies=2, available_copies=2)
+        self.book = Book.objects.order_by('bookID').first()
+        BookDetails.objects.create(bookID=self.book, number_of_pages=300, publisher="Penguin Books", language="English")
+        self.loan = BorrowedBooks.objects.create(userID=self.user, bookID=self.book, borrow_date="2022-01-30")
+
+    def assertSameResponse(self, sync_url, async_url):
+        sync_response = self.client.get(sync_url)
+        async_response = self.client.get(async_url)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        # Pagination links point back at the endpoint that served the page
+        self.assertEqual(async_response.content.replace(b'/api/async/', b'/api/'), sync_response.content)
+        return async_response
+
+    def test_bodies_match_sync_views(self):
+        self.assertSameResponse(reverse('list-users'), reverse('async-list-users'))
+        self.assertSameResponse(reverse('get-user-by-id', args=[self.user.userID]), reverse('async-get-user-by-id', args=[self.user.userID]))
+        self.assertSameResponse(reverse('get-borrowed-book-by-id', args=[self.loan.id]), reverse('async-get-borrowed-book-by-id', args=[self.loan.id]))
+        for query in ("", "?page=2", "?expand=details,borrowed_books", "?expand=bogus", "?page=9"):
+            self.assertSameResponse(reverse('list-books') + query, reverse('async-list-books') + query)
+            self.assertSameResponse(reverse('get-book-by-id', args=[self.book.bookID]) + query, reverse('async-get-book-by-id', args=[self.book.bookID]) + query)
+
+    def test_missing_objects(self):
+        self.assertSameResponse(reverse('get-book-by-id', args=[999]), reverse('async-get-book-by-id', args=[999]))
+        self.assertSameResponse(reverse('get-user-by-id', args=[999]), reverse('async-get-user-by-id', args=[999]))
+        self.assertSameResponse(reverse('get-borrowed-book-by-id', args=[999]), reverse('async-get-borrowed-book-by-id', args=[999]))
+
+    def test_requires_token(self):
+        self.client.credentials()
+        response = self.client.get(reverse('async-list-books'))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(HTTP_AUTHORIZATION='Token not-a-token')
+        self.assertEqual(self.client.get(reverse('async-list-books')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_malformed_token_headers_match_sync_views(self):
+        cases = (
+            ('Token', "Invalid token header. No credentials provided."),
+            ('Token two parts', "Invalid token header. Token string should not contain spaces."),
+            ('Token \xe9t\xe9', "Invalid token header. Token string should not contain invalid characters."),
+        )
+        for header, detail in cases:
+            with self.subTest(header=header):
+                self.client.credentials(HTTP_AUTHORIZATION=header)
+                response = self.assertSameResponse(reverse('list-books'), reverse('async-list-books'))
+                self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+                self.assertEqual(response.json(), {"detail": detail})
+
+    def test_rejects_writes(self):
+        response = self.client.post(reverse('async-get-book-by-id', args=[self.book.bookID]))
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    def test_conditional_get(self):
+        url = reverse('async-get-book-by-id', args=[self.book.bookID])
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_served_as_coroutine(self):
+        headers = {"Authorization": f"Token {self.token.key}"}
+        response = await self.async_client.get(reverse('async-get-book-by-id', args=[self.book.bookID]), {"expand": "details"}, headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["details"]["publisher"], "Penguin Books")
+
+        response = await self.async_client.get(reverse('async-list-books'), headers=headers)
+        self.assertEqual(response.json()["count"], 12)
+
+
+class ValuesSerializerTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        CustomUser.objects.create(name="Jane Doe", email="jane.doe@example.com", password="test_password")
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        for i in range(3):
+            Book.objects.create(title=f"Book {i}", isbn=f"97800000{i:02d}", published_date="2022-01-30", genre="Fiction")
+        BorrowedBooks.objects.create(userID=self.user, bookID=Book.objects.first(), borrow_date="2022-01-30")
+
+    def assertRendersLikeModelSerializer(self, serializer_class, queryset):
+        rows = lean.ValuesSerializer(serializer_class)
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        self.assertEqual(JSONRenderer().render(rows.serialize(rows.values(queryset))), expected)
+
+    def test_matches_model_serializers(self):
+        self.assertRendersLikeModelSerializer(BookSerializer, Book.objects.order_by('-bookID'))
+        self.assertRendersLikeModelSerializer(CustomUserSerializer, CustomUser.objects.order_by('-userID'))
+        self.assertRendersLikeModelSerializer(BorrowedBooksSerializer, BorrowedBooks.objects.order_by('id'))
+
+    def test_matches_in_active_timezone(self):
+        with timezone.override('Asia/Kathmandu'):
+            self.assertRendersLikeModelSerializer(BookSerializer, Book.objects.order_by('-bookID'))
+
+    def test_rejects_nested_fields(self):
+        class BookWithDetailsSerializer(ExpandableBookSerializer):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, expand={'details'}, **kwargs)
+
+        with self.assertRaises(ValueError):
+            lean.ValuesSerializer(BookWithDetailsSerializer)
+
+    def test_list_endpoints_use_values_rows(self):
+        response = self.client.get(reverse('list-books'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book["title"] for book in response.data["results"]["data"]], ["Book 2", "Book 1", "Book 0"])
+        response = self.client.get(reverse('list-users'), {"pagination": "cursor"})
+        self.assertEqual([user["name"] for user in response.data["results"]["data"]], ["Jane Doe", "John Doe"])
+
+
+class DatabaseJSONContractTestCase(APITestCase):
+    """
+    The 'database' and 'python' list/export strategies must produce the same payloads.
+    """
+    def setUp(self):
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password", is_staff=True)
+        CustomUser.objects.create(name="Zoë Ñandú", email="zoe@example.com", password="test_password")
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        for i in range(12):
+            Book.objects.create(title=f"Book \"{i}\" ✓", isbn=f"97800000{i:02d}", published_date="2022-01-30", genre="Fiction", copies=2, available_copies=2)
+        self.book = Book.objects.order_by('bookID').first()
+        BookDetails.objects.create(bookID=self.book, number_of_pages=300, publisher="Penguin Books", language="English")
+        BorrowedBooks.objects.create(userID=self.user, bookID=self.book, borrow_date="2022-01-30")
+        # isoformat() drops the fraction for whole seconds; the SQL must as well
+        Book.objects.filter(pk=self.book.pk).update(modified_at=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))
+
+    def get_both(self, url, params=None):
+        responses = {}
+        for strategy in ('python', 'database'):
+            with override_settings(LMS_LIST_JSON_STRATEGY=strategy):
+                responses[strategy] = self.client.get(url, params or {})
+        return responses['python'], responses['database']
+
+    def assertSamePayload(self, url, params=None):
+        python_response, database_response = self.get_both(url, params)
+        self.assertEqual(database_response.status_code, python_response.status_code)
+        self.assertEqual(json.loads(database_response.content), json.loads(python_response.content))
+        return database_response
+
+    def test_list_pages(self):
+        for page in (1, 2):
+            self.assertSamePayload(reverse('list-books'), {"page": page})
+        self.assertSamePayload(reverse('list-users'))
+        self.assertSamePayload(reverse('list-books'), {"page": 5})
+
+    def test_empty_list(self):
+        BorrowedBooks.objects.all().delete()
+        Book.objects.all().delete()
+        self.assertSamePayload(reverse('list-books'))
+
+    def test_exports(self):
+        for resource in ('books', 'users', 'loans'):
+            python_response, database_response = self.get_both(reverse('export-resource', args=[resource]))
+            python_rows = [json.loads(line) for line in b"".join(python_response.streaming_content).splitlines()]
+            database_rows = [json.loads(line) for line in b"".join(database_response.streaming_content).splitlines()]
+            self.assertEqual(database_rows, python_rows)
+
+    def test_python_strategy_keeps_cursor_pages_and_expand(self):
+        self.assertSamePayload(reverse('list-books'), {"pagination": "cursor"})
+        self.assertSamePayload(reverse('list-books'), {"expand": "details"})
+
+    def test_database_builds_the_array(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("Database-side JSON needs PostgreSQL.")
+        python_response, database_response = self.get_both(reverse('list-books'))
+        # json_build_object writes `"key" : value`, DRF writes `"key":value`
+        self.assertIn(b'"bookID" : ', database_response.content)
+        self.assertNotIn(b'"bookID" : ', python_response.content)
+
+    def test_falls_back_to_python(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest("Only other databases fall back.")
+        python_response, database_response = self.get_both(reverse('list-books'))
+        self.assertEqual(database_response.content, python_response.content)
+
+
+class BookFilterTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, created = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+        self.dune = Book.objects.create(title="Dune", isbn="1000000001", published_date="1965-08-01", genre="Science Fiction")
+        self.emma = Book.objects.create(title="Emma", isbn="1000000002", published_date="1815-12-23", genre="Romance", copies=1, available_copies=0)
+        self.neuromancer = Book.objects.create(title="Neuromancer", isbn="1000000003", published_date="1984-07-01", genre="Science Fiction")
+        BookDetails.objects.create(bookID=self.dune, number_of_pages=412, publisher="Chilton Books", language="English")
+        BookDetails.objects.create(bookID=self.emma, number_of_pages=474, publisher="John Murray", language="English")
+        BookDetails.objects.create(bookID=self.neuromancer, number_of_pages=271, publisher="Ace", language="Spanish")
+
+    def titles(self, params):
+        response = self.client.get(reverse('list-books'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book["title"] for book in response.data["results"]["data"]]
+
+    def test_filters(self):
+        self.assertEqual(self.titles({"genre": "Science Fiction"}), ["Neuromancer", "Dune"])
+        self.assertEqual(self.titles({"published_date_after": "1900-01-01", "published_date_before": "1970-12-31", "ordering": "published_date"}), ["Dune"])
+        self.assertEqual(self.titles({"language": "English"}), ["Emma", "Dune"])
+        self.assertEqual(self.titles({"publisher": "Ace"}), ["Neuromancer"])
+        self.assertEqual(self.titles({"available": "true"}), ["Neuromancer", "Dune"])
+        self.assertEqual(self.titles({"available": "false"}), ["Emma"])
+        self.assertEqual(self.titles({"genre": "Science Fiction", "language": "English"}), ["Dune"])
+
+    def test_ordering(self):
+        self.assertEqual(self.titles({"ordering": "title"}), ["Dune", "Emma", "Neuromancer"])
+        self.assertEqual(self.titles({"ordering": "-published_date"}), ["Neuromancer", "Dune", "Emma"])
+        self.assertEqual(self.titles({"ordering": "published_date", "pagination": "cursor"}), ["Emma", "Dune", "Neuromancer"])
+
+    def test_invalid_parameters(self):
+        response = self.client.get(reverse('list-books'), {"ordering": "isbn"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("ordering", response.data["error"])
+        response = self.client.get(reverse('list-books'), {"published_date_after": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unindexed_combinations_are_rejected(self):
+        for params in (
+            {"language": "English", "ordering": "title"},
+            {"publisher": "Ace", "ordering": "-published_date"},
+            {"published_date_after": "1900-01-01"},
+            {"published_date_after": "1900-01-01", "ordering": "title"},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('list-books'), params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn("ordering", response.data["error"])
+        # A genre or availability filter brings its own index for any ordering
+        self.assertEqual(self.titles({"genre": "Science Fiction", "language": "English", "ordering": "title"}), ["Dune"])
+        self.assertEqual(self.titles({"available": "false", "published_date_after": "1800-01-01"}), ["Emma"])
+
+    def test_async_list_filters(self):
+        response = self.client.get(reverse('async-list-books'), {"genre": "Science Fiction", "ordering": "title"})
+        self.assertEqual([book["title"] for book in response.json()["results"]["data"]], ["Dune", "Neuromancer"])
+
+    def test_filter_and_ordering_plans_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("Query plan assertions are written for SQLite.")
+        # (query string, index, whether the index also returns rows in order)
+        cases = [
+            ("genre=Romance", "lms_book_genre_id", True),
+            ("genre=Romance&ordering=title", "lms_book_genre_title", True),
+            ("genre=Romance&ordering=-title", "lms_book_genre_title", True),
+            ("genre=Romance&ordering=published_date", "lms_book_genre_published", True),
+            ("ordering=title", "lms_book_title", True),
+            ("ordering=-published_date", "lms_book_published", True),
+            ("published_date_after=1900-01-01&ordering=published_date", "lms_book_published", True),
+            ("published_date_after=1900-01-01&published_date_before=1970-12-31&ordering=-published_date", "lms_book_published", True),
+            ("available=true", "lms_book_available_id", True),
+            ("available=true&ordering=title", "lms_book_available_title", True),
+            ("available=true&ordering=-published_date", "lms_book_available_published", True),
+            ("available=false", "lms_book_unavailable_id", True),
+            ("available=false&ordering=title", "lms_book_unavailable_title", True),
+            ("available=false&ordering=-published_date", "lms_book_unavailable_published", True),
+            ("language=English", "lms_details_language", True),
+            ("publisher=Ace&ordering=bookID", "lms_details_publisher", True),
+            ("language=English&publisher=Ace", "lms_details_", True),
+            # Combinations seek on the genre index; the planner may sort the
+            # (already narrowed) rows rather than walk the whole genre in order
+            ("genre=Romance&language=English", "lms_book_genre_", False),
+            ("genre=Romance&published_date_after=1900-01-01&ordering=title", "lms_book_genre_", False),
+            ("genre=Romance&published_date_after=1900-01-01", "lms_book_genre_", False),
+            ("available=true&published_date_after=1900-01-01&ordering=published_date", "lms_book_available_published", True),
+            ("available=false&language=English", "lms_", True),
+        ]
+        for query, index, ordered in cases:
+            with self.subTest(query=query):
+                filterset = BookFilter(QueryDict(query), queryset=Book.objects.order_by('-bookID'))
+                self.assertTrue(filterset.is_valid(), filterset.errors)
+                plan = filterset.qs.explain()
+                self.assertIn(index, plan)
+                if ordered:
+                    self.assertNotIn("TEMP B-TREE", plan)
+
+
+class CirculationStatsTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.alice = CustomUser.objects.create(name="Alice Doe", email="alice@example.com", password="another_password")
+        self.novel = Book.objects.create(title="The Great Adventure", published_date="2022-01-30", genre="Fiction", isbn="123457890", copies=3, available_copies=3)
+        self.atlas = Book.objects.create(title="World Atlas", published_date="2020-05-01", genre="Reference", isbn="123457891", copies=2, available_copies=2)
+
+    def borrow(self, user, book, borrow_date="2022-01-01"):
+        response = self.client.post(reverse('borrow-book'), {"userID": user.userID, "bookID": book.bookID, "borrow_date": borrow_date}, format='json')
+        return response.data["data"]["id"]
+
+    def give_back(self, loan_id, return_date):
+        self.client.put(reverse('return-borrowed-book', args=[loan_id]), {"return_date": return_date}, format='json')
+
+    def assert_matches_rebuild(self):
+        incremental = stats.snapshot()
+        call_command('rebuild_circulation_stats', chunk_size=1, stdout=io.StringIO())
+        self.assertEqual(incremental, stats.snapshot())
+
+    def test_stats_follow_loans_returns_and_deletes(self):
+        first = self.borrow(self.user, self.novel)
+        second = self.borrow(self.alice, self.novel)
+        third = self.borrow(self.alice, self.atlas)
+        self.give_back(first, "2022-01-11")
+        self.give_back(second, "2022-01-05")
+        # Changing a return date and re-opening a loan
+        self.give_back(first, "2022-01-21")
+        self.give_back(second, None)
+        self.client.delete(reverse('delete-borrowed-book', args=[third]))
+
+        response = self.client.get(reverse('circulation-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data["data"]
+        self.assertEqual((data["total_loans"], data["open_loans"], data["returned_loans"]), (2, 1, 1))
+        self.assertEqual(data["active_borrowers"], 1)
+        self.assertEqual(data["average_loan_days"], 20)
+        self.assertEqual(data["loans_per_genre"], [{"genre": "Fiction", "total_loans": 2, "open_loans": 1}])
+        self.assertEqual(data["most_borrowed_books"], [{"bookID": self.novel.bookID, "title": self.novel.title, "total_loans": 2, "open_loans": 1}])
+        self.assert_matches_rebuild()
+
+    def test_stats_follow_genre_changes_and_deletes(self):
+        self.borrow(self.user, self.novel)
+        returned = self.borrow(self.alice, self.novel)
+        self.give_back(returned, "2022-01-08")
+        self.borrow(self.alice, self.atlas)
+        data = {"title": self.novel.title, "isbn": self.novel.isbn, "published_date": "2022-01-30", "genre": "Adventure", "copies": 3}
+        self.client.put(reverse('update-book', args=[self.novel.bookID]), data, format='json')
+        self.assert_matches_rebuild()
+
+        self.client.delete(reverse('delete-user', args=[self.alice.userID]))
+        self.assertEqual(stats.snapshot()["active_borrowers"], 1)
+        self.assert_matches_rebuild()
+
+        self.client.delete(reverse('delete-book', args=[self.novel.bookID]))
+        self.assertEqual(stats.snapshot()["total_loans"], 0)
+        self.assert_matches_rebuild()
+
+    @override_settings(LMS_STATS_SHARDS=2)
+    def test_loans_of_different_books_update_different_shards(self):
+        self.borrow(self.user, self.novel)
+        self.borrow(self.alice, self.atlas)
+        self.assertEqual(CirculationTotals.objects.count(), 2)
+        self.assertEqual(GenreCirculation.objects.values('shard').distinct().count(), 2)
+        self.assertEqual(stats.snapshot()["active_borrowers"], 2)
+        self.assert_matches_rebuild()
+
+    def test_rebuild_counts_loans_written_directly(self):
+        BorrowedBooks.objects.create(userID=self.alice, bookID=self.atlas, borrow_date="2022-01-01", return_date="2022-01-04")
+        call_command('rebuild_circulation_stats', stdout=io.StringIO())
+        self.assertEqual(stats.snapshot()["average_loan_days"], 3)
+        # Deleting a loan the tables never saw cannot push a count below zero
+        BorrowedBooks.objects.create(userID=self.alice, bookID=self.novel, borrow_date="2022-01-01")
+        unseen = BorrowedBooks.objects.get(bookID=self.novel)
+        self.client.delete(reverse('delete-borrowed-book', args=[unseen.id]))
+        self.assertEqual(stats.snapshot()["open_loans"], 0)
+
+    def test_stats_endpoint_reads_a_fixed_number_of_queries(self):
+        for book in (self.novel, self.atlas):
+            self.borrow(self.user, book)
+        # Totals, genres and top books; the token is already cached by the borrows
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('circulation-stats'), {"top": 1})
+        self.assertEqual(len(response.data["data"]["most_borrowed_books"]), 1)
+        self.assertEqual(self.client.get(reverse('circulation-stats'), {"top": "x"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('circulation-stats'), {"top": stats.MAX_TOP + 1}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(LMS_LOAN_DAYS=14, LMS_FINE_PER_DAY='0.25', LMS_FINE_CAP='2.00')
+class OverdueTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.book = Book.objects.create(title="The Great Adventure", published_date="2022-01-30", genre="comedy", isbn="123457890", copies=10, available_copies=10)
+
+    def loan(self, due_date, return_date=None):
+        return BorrowedBooks.objects.create(userID=self.user, bookID=self.book, borrow_date="2022-01-01", due_date=due_date, return_date=return_date)
+
+    def fines(self):
+        return list(BorrowedBooks.objects.order_by('id').values_list('fine', flat=True))
+
+    def test_due_date_defaults_to_loan_period(self):
+        response = self.client.post(reverse('borrow-book'), {"userID": self.user.userID, "bookID": self.book.bookID, "borrow_date": "2022-01-30"}, format='json')
+        self.assertEqual(response.data["data"]["due_date"], "2022-02-13")
+        self.assertEqual(response.data["data"]["fine"], "0.00")
+
+        data = {"userID": self.user.userID, "bookID": self.book.bookID, "borrow_date": "2022-01-30", "due_date": "2022-01-29"}
+        self.assertEqual(self.client.post(reverse('borrow-book'), data, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_assess_fines_open_overdue_loans(self):
+        self.loan("2022-03-02")                                # due today
+        self.loan("2022-02-27")                                # 3 days late
+        self.loan("2022-01-15")                                # capped
+        self.loan("2022-01-15", return_date="2022-01-16")      # returned, left alone
+        out = io.StringIO()
+        call_command('assess_overdue_loans', '--date=2022-03-02', '--chunk-size=2', stdout=out)
+        self.assertIn("Assessed 3 open loans as of 2022-03-02: 2 overdue, 2 fines changed", out.getvalue())
+        self.assertEqual(self.fines(), [Decimal("0.00"), Decimal("0.75"), Decimal("2.00"), Decimal("0.00")])
+
+        out = io.StringIO()
+        call_command('assess_overdue_loans', '--date=2022-03-02', stdout=out)
+        self.assertIn("already assessed", out.getvalue())
+
+    def test_interrupted_run_resumes_after_last_chunk(self):
+        loans = [self.loan("2022-02-27") for _ in range(5)]
+
+        def interrupt(result):
+            raise KeyboardInterrupt
+        with self.assertRaises(KeyboardInterrupt):
+            overdue.assess(datetime.date(2022, 3, 2), chunk_size=2, progress=interrupt)
+        self.assertEqual(self.fines(), [Decimal("0.75")] * 2 + [Decimal("0.00")] * 3)
+
+        result = overdue.assess(datetime.date(2022, 3, 2), chunk_size=2)
+        self.assertEqual(result["resumed_after"], loans[1].id)
+        self.assertEqual(result["loans"], 3)
+        self.assertEqual(self.fines(), [Decimal("0.75")] * 5)
+
+    def test_return_settles_fine(self):
+        loan = self.loan("2022-01-15")
+        response = self.client.put(reverse('return-borrowed-book', args=[loan.id]), {"return_date": "2022-01-19"}, format='json')
+        self.assertEqual(response.data["data"]["fine"], "1.00")
+
+
+class SeedDataTestCase(APITestCase):
+    def seeded(self):
+        loans = BorrowedBooks.objects.order_by('id').values_list('userID__email', 'bookID__isbn', 'borrow_date', 'return_date', 'fine')
+        books = Book.objects.order_by('bookID').values_list('title', 'genre', 'copies', 'details__publisher')
+        return list(books), list(loans)
+
+    def test_same_seed_gives_same_dataset(self):
+        out = io.StringIO()
+        call_command('seed_data', '--users=30', '--books=20', '--loans=400', '--as-of=2024-06-30', '--batch-size=64', '--workers=1', stdout=out)
+        self.assertIn("Seeded 30 users, 20 books with details and 400 loans", out.getvalue())
+        first = self.seeded()
+
+        with self.assertRaises(ValueError):
+            seed.generate(1, 1, 1)
+        BorrowedBooks.objects.all().delete()
+        Book.objects.all().delete()
+        CustomUser.objects.all().delete()
+        seed.generate(30, 20, 400, as_of=datetime.date(2024, 6, 30), batch_size=64)
+        self.assertEqual(self.seeded(), first)
+
+    def test_dataset_is_skewed_and_consistent(self):
+        seed.generate(50, 100, 3000, seed=7, as_of=datetime.date(2024, 6, 30))
+        per_book = sorted(BorrowedBooks.objects.values('bookID').annotate(n=Count('id')).values_list('n', flat=True), reverse=True)
+        self.assertGreater(per_book[0], 10 * per_book[len(per_book) // 2])
+
+        for book in Book.objects.annotate(open=Count('borrowed_books', filter=Q(borrowed_books__return_date__isnull=True))):
+            self.assertEqual(book.available_copies, book.copies - book.open)
+        self.assertEqual(BookDetails.objects.count(), 100)
+        self.assertEqual(stats.snapshot()["total_loans"], 3000)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class EndpointBenchmarkTestCase(APITestCase):
+    def test_every_route_is_benchmarked(self):
+        self.assertCountEqual(benchmarks.route_names(), [endpoint.url_name for endpoint in benchmarks.ENDPOINTS])
+
+    def test_endpoints_stay_within_query_budgets(self):
+        seed.generate(20, 20, 200, as_of=datetime.date(2024, 6, 30))
+        results = benchmarks.run_in_process(self.client, benchmarks.Fixture.create(), requests=2, warmup=1)
+
+        self.assertEqual(len(results), len(benchmarks.ENDPOINTS))
+        for result in results:
+            # Latency is left to the benchmark_endpoints command; test machines vary too much
+            self.assertEqual(result["errors"], 0, result)
+            self.assertLessEqual(result["queries"], result["budget"]["queries"], result)
+
+    def test_command_writes_results_and_fails_over_budget(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bench.json")
+            call_command('benchmark_endpoints', '--requests=3', '--endpoint=get-book-by-id', f'--output={path}', stdout=io.StringIO())
+            with open(path) as handle:
+                results = json.load(handle)["results"]
+        self.assertEqual([result["endpoint"] for result in results], ["get-book-by-id"])
+        self.assertEqual(results[0]["requests"], 3)
+        self.assertFalse(Book.objects.exists())  # rolled back
+
+        results[0]["queries"] = 2
+        self.assertEqual(benchmarks.over_budget(results), ["get-book-by-id: 2 queries, budget 1"])
+
+
+@override_settings(LMS_PROFILING_SAMPLE_RATE=1.0, LMS_PROFILING_DUPLICATE_QUERIES=True)
+class ProfilingTestCase(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = CustomUser.objects.create(name="Profiled", email="profiled@example.com", password='!')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        Book.objects.create(title="Book", isbn="P1", published_date="2020-01-01", genre="Fiction")
+
+    def test_profiled_request_has_server_timing_and_log_line(self):
+        for url, rendered in ((reverse('list-books'), True), (reverse('async-list-books'), False)):
+            with self.assertLogs('lms.profiling', level='INFO') as logs:
+                response = self.client.get(url)
+            line = json.loads(logs.records[0].getMessage())
+            self.assertEqual(line["status"], 200)
+            self.assertGreater(line["queries"], 0)
+            self.assertEqual(line["duplicate_queries"], [])
+            self.assertIn(f'db;dur={line["db_ms"]};desc="{line["queries"]} queries"', response['Server-Timing'])
+            self.assertIn(f'total;dur={line["total_ms"]}', response['Server-Timing'])
+            self.assertIsNotNone(line["view_ms"])
+            self.assertIn(f'serialize;dur={line["serialize_ms"]}', response['Server-Timing'])
+            # DRF renders the sync view's body; the async view encodes its own
+            self.assertEqual(line["render_ms"] is not None, rendered)
+            self.assertEqual('render;dur=' in response['Server-Timing'], rendered)
+
+    def test_serializer_time_is_reported_apart_from_the_view(self):
+        book = Book.objects.get()
+        with self.assertLogs('lms.profiling', level='INFO') as logs:
+            response = self.client.get(reverse('get-book-by-id', args=[book.bookID]))
+        line = json.loads(logs.records[0].getMessage())
+        self.assertGreater(line["serialize_ms"], 0)
+        self.assertIn('view;dur=', response['Server-Timing'])
+
+        profile = profiling.RequestProfile()
+        profile.view_started = profile.started
+        token = profiling._current.set(profile)
+        try:
+            BookSerializer([book], many=True).data
+        finally:
+            profiling._current.reset(token)
+        self.assertFalse(profile.serializing)
+        self.assertGreater(profile.serialize_time, 0)
+        timings = profile.timings(profile.started + profile.serialize_time)
+        self.assertEqual(timings["view"], 0)
+
+    @override_settings(LMS_PROFILING_SAMPLE_RATE=0.0)
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('list-books'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_duplicate_query_signatures(self):
+        profile = profiling.RequestProfile(capture_duplicates=True)
+        profile.add_query('SELECT 1 FROM book WHERE id IN (%s, %s)', 0.001)
+        profile.add_query('SELECT 1 FROM book WHERE id IN (%s, %s, %s)', 0.001)
+        profile.add_query('SELECT 1 FROM user WHERE id = %s', 0.001)
+        self.assertEqual(profile.duplicates(), [{"sql": 'SELECT 1 FROM book WHERE id IN (%s)', "count": 2}])
+        self.assertEqual(profile.timings(profile.started)["db"], 3.0)
+
+
+def create_test_database(alias):
+    """
+    Add a database `alias` configured like the test "default" one but separate
+    from it, create it, and return a function that destroys and removes it.
+    """
+    default = connections[DEFAULT_DB_ALIAS].settings_dict
+    # Also adds it to settings.DATABASES, which is the same dict
+    connections.settings[alias] = {**default, 'TEST': {**default['TEST'], 'NAME': None}}
+    creation = connections[alias].creation
+    old_name = creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+    def destroy():
+        creation.destroy_test_db(old_name, verbosity=0)
+        del connections[alias]
+        del connections.settings[alias]
+    return destroy
+
+
+@override_settings(LMS_READ_REPLICAS=['replica'], LMS_REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTestCase(TransactionTestCase):
+    # "replica" is a separate database that only sees the rows copied to it,
+    # like a replica lagging behind the primary. It only exists while this test
+    # case runs, so the test runner must not see it in `databases`.
+    @classmethod
+    def setUpClass(cls):
+        cls.addClassCleanup(create_test_database('replica'))
+        cls.databases = {'default', 'replica'}
+        super().setUpClass()
+
+    def setUp(self):
+        token_cache.clear()
+        self.client = APIClient()
+        self.user = CustomUser.objects.create(name="Reader", email="reader@example.com", password='!')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+
+        self.book = Book.objects.create(title="Primary Title", isbn="R1", published_date="2020-01-01", genre="Fiction", copies=2, available_copies=2)
+        stale = Book.objects.get(pk=self.book.pk)
+        stale.title = "Replica Title"
+        Book.objects.using('replica').bulk_create([stale])
+
+    def title(self, url_name='get-book-by-id'):
+        return self.client.get(reverse(url_name, args=[self.book.pk])).json()["title"]
+
+    def test_reads_go_to_replica_until_the_client_writes(self):
+        self.assertEqual(self.title(), "Replica Title")
+        self.assertEqual(self.title('async-get-book-by-id'), "Replica Title")
+
+        data = {"title": "Updated Title", "isbn": "R1", "published_date": "2020-01-01", "genre": "Fiction", "copies": 2}
+        response = self.client.put(reverse('update-book', args=[self.book.pk]), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.cookies[replicas.PIN_COOKIE]['max-age'], 5)
+        self.assertEqual(Book.objects.using('replica').get(pk=self.book.pk).title, "Replica Title")
+
+        # Pinned to the primary: the client reads its own write
+        self.assertEqual(self.title(), "Updated Title")
+        self.assertEqual(self.title('async-get-book-by-id'), "Updated Title")
+
+        # Once the pin expires, reads go back to the replica
+        del self.client.cookies[replicas.PIN_COOKIE]
+        self.assertEqual(self.title(), "Replica Title")
+
+    def test_search_reads_its_index_from_the_replica(self):
+        def titles(query):
+            response = self.client.get(reverse('search-books'), {"q": query})
+            return [book["title"] for book in response.data["results"]["data"]]
+
+        # Matched in the replica's index, so the IDs are of rows the replica has
+        self.assertEqual(titles("replica"), ["Replica Title"])
+        self.assertEqual(titles("primary"), [])
+
+    def test_writes_and_reads_outside_requests_use_the_primary(self):
+        response = self.client.post(reverse('borrow-book'), {"userID": self.user.pk, "bookID": self.book.pk, "borrow_date": "2024-01-01"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(BorrowedBooks.objects.using('replica').exists())
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+
+        router = replicas.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Book), 'default')
+        self.assertEqual(Book.objects.get(pk=self.book.pk).title, "Primary Title")
+
+    @override_settings(LMS_READ_REPLICAS=[])
+    def test_without_replicas_everything_uses_the_primary(self):
+        self.assertEqual(self.title(), "Primary Title")
+        response = self.client.put(reverse('update-book', args=[self.book.pk]), {"title": "New", "isbn": "R1", "published_date": "2020-01-01", "genre": "Fiction"}, format='json')
+        self.assertNotIn(replicas.PIN_COOKIE, response.cookies)
+
+
+class BatchFetchTestCase(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = CustomUser.objects.create(name="Desk", email="desk@example.com", password='!')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        self.books = [
+            Book.objects.create(title=f"Book {i}", isbn=f"B{i}", published_date="2020-01-01", genre="Fiction", copies=2, available_copies=2)
+            for i in range(3)
+        ]
+        BookDetails.objects.create(bookID=self.books[1], number_of_pages=100, publisher="Penguin Books", language="English")
+        self.loan = BorrowedBooks.objects.create(userID=self.user, bookID=self.books[0], borrow_date="2024-01-01")
+
+    def test_books_in_requested_order_with_missing_ids(self):
+        first, second, third = (book.bookID for book in self.books)
+        url = reverse('get-books-by-ids') + f"?ids={third},999,{first},{third}"
+        with self.assertNumQueries(2):  # token lookup + books
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([book["bookID"] for book in response.data["data"]], [third, first])
+        self.assertEqual(response.data["missing"], [999])
+        self.assertEqual(response.data["data"][1], BookSerializer(self.books[0]).data)
+
+        response = self.client.get(reverse('get-books-by-ids') + f"?ids={second},{first}&expand=details")
+        self.assertEqual(response.data["data"][0]["details"]["publisher"], "Penguin Books")
+        self.assertIsNone(response.data["data"][1]["details"])
+
+    def test_users_and_loans(self):
+        response = self.client.get(reverse('get-users-by-ids') + f"?ids={self.user.pk},0")
+        self.assertEqual(response.data["data"], [CustomUserSerializer(self.user).data])
+        self.assertEqual(response.data["missing"], [0])
+
+        response = self.client.get(reverse('get-borrowed-books-by-ids') + f"?ids={self.loan.pk}")
+        self.assertEqual(response.data["data"], [BorrowedBooksSerializer(self.loan).data])
+        self.assertEqual(response.data["missing"], [])
+
+    @override_settings(LMS_BATCH_MAX_IDS=2)
+    def test_invalid_and_too_many_ids(self):
+        url = reverse('get-books-by-ids')
+        for query in ("", "?ids=", "?ids=1,x", "?ids=1,2,3", "?ids=1&expand=bogus"):
+            self.assertEqual(self.client.get(url + query).status_code, status.HTTP_400_BAD_REQUEST, query)
+        # Duplicates count once
+        self.assertEqual(self.client.get(url + "?ids=1,2,1").status_code, status.HTTP_200_OK)
+
+
+@override_settings(LMS_LOAN_DAYS=14, LMS_FINE_PER_DAY='0.25', LMS_FINE_CAP='2.00')
+class BulkUpdateTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.alice = CustomUser.objects.create(name="Alice Doe", email="alice@example.com", password="another_password")
+        self.novel = Book.objects.create(title="The Great Adventure", published_date="2022-01-30", genre="Fiction", isbn="123457890", copies=3, available_copies=3)
+        self.atlas = Book.objects.create(title="World Atlas", published_date="2020-05-01", genre="Reference", isbn="123457891", copies=2, available_copies=2)
+
+    def borrow(self, user, book, borrow_date="2022-01-01"):
+        response = self.client.post(reverse('borrow-book'), {"userID": user.userID, "bookID": book.bookID, "borrow_date": borrow_date}, format='json')
+        return response.data["data"]["id"]
+
+    def post_rows(self, url_name, rows):
+        body = "\n".join(json.dumps(row) for row in rows)
+        return self.client.post(reverse(url_name), body, content_type='application/x-ndjson')
+
+    def assert_matches_rebuild(self):
+        incremental = stats.snapshot()
+        call_command('rebuild_circulation_stats', stdout=io.StringIO())
+        self.assertEqual(incremental, stats.snapshot())
+
+    def test_bulk_return_settles_fines_copies_and_stats(self):
+        late = self.borrow(self.user, self.novel)
+        on_time = self.borrow(self.alice, self.novel)
+        other = self.borrow(self.alice, self.atlas)
+        returned = self.borrow(self.user, self.atlas)
+        self.client.put(reverse('return-borrowed-book', args=[returned]), {"return_date": "2022-01-05"}, format='json')
+
+        response = self.post_rows('bulk-return-borrowed-books', [
+            {"id": late, "return_date": "2022-01-20"},
+            {"id": on_time, "return_date": "2022-01-10"},
+            {"id": late},
+            {"id": returned},
+            {"id": 999999},
+            {"id": other, "return_date": "2021-12-31"},
+            {"id": "x"},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data["data"]
+        self.assertEqual((data["returned"], data["failed"]), (2, 5))
+        self.assertEqual([item["row"] for item in data["results"]], list(range(1, 8)))
+        self.assertEqual(data["results"][0]["data"]["fine"], "1.25")
+        self.assertEqual(data["results"][1]["data"]["fine"], "0.00")
+        self.assertEqual(set(data["results"][5]["errors"]), {"return_date"})
+
+        self.novel.refresh_from_db()
+        self.atlas.refresh_from_db()
+        self.assertEqual((self.novel.available_copies, self.atlas.available_copies), (3, 1))
+        self.assertEqual(BorrowedBooks.objects.get(id=late).return_date, datetime.date(2022, 1, 20))
+        self.assertEqual(stats.snapshot()["active_borrowers"], 1)
+        self.assert_matches_rebuild()
+
+        # Nothing left to return
+        response = self.post_rows('bulk-return-borrowed-books', [{"id": late}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_return_queries_do_not_grow_with_loans(self):
+        books = [Book.objects.create(title=f"Book {i}", published_date="2022-01-30", genre=f"Genre {i % 2}", isbn=f"99{i}") for i in range(6)]
+        loans = [self.borrow(self.user if i % 2 else self.alice, book) for i, book in enumerate(books)]
+        counts = []
+        for batch in (loans[:2], loans[2:]):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.post_rows('bulk-return-borrowed-books', [{"id": loan_id} for loan_id in batch])
+            self.assertEqual(response.data["data"]["returned"], len(batch))
+            counts.append(len(captured))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(stats.snapshot()["open_loans"], 0)
+        self.assert_matches_rebuild()
+
+    def test_bulk_update_books(self):
+        self.borrow(self.user, self.novel)
+        self.borrow(self.alice, self.novel)
+        before = self.novel.modified_at
+        response = self.post_rows('bulk-update-books', [
+            {"bookID": self.novel.bookID, "copies": 5, "genre": "Adventure"},
+            {"bookID": self.atlas.bookID, "title": "Atlas of the World", "isbn": "555"},
+            {"bookID": self.atlas.bookID, "title": "Repeated"},
+            {"bookID": 999999, "title": "Missing"},
+            {"title": "No ID"},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data["data"]
+        self.assertEqual((data["updated"], data["failed"]), (2, 3))
+        self.assertEqual(data["results"][0]["data"]["available_copies"], 3)
+
+        self.novel.refresh_from_db()
+        self.atlas.refresh_from_db()
+        self.assertEqual((self.novel.copies, self.novel.available_copies, self.novel.genre), (5, 3, "Adventure"))
+        self.assertGreater(self.novel.modified_at, before)
+        self.assertEqual((self.atlas.title, self.atlas.isbn), ("Atlas of the World", "555"))
+        self.assert_matches_rebuild()
+
+        response = self.post_rows('bulk-update-books', [
+            {"bookID": self.novel.bookID, "copies": 1},
+            {"bookID": self.atlas.bookID, "isbn": "123457890"},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = [item["errors"] for item in response.data["data"]["results"]]
+        self.assertEqual([set(error) for error in errors], [{"copies"}, {"isbn"}])
+
+    def test_bulk_update_book_details(self):
+        details = BookDetails.objects.create(bookID=self.novel, number_of_pages=300, publisher="Penguin Books", language="English")
+        rows = ["detailsID,number_of_pages,bookID", f"{details.detailsID},320,{self.atlas.bookID}", "999999,10,"]
+        response = self.client.post(reverse('bulk-update-book-details'), "\n".join(rows), content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["data"]["updated"], response.data["data"]["failed"]), (1, 1))
+        details.refresh_from_db()
+        # bookID is read-only here
+        self.assertEqual((details.number_of_pages, details.bookID_id), (320, self.novel.bookID))
+
+    def test_bulk_update_rejects_too_many_rows(self):
+        with mock.patch.object(bulk, 'MAX_UPDATE_ROWS', 1):
+            response = self.post_rows('bulk-update-books', [{"bookID": self.novel.bookID}, {"bookID": self.atlas.bookID}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("error", response.data)
+
+
+class DeletionTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.alice = CustomUser.objects.create(name="Alice Doe", email="alice@example.com", password="another_password")
+        self.books = [
+            Book.objects.create(title=f"Book {i}", published_date="2022-01-30", genre=genre, isbn=f"12345789{i}", copies=3, available_copies=3)
+            for i, genre in enumerate(["Fiction", "Fiction", "Reference"])
+        ]
+
+    def borrow(self, user, book, return_date=None):
+        response = self.client.post(reverse('borrow-book'), {"userID": user.userID, "bookID": book.bookID, "borrow_date": "2022-01-01"}, format='json')
+        if return_date:
+            self.client.put(reverse('return-borrowed-book', args=[response.data["data"]["id"]]), {"return_date": return_date}, format='json')
+
+    def assert_matches_rebuild(self):
+        incremental = stats.snapshot()
+        call_command('rebuild_circulation_stats', stdout=io.StringIO())
+        self.assertEqual(incremental, stats.snapshot())
+
+    def test_delete_user_in_chunks_releases_copies_and_keeps_stats(self):
+        for book in self.books:
+            self.borrow(self.alice, book)
+            self.borrow(self.alice, book, return_date="2022-01-09")
+            self.borrow(self.user, book, return_date="2022-01-05")
+
+        self.assertEqual(deletion.delete_user(self.alice, chunk_size=2), 6)
+        self.assertFalse(CustomUser.objects.filter(pk=self.alice.pk).exists())
+        self.assertEqual([book.available_copies for book in Book.objects.order_by('pk')], [3, 3, 3])
+        self.assertEqual(stats.snapshot()["active_borrowers"], 0)
+        self.assert_matches_rebuild()
+
+    def test_delete_book_in_chunks_keeps_stats(self):
+        self.borrow(self.alice, self.books[0])
+        self.borrow(self.user, self.books[0], return_date="2022-01-03")
+        self.borrow(self.user, self.books[1])
+
+        self.assertEqual(deletion.delete_book(self.books[0], chunk_size=1), 2)
+        self.assertFalse(BorrowedBooks.objects.filter(bookID=self.books[0].pk).exists())
+        self.assertEqual(stats.snapshot()["total_loans"], 1)
+        self.assert_matches_rebuild()
+
+    def test_interrupted_delete_can_be_finished(self):
+        for book in self.books:
+            self.borrow(self.alice, book)
+        with mock.patch.object(CustomUser, 'delete', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                deletion.delete_user(self.alice, chunk_size=1)
+        # The loans are gone and accounted for, the user is left deactivated
+        self.alice.refresh_from_db()
+        self.assertFalse(self.alice.is_active)
+        self.assertFalse(BorrowedBooks.objects.filter(userID=self.alice).exists())
+        self.assert_matches_rebuild()
+
+        self.assertEqual(self.client.delete(reverse('delete-user', args=[self.alice.userID])).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(CustomUser.objects.filter(pk=self.alice.pk).exists())
+
+    def test_benchmark_deletes_command(self):
+        for target in ('user', 'book'):
+            out = io.StringIO()
+            call_command('benchmark_deletes', f'--target={target}', '--loans=50', '--spread=3', '--chunk-size=7', stdout=out)
+            self.assertIn("50 loans", out.getvalue())
+        self.assertEqual(BorrowedBooks.objects.count(), 0)
+        self.assertEqual(Book.objects.count(), 3)
+        self.assertEqual(stats.snapshot()["total_loans"], 0)
+
+
+class ArchiveTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.alice = CustomUser.objects.create(name="Alice Doe", email="alice@example.com", password="another_password")
+        self.novel = Book.objects.create(title="The Great Adventure", published_date="2022-01-30", genre="Fiction", isbn="123457890", copies=3, available_copies=3)
+        self.atlas = Book.objects.create(title="World Atlas", published_date="2020-05-01", genre="Reference", isbn="123457891", copies=2, available_copies=2)
+
+    def borrow(self, user, book, borrow_date, return_date=None):
+        response = self.client.post(reverse('borrow-book'), {"userID": user.userID, "bookID": book.bookID, "borrow_date": borrow_date}, format='json')
+        loan_id = response.data["data"]["id"]
+        if return_date:
+            self.client.put(reverse('return-borrowed-book', args=[loan_id]), {"return_date": return_date}, format='json')
+        return loan_id
+
+    def assert_matches_rebuild(self):
+        incremental = stats.snapshot()
+        call_command('rebuild_circulation_stats', stdout=io.StringIO())
+        self.assertEqual(incremental, stats.snapshot())
+
+    def make_history(self):
+        return [
+            self.borrow(self.alice, self.novel, "2020-01-01", "2020-01-10"),
+            self.borrow(self.alice, self.atlas, "2021-03-01", "2021-03-05"),
+            self.borrow(self.user, self.novel, "2021-06-01", "2021-06-20"),
+            # Returned too recently, and still open
+            self.borrow(self.alice, self.novel, "2022-05-01", "2022-05-10"),
+            self.borrow(self.alice, self.atlas, "2021-01-01"),
+        ]
+
+    def test_archive_moves_old_returned_loans_in_resumable_chunks(self):
+        loans = self.make_history()
+        before = stats.snapshot()
+        chunks = []
+        result = archive.archive(datetime.date(2022, 6, 1), after_days=180, chunk_size=2, progress=lambda result: chunks.append(result["loans"]))
+
+        self.assertEqual((result["loans"], result["cutoff"]), (3, datetime.date(2021, 12, 3)))
+        self.assertEqual(chunks, [2, 3])
+        self.assertCountEqual(ArchivedLoan.objects.values_list('id', flat=True), loans[:3])
+        self.assertCountEqual(BorrowedBooks.objects.values_list('id', flat=True), loans[3:])
+        archived = ArchivedLoan.objects.get(id=loans[0])
+        self.assertEqual((archived.userID_id, archived.bookID_id, archived.return_date), (self.alice.pk, self.novel.pk, datetime.date(2020, 1, 10)))
+        # Archived loans are still counted
+        self.assertEqual(stats.snapshot(), before)
+        self.assert_matches_rebuild()
+
+        self.assertIsNone(archive.archive(datetime.date(2022, 6, 1), after_days=180))
+        self.assertEqual(archive.archive(datetime.date(2022, 6, 1), after_days=180, restart=True)["loans"], 0)
+
+    def test_interrupted_archive_resumes_after_last_chunk(self):
+        loans = self.make_history()
+        real_bulk_create = ArchivedLoan.objects.bulk_create
+        calls = []
+
+        def fail_second_chunk(objs):
+            calls.append(objs)
+            if len(calls) == 2:
+                raise RuntimeError
+            return real_bulk_create(objs)
+
+        with mock.patch.object(ArchivedLoan.objects, 'bulk_create', side_effect=fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                archive.archive(datetime.date(2022, 6, 1), after_days=180, chunk_size=2)
+        # The failed chunk was rolled back whole
+        self.assertCountEqual(ArchivedLoan.objects.values_list('id', flat=True), loans[:2])
+        self.assertEqual(JobCheckpoint.objects.get(job=archive.JOB).rows, 2)
+
+        out = io.StringIO()
+        call_command('archive_loans', '--date=2022-06-01', '--after-days=180', '--chunk-size=2', stdout=out)
+        self.assertIn("Archived 1 loans returned before 2021-12-03 (resumed after loan", out.getvalue())
+        self.assertCountEqual(ArchivedLoan.objects.values_list('id', flat=True), loans[:3])
+        self.assert_matches_rebuild()
+
+    def test_history_endpoints_list_current_and_archived_loans(self):
+        loans = self.make_history()
+        archive.archive(datetime.date(2022, 6, 1), after_days=180)
+
+        response = self.client.get(reverse('list-user-loan-history', args=[self.alice.userID]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 4)
+        data = response.data["results"]["data"]
+        self.assertEqual([loan["id"] for loan in data], [loans[3], loans[1], loans[4], loans[0]])
+        self.assertEqual(data[3], BorrowedBooksSerializer(BorrowedBooks(**{
+            field.attname: getattr(ArchivedLoan.objects.get(id=loans[0]), field.attname) for field in BorrowedBooks._meta.concrete_fields
+        })).data)
+
+        response = self.client.get(reverse('list-book-loan-history', args=[self.novel.bookID]))
+        self.assertEqual([loan["id"] for loan in response.data["results"]["data"]], [loans[3], loans[2], loans[0]])
+
+        empty = CustomUser.objects.create(name="New Member", email="new@example.com", password="password")
+        self.assertEqual(self.client.get(reverse('list-user-loan-history', args=[empty.userID])).data["count"], 0)
+        self.assertEqual(self.client.get(reverse('list-user-loan-history', args=[999999])).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('list-book-loan-history', args=[999999])).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deletes_take_archived_loans_along(self):
+        self.make_history()
+        archive.archive(datetime.date(2022, 6, 1), after_days=180)
+
+        self.assertEqual(deletion.delete_user(self.alice, chunk_size=1), 4)
+        self.assertFalse(ArchivedLoan.objects.filter(userID=self.alice.pk).exists())
+        self.assert_matches_rebuild()
+        self.assertEqual(deletion.delete_book(self.novel), 1)
+        self.assertFalse(ArchivedLoan.objects.exists())
+        self.assertEqual(stats.snapshot()["total_loans"], 0)
+
+    def test_partition_needs_postgresql(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest("Covered by test_partitioned_archive.")
+        with self.assertRaises(CommandError):
+            call_command('partition_loan_archive', stdout=io.StringIO())
+
+    def test_partitioned_archive(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("Partitioning needs PostgreSQL.")
+        loans = self.make_history()
+        archive.archive(datetime.date(2022, 6, 1), after_days=180, chunk_size=1)
+        self.borrow(self.user, self.atlas, "2019-04-01", "2019-04-02")
+
+        out = io.StringIO()
+        call_command('partition_loan_archive', stdout=out)
+        self.assertIn("(3 loans)", out.getvalue())
+        # A new year gets its partition as the loans come in
+        archive.archive(datetime.date(2022, 6, 1), after_days=180, restart=True)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass ORDER BY 1", [ArchivedLoan._meta.db_table])
+            partitions = [row[0] for row in cursor.fetchall()]
+        self.assertEqual(partitions, ["lms_archivedloan_y2019", "lms_archivedloan_y2020", "lms_archivedloan_y2021"])
+        self.assertEqual(ArchivedLoan.objects.filter(id__in=loans).count(), 3)
+
+        response = self.client.get(reverse('list-user-loan-history', args=[self.alice.userID]))
+        self.assertEqual(response.data["count"], 4)
+        self.assertEqual(deletion.delete_user(self.alice), 4)
+        self.assert_matches_rebuild()
+        out = io.StringIO()
+        call_command('partition_loan_archive', stdout=out)
+        self.assertIn("partitioned already", out.getvalue())
+
+
+class IdempotencyTestCase(APITestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.book = Book.objects.create(title="The Great Adventure", published_date="2022-01-30", genre="Fiction", isbn="123457890", copies=3, available_copies=3)
+        self.loan = {"userID": self.user.userID, "bookID": self.book.bookID, "borrow_date": "2022-01-01"}
+
+    def borrow(self, key, data=None):
+        return self.client.post(reverse('borrow-book'), data or self.loan, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retries_are_replayed_without_running_the_view(self):
+        first = self.borrow("loan-1")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        with mock.patch.object(circulation, 'checkout') as checkout:
+            retry = self.borrow("loan-1")
+        checkout.assert_not_called()
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry[idempotency.REPLAYED_HEADER], 'true')
+        self.assertEqual(BorrowedBooks.objects.count(), 1)
+
+        # Another key (or none) is another request
+        self.assertEqual(self.borrow("loan-2").status_code, status.HTTP_201_CREATED)
+        self.client.post(reverse('borrow-book'), self.loan, format='json')
+        self.assertEqual(BorrowedBooks.objects.count(), 3)
+
+    def test_error_responses_are_replayed_too(self):
+        response = self.client.put(reverse('update-book', args=[999]), {"title": "Missing"}, format='json', HTTP_IDEMPOTENCY_KEY="put-1")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        retry = self.client.put(reverse('update-book', args=[999]), {"title": "Missing"}, format='json', HTTP_IDEMPOTENCY_KEY="put-1")
+        self.assertEqual((retry.status_code, retry.data), (status.HTTP_404_NOT_FOUND, response.data))
+
+    def test_key_cannot_be_reused_for_another_request(self):
+        self.borrow("loan-1")
+        response = self.borrow("loan-1", {**self.loan, "borrow_date": "2022-01-02"})
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(self.borrow("x" * (idempotency.MAX_KEY_LENGTH + 1)).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_keys_are_scoped_per_user(self):
+        self.borrow("loan-1")
+        other = CustomUser.objects.create(name="Alice Doe", email="alice@example.com", password="another_password")
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=other).key}')
+        self.assertEqual(self.borrow("loan-1").status_code, status.HTTP_201_CREATED)
+        self.assertEqual(BorrowedBooks.objects.count(), 2)
+
+    def test_in_flight_and_failed_requests(self):
+        fingerprint = idempotency.fingerprint(self.client.post(reverse('borrow-book'), self.loan, format='json').wsgi_request)
+        now = timezone.now()
+        IdempotencyKey.objects.create(
+            user=self.user, key="busy", fingerprint=fingerprint,
+            locked_until=now + datetime.timedelta(minutes=1), expires_at=now + datetime.timedelta(days=1),
+        )
+        response = self.borrow("busy")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn('Retry-After', response)
+
+        # A claim past its locked_until was abandoned
+        IdempotencyKey.objects.filter(key="busy").update(locked_until=now - datetime.timedelta(seconds=1))
+        self.assertEqual(self.borrow("busy").status_code, status.HTTP_201_CREATED)
+
+        # A view that blows up releases its key so the retry runs
+        with mock.patch.object(circulation, 'checkout', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.borrow("boom")
+        self.assertFalse(IdempotencyKey.objects.filter(key="boom").exists())
+        self.assertEqual(self.borrow("boom").status_code, status.HTTP_201_CREATED)
+
+    @override_settings(LMS_IDEMPOTENCY_LOCK_SECONDS=60, LMS_IDEMPOTENCY_BULK_LOCK_SECONDS=3600)
+    def test_bulk_endpoints_hold_their_claim_longer(self):
+        seen = {}
+
+        def claim_while_running(*args, **kwargs):
+            seen['claim'] = IdempotencyKey.objects.get(key="bulk-1")
+            return {"returned": 0, "failed": 0, "errors": []}
+
+        body = json.dumps({"id": 1, "return_date": "2024-01-10"}) + "\n"
+        with mock.patch.object(bulk, 'return_loans', side_effect=claim_while_running):
+            self.client.post(reverse('bulk-return-borrowed-books'), body, content_type='application/x-ndjson', HTTP_IDEMPOTENCY_KEY="bulk-1")
+        claim = seen['claim']
+        self.assertIsNone(claim.status_code)
+        self.assertEqual(claim.locked_until - claim.created_at, datetime.timedelta(hours=1))
+
+        self.borrow("loan-1")
+        claim = IdempotencyKey.objects.get(key="loan-1")
+        self.assertEqual(claim.locked_until - claim.created_at, datetime.timedelta(minutes=1))
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=20)
+    def test_keyed_bodies_are_limited_to_the_upload_memory_size(self):
+        response = self.borrow("loan-1")
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertIn(idempotency.HEADER, response.data["error"])
+        self.assertFalse(IdempotencyKey.objects.exists())
+        # Without a key, bulk uploads are streamed and not limited
+        loan = BorrowedBooks.objects.create(userID=self.user, bookID=self.book, borrow_date="2024-01-01")
+        body = json.dumps({"id": loan.id, "return_date": "2024-01-10"}) + "\n"
+        response = self.client.post(reverse('bulk-return-borrowed-books'), body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_purge_deletes_expired_keys(self):
+        self.borrow("loan-1")
+        self.borrow("loan-2")
+        IdempotencyKey.objects.filter(key="loan-1").update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        out = io.StringIO()
+        call_command('purge_idempotency_keys', chunk_size=1, stdout=out)
+        self.assertIn("Deleted 1 expired", out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ["loan-2"])
+        # An expired key is claimed afresh
+        self.assertEqual(self.borrow("loan-2").status_code, status.HTTP_201_CREATED)
+
+
+class IdempotencyConcurrencyTestCase(TransactionTestCase):
+    def test_concurrent_duplicates_run_once(self):
+        if connection.vendor == 'sqlite':
+            self.skipTest("Concurrent writers need PostgreSQL.")
+        user = CustomUser.objects.create(name="John Doe", email="john.doe@example.com", password="test_password")
+        token = Token.objects.create(user=user)
+        book = Book.objects.create(title="The Great Adventure", published_date="2022-01-30", genre="Fiction", isbn="123457890", copies=10, available_copies=10)
+        loan = {"userID": user.userID, "bookID": book.bookID, "borrow_date": "2022-01-01"}
+
+        def send(_):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+            try:
+                return client.post(reverse('borrow-book'), loan, format='json', HTTP_IDEMPOTENCY_KEY="same").status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            codes = list(pool.map(send, range(8)))
+        self.assertEqual(BorrowedBooks.objects.count(), 1)
+        self.assertLessEqual(set(codes), {status.HTTP_201_CREATED, status.HTTP_409_CONFLICT})
@@ -1,14 +1,21 @@
 from django.urls import path
 from django.views.generic import RedirectView
+from . import async_views
 from .views import (
     # User URLs
-    create_user, list_users, get_user_by_id, update_user, delete_user,
+    create_user, provision_users, list_users, get_user_by_id, get_users_by_ids, list_user_current_loans, list_user_loan_history, update_user, delete_user,
     # Book URLs
-    create_book, list_books, get_book_by_id, update_book, delete_book,
+    create_book, import_books, list_books, search_books, get_book_by_id, get_books_by_ids, list_book_current_borrowers, list_book_loan_history, update_book, bulk_update_books, delete_book,
     # BookDetails URLs
-    create_book_details, get_book_details_by_id, update_book_details, delete_book_details,
+    create_book_details, get_book_details_by_id, update_book_details, bulk_update_book_details, delete_book_details,
     # BorrowedBooks URLs
-    borrow_book, get_borrowed_book_by_id, return_borrowed_book, delete_borrowed_book,
+    borrow_book, get_borrowed_book_by_id, get_borrowed_books_by_ids, return_borrowed_book, bulk_return_borrowed_books, delete_borrowed_book,
+    # Export URLs
+    export_resource,
+    # Statistics URLs
+    circulation_stats,
+    # Operational URLs
+    token_cache_stats,
 )
 
 urlpatterns = [
@@ -16,27 +23,56 @@ urlpatterns = [
     
     # User URLs
     path('users/create/', create_user, name='create-user'),
+    path('users/provision/', provision_users, name='provision-users'),
     path('users/list/', list_users, name='list-users'),
     path('users/<int:id>/', get_user_by_id, name='get-user-by-id'),
+    path('users/batch/', get_users_by_ids, name='get-users-by-ids'),
+    path('users/<int:id>/borrowed/', list_user_current_loans, name='list-user-current-loans'),
+    path('users/<int:id>/history/', list_user_loan_history, name='list-user-loan-history'),
     path('users/update/<int:id>/', update_user, name='update-user'),
     path('users/delete/<int:id>/', delete_user, name='delete-user'),
 
     # Book URLs
     path('books/create/', create_book, name='create-book'),
+    path('books/import/', import_books, name='import-books'),
     path('books/list/', list_books, name='list-books'),
+    path('books/search/', search_books, name='search-books'),
     path('books/<int:id>/', get_book_by_id, name='get-book-by-id'),
+    path('books/batch/', get_books_by_ids, name='get-books-by-ids'),
+    path('books/<int:id>/borrowers/', list_book_current_borrowers, name='list-book-current-borrowers'),
+    path('books/<int:id>/history/', list_book_loan_history, name='list-book-loan-history'),
     path('books/update/<int:id>/', update_book, name='update-book'),
+    path('books/update/bulk/', bulk_update_books, name='bulk-update-books'),
     path('books/delete/<int:id>/', delete_book, name='delete-book'),
 
     # BookDetails URLs
     path('book-details/create/', create_book_details, name='create-book-details'),
     path('book-details/<int:id>/', get_book_details_by_id, name='get-book-details-by-id'),
     path('book-details/update/<int:id>/', update_book_details, name='update-book-details'),
+    path('book-details/update/bulk/', bulk_update_book_details, name='bulk-update-book-details'),
     path('book-details/delete/<int:id>/', delete_book_details, name='delete-book-details'),
 
     # BorrowedBooks URLs
     path('borrow/create/', borrow_book, name='borrow-book'),
     path('borrowed/<int:id>/', get_borrowed_book_by_id, name='get-borrowed-book-by-id'),
+    path('borrowed/batch/', get_borrowed_books_by_ids, name='get-borrowed-books-by-ids'),
     path('borrowed/return/<int:id>/', return_borrowed_book, name='return-borrowed-book'),
+    path('borrowed/return/bulk/', bulk_return_borrowed_books, name='bulk-return-borrowed-books'),
     path('borrowed/delete/<int:id>/', delete_borrowed_book, name='delete-borrowed-book'),
+
+    # Export URLs
+    path('export/<str:resource>/', export_resource, name='export-resource'),
+
+    # Statistics URLs
+    path('stats/', circulation_stats, name='circulation-stats'),
+
+    # Operational URLs
+    path('auth/token-cache/', token_cache_stats, name='token-cache-stats'),
+
+    # Async read URLs (same responses as the sync views above, for ASGI deployments)
+    path('async/users/list/', async_views.list_users, name='async-list-users'),
+    path('async/users/<int:id>/', async_views.get_user_by_id, name='async-get-user-by-id'),
+    path('async/books/list/', async_views.list_books, name='async-list-books'),
+    path('async/books/<int:id>/', async_views.get_book_by_id, name='async-get-book-by-id'),
+    path('async/borrowed/<int:id>/', async_views.get_borrowed_book_by_id, name='async-get-borrowed-book-by-id'),
 ]
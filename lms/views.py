@@ -1,18 +1,107 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from .models import CustomUser, Book, BookDetails, BorrowedBooks
-from .serializers import CustomUserSerializer, BookSerializer, BookDetailsSerializer, BorrowedBooksSerializer, CreateCustomUserSerializer
+from .models import ArchivedLoan, CustomUser, Book, BookDetails, BorrowedBooks, CatalogVersion
+from .serializers import CustomUserSerializer, BookSerializer, BookDetailsSerializer, BorrowedBooksSerializer, CreateCustomUserSerializer, ExpandableBookSerializer, ReturnDateSerializer
 from django.contrib.auth.hashers import make_password
 from rest_framework.decorators import permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.authtoken.models import Token
-from .pagination import CustomPagination
-from rest_framework.exceptions import NotFound
+from .pagination import get_paginator, CustomPagination
+from rest_framework.exceptions import NotFound, ValidationError
+from . import bulk, circulation, dbjson, deletion, export, lean, search, stats
+from .idempotency import idempotent
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+from .conditional import book_validators, make_etag, not_modified_response, set_validators
+from .filters import BookFilter
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+from .authentication import token_cache
+from django.conf import settings
+import codecs
+
+# values()-based serializers for list pages; the JSON matches the ModelSerializers.
+USER_ROWS = lean.ValuesSerializer(CustomUserSerializer)
+BOOK_ROWS = lean.ValuesSerializer(BookSerializer)
+LOAN_ROWS = lean.ValuesSerializer(BorrowedBooksSerializer)
+
+
+def _read_bulk_rows(request):
+    """
+    Open an NDJSON or CSV request body as a lazy stream of (line_number, data) rows.
+
+    Returns (rows, batch_size, error_response); error_response is set when the
+    request cannot be read and should be returned as-is.
+    """
+    content_type = request.content_type.split(';')[0].strip()
+    file_format = bulk.CONTENT_TYPE_FORMATS.get(content_type)
+    if file_format is None:
+        return None, None, Response({"error": "Content-Type must be application/x-ndjson or text/csv."}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    try:
+        batch_size = bulk.parse_batch_size(request.query_params.get('batch_size'))
+    except ValueError:
+        return None, None, Response({"error": "batch_size must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+    if request.stream is None:
+        return None, None, Response({"error": "The request body is empty."}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Read the body line by line instead of buffering it through request.data
+    lines = codecs.getreader('utf-8')(request.stream, errors='replace')
+    return bulk.get_row_parser(file_format)(lines), batch_size, None
+
+
+def _run_bulk_update(request, update, message, count_key):
+    """
+    Apply a bulk update or return to the rows of an NDJSON or CSV body.
+
+    Answers 200 when at least one row was applied, 400 otherwise.
+    """
+    rows, batch_size, error_response = _read_bulk_rows(request)
+    if error_response is not None:
+        return error_response
+
+    try:
+        result = update(rows, batch_size=batch_size)
+    except ValueError as exc:
+        return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    response_status = status.HTTP_200_OK if result[count_key] else status.HTTP_400_BAD_REQUEST
+    return Response({"message": message, "data": result}, status=response_status)
+
+
+def _parse_ids(request):
+    """
+    Parse the comma-separated `ids` query parameter of the batch endpoints.
+
+    Returns (ids, error_response); ids keep the requested order without
+    duplicates, and there are at most LMS_BATCH_MAX_IDS of them.
+    """
+    try:
+        ids = list(dict.fromkeys(int(part) for part in request.query_params.get('ids', '').split(',') if part.strip()))
+    except ValueError:
+        return None, Response({"error": "ids must be a comma-separated list of integers."}, status=status.HTTP_400_BAD_REQUEST)
+    if not ids:
+        return None, Response({"error": "Pass the IDs to fetch as ids=1,2,3."}, status=status.HTTP_400_BAD_REQUEST)
+    max_ids = getattr(settings, 'LMS_BATCH_MAX_IDS', 200)
+    if len(ids) > max_ids:
+        return None, Response({"error": f"At most {max_ids} IDs can be fetched at once."}, status=status.HTTP_400_BAD_REQUEST)
+    return ids, None
+
+
+def _batch_rows(rows_serializer, queryset, pk_name, ids):
+    """
+    Fetch the rows with primary keys `ids` in one query, like in_bulk() but as
+    values() rows. Returns (rows in the order of `ids`, missing ids).
+    """
+    rows = {row[pk_name]: row for row in rows_serializer.values(queryset.filter(pk__in=ids))}
+    return [rows[pk] for pk in ids if pk in rows], [pk for pk in ids if pk not in rows]
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def create_user(request):
     """
     Register a new user.
@@ -71,6 +160,55 @@ def create_user(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent(bulk=True)
+def provision_users(request):
+    """
+    Bulk-create users, each with an auth token, from an NDJSON or CSV request body.
+
+    POST /api/users/provision/?batch_size=1000
+    Content-Type: application/x-ndjson (one user object per line) or text/csv (with a header row)
+
+    Request:
+    {"name": "John Thapa", "email": "john@example.com", "password": "secure_password"}
+    {"name": "Alice Doe", "email": "alice@example.com", "password": "another_password"}
+
+    Response:
+    201 Created - At least one user was created
+    {
+        "message": "Users provisioned",
+        "data": {
+            "created": 2,
+            "failed": 0,
+            "errors": [],
+            "seconds": 0.412,
+            "users_per_second": 4.9
+        }
+    }
+    """
+    rows, batch_size, error_response = _read_bulk_rows(request)
+    if error_response is not None:
+        return error_response
+
+    result = bulk.provision_users(rows, batch_size=batch_size)
+
+    response_status = status.HTTP_201_CREATED if result["created"] else status.HTTP_400_BAD_REQUEST
+    return Response({"message": "Users provisioned", "data": result}, status=response_status)
+
+
+def _database_json_page(request, paginator, queryset, rows, message):
+    """
+    Build a page-number list response whose array PostgreSQL assembles from
+    `rows` (see lms.dbjson). Returns None when there are no rows at all.
+    """
+    page = paginator.paginate_lazily(queryset, request)
+    if paginator.is_empty():
+        return None
+    data = paginator.get_paginated_response({"message": message, "data": dbjson.PLACEHOLDER}).data
+    return dbjson.render_around(data, dbjson.json_array(page, rows, queryset.query.order_by))
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_users(request):
@@ -79,6 +217,7 @@ def list_users(request):
     Get a list of all CustomUsers.
 
     GET /api/CustomUsers/list/
+    GET /api/CustomUsers/list/?pagination=cursor
 
     Response:
     [
@@ -93,16 +232,21 @@ def list_users(request):
     """
     
     try:
-        custom_users = CustomUser.objects.all().order_by('-userID')
-        if not custom_users.exists():
-            raise NotFound("No users found.")
-        
+        custom_users = USER_ROWS.values(CustomUser.objects.all().order_by('-userID'))
+
         # Apply pagination
-        paginator = CustomPagination()
+        paginator = get_paginator(request, ordering='-userID')
+        if isinstance(paginator, CustomPagination) and dbjson.enabled(custom_users):
+            response = _database_json_page(request, paginator, custom_users, USER_ROWS, "users retrieved successfully.")
+            if response is None:
+                raise NotFound("No users found.")
+            return response
+
         result_page = paginator.paginate_queryset(custom_users, request)
+        if paginator.is_empty():
+            raise NotFound("No users found.")
 
-        serializer = CustomUserSerializer(result_page, many=True)
-        return paginator.get_paginated_response({"message": "users retrieved successfully.","data":serializer.data})
+        return paginator.get_paginated_response({"message": "users retrieved successfully.","data":USER_ROWS.serialize(result_page)})
     
     except CustomUser.DoesNotExist:
         raise NotFound("CustomUser model not found")
@@ -126,20 +270,136 @@ def get_user_by_id(request, id):
         "email": "john@example.com",
         "membership_date": "2022-01-30"
     }
+
+    304 Not Modified - The If-None-Match / If-Modified-Since copy is current
     """
     try:
         user = CustomUser.objects.get(userID=id)
     except CustomUser.DoesNotExist:
         return Response({"message": f"Sorry, the user with ID {id} does not exist."}, status=status.HTTP_404_NOT_FOUND)
 
+    etag = make_etag('user', user.userID, user.modified_at)
+    not_modified = not_modified_response(request, etag, user.modified_at)
+    if not_modified is not None:
+        return not_modified
+
     serializer = CustomUserSerializer(user)
-    return Response({"message": "User details retrieved successfully", "data": serializer.data}, status=status.HTTP_200_OK)
+    response = Response({"message": "User details retrieved successfully", "data": serializer.data}, status=status.HTTP_200_OK)
+    return set_validators(response, etag, user.modified_at)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_users_by_ids(request):
+    """
+    Get several CustomUsers by ID in one request and one query.
+
+    GET /api/users/batch/?ids=1,2,5
+
+    Response:
+    200 OK - Users retrieved successfully, in the order requested
+    {
+        "message": "Users retrieved successfully",
+        "data": [
+            {"userID": 1, "name": "John Thapa", "email": "john@example.com", "membership_date": "2022-01-30"},
+            ...
+        ],
+        "missing": [5]
+    }
+
+    400 Bad Request - ids missing, not integers or more than LMS_BATCH_MAX_IDS of them
+    """
+    ids, error_response = _parse_ids(request)
+    if error_response is not None:
+        return error_response
+
+    rows, missing = _batch_rows(USER_ROWS, CustomUser.objects.all(), 'userID', ids)
+    return Response({"message": "Users retrieved successfully", "data": USER_ROWS.serialize(rows), "missing": missing}, status=status.HTTP_200_OK)
 
 
 
 
+def _loan_history(request, field, id, owners, missing_message):
+    """
+    Page through the loans with `field` (userID or bookID) equal to `id`, current
+    and archived (lms.archive) alike, newest first; 404 when `id` is not in `owners`.
+    """
+    current = LOAN_ROWS.values(BorrowedBooks.objects.filter(**{field: id}))
+    archived = LOAN_ROWS.values(ArchivedLoan.objects.filter(**{field: id}))
+    loans = current.union(archived, all=True).order_by('-borrow_date', '-id')
+
+    paginator = CustomPagination()
+    page = paginator.paginate_queryset(loans, request)
+    # Only pay for the existence check when there is nothing to show
+    if paginator.is_empty() and not owners.filter(pk=id).exists():
+        return Response({"message": missing_message}, status=status.HTTP_404_NOT_FOUND)
+    return paginator.get_paginated_response({"message": "Loan history retrieved successfully", "data": LOAN_ROWS.serialize(page)})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def list_user_current_loans(request, id):
+    """
+    List the loans a user currently has out (no return date), newest first.
+
+    GET /api/users/<int:id>/borrowed/
+
+    Response:
+    200 OK - Current loans retrieved successfully
+    {
+        "message": "Current loans retrieved successfully",
+        "data": [
+            {
+                "id": 7,
+                "userID": 1,
+                "bookID": 1,
+                "borrow_date": "2022-01-30",
+                "return_date": null
+            },
+            ...
+        ]
+    }
+    """
+    loans = BorrowedBooks.objects.filter(userID=id, return_date__isnull=True).order_by('-borrow_date', '-id')
+    serializer = BorrowedBooksSerializer(loans, many=True)
+    data = serializer.data
+
+    # Only pay for the existence check when there is nothing to show
+    if not data and not CustomUser.objects.filter(userID=id).exists():
+        return Response({"message": f"Sorry, the user with ID {id} does not exist."}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({"message": "Current loans retrieved successfully", "data": data}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def list_user_loan_history(request, id):
+    """
+    List every loan of a user, returned and archived ones included, newest first.
+
+    GET /api/users/<int:id>/history/?page=2
+
+    Response:
+    200 OK - Loan history retrieved successfully
+    {
+        "count": 42,
+        "next": "http://localhost:8000/api/users/1/history/?page=3",
+        "previous": "http://localhost:8000/api/users/1/history/",
+        "results": {
+            "message": "Loan history retrieved successfully",
+            "data": [
+                {"id": 7, "userID": 1, "bookID": 1, "borrow_date": "2022-01-30", "return_date": "2022-02-10", "due_date": "2022-02-13", "fine": "0.00"},
+                ...
+            ]
+        }
+    }
+    """
+    return _loan_history(request, 'userID', id, CustomUser.objects.all(), f"Sorry, the user with ID {id} does not exist.")
+
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def update_user(request, id):  # Change 'id' to 'userID'
     try:
         user = CustomUser.objects.get(userID=id)  # Change 'id' to 'userID'
@@ -158,8 +418,9 @@ def update_user(request, id):  # Change 'id' to 'userID'
 @permission_classes([IsAuthenticated])
 def delete_user(request, id):  #
     try:
-        user = CustomUser.objects.get(userID=id) 
-        user.delete()
+        user = CustomUser.objects.get(userID=id)
+        # Loans go first, in chunks (see lms.deletion)
+        deletion.delete_user(user)
         return Response({"message": f"User with ID {user.name} successfully deleted."}, status=status.HTTP_204_NO_CONTENT)
     except CustomUser.DoesNotExist:
         return Response({"error": f"User with ID { id } not found."}, status=status.HTTP_404_NOT_FOUND)
@@ -172,6 +433,7 @@ def delete_user(request, id):  #
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def create_book(request):
     """
     Create a new book.
@@ -225,6 +487,66 @@ def create_book(request):
     
     
 
+def _parse_expand(request):
+    """
+    Parse the comma-separated `expand` query parameter for book endpoints.
+
+    Returns (expand, error_response); error_response is set for unknown names.
+    """
+    expand = {name.strip() for name in request.query_params.get('expand', '').split(',') if name.strip()}
+    unknown = expand - set(ExpandableBookSerializer.EXPANSIONS)
+    if unknown:
+        allowed = ", ".join(ExpandableBookSerializer.EXPANSIONS)
+        return None, Response({"error": f"Unknown expand value(s): {', '.join(sorted(unknown))}. Allowed: {allowed}."}, status=status.HTTP_400_BAD_REQUEST)
+    return expand, None
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent(bulk=True)
+def import_books(request):
+    """
+    Bulk-import books from an NDJSON or CSV request body.
+
+    POST /api/books/import/?batch_size=1000
+    Content-Type: application/x-ndjson (one book object per line) or text/csv (with a header row)
+
+    Request:
+    {"title": "The Great Gatsby", "isbn": "978123890", "published_date": "2022-01-30", "genre": "Fiction"}
+    {"title": "Moby Dick", "isbn": "978123891", "published_date": "2022-01-30", "genre": "Adventure"}
+
+    Response:
+    201 Created - At least one book was imported
+    {
+        "message": "Books imported",
+        "data": {
+            "created": 1,
+            "failed": 1,
+            "errors": [{"row": 2, "errors": {"isbn": ["ISBN must be unique."]}}]
+        }
+    }
+    """
+    rows, batch_size, error_response = _read_bulk_rows(request)
+    if error_response is not None:
+        return error_response
+
+    result = bulk.import_books(rows, batch_size=batch_size)
+
+    response_status = status.HTTP_201_CREATED if result["created"] else status.HTTP_400_BAD_REQUEST
+    return Response({"message": "Books imported", "data": result}, status=response_status)
+
+
+def _books_validators(request, expand):
+    """
+    Return (etag, last_modified) for a page of the book list, or (None, None)
+    when it embeds loans, which change without touching their book.
+    """
+    if 'borrowed_books' in expand:
+        return None, None
+    version, last_modified = CatalogVersion.current(CatalogVersion.BOOKS, stamped=Book)
+    return make_etag('books', version, last_modified, request.get_full_path()), last_modified
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def list_books(request):
@@ -232,6 +554,10 @@ def list_books(request):
     Get a list of all books.
 
     GET /api/books/list/
+    GET /api/books/list/?pagination=cursor
+    GET /api/books/list/?expand=details,borrowed_books
+    GET /api/books/list/?genre=Fiction&published_date_after=2000-01-01&published_date_before=2009-12-31
+    GET /api/books/list/?language=English&publisher=Penguin%20Books&available=true&ordering=-published_date
 
     Response:
     200 OK - List of books retrieved successfully
@@ -245,19 +571,125 @@ def list_books(request):
         },
         ...
     ]
-    """
-    books = Book.objects.all().order_by('-bookID')
 
-    if not books.exists():
-        return Response({"message": "No books found."}, status=status.HTTP_404_NOT_FOUND)
+    With `expand`, each book also carries a "details" object (null when none
+    exist) and/or a "borrowed_books" list of its open loans.
+
+    Filters: genre, published_date_after / published_date_before, language,
+    publisher and available (true/false). ordering is one of bookID, title or
+    published_date, optionally prefixed with "-"; the default is -bookID.
+
+    400 Bad Request - Unknown expand value or invalid filter
+
+    304 Not Modified - The If-None-Match / If-Modified-Since copy is current
+    """
+    expand, error_response = _parse_expand(request)
+    if error_response is not None:
+        return error_response
+
+    filterset = BookFilter(request.query_params, queryset=Book.objects.with_expansions(expand).order_by('-bookID'))
+    if not filterset.is_valid():
+        return Response({"error": filterset.error_messages()}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Any change to the catalog bumps its version or stamps a book, so one
+    # primary-key lookup validates every page and parameter combination.
+    etag, last_modified = _books_validators(request, expand)
+    not_modified = not_modified_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    books = filterset.qs
+    if not expand:
+        # Every field is a plain column, so skip building model instances.
+        books = BOOK_ROWS.values(books)
 
     # Apply pagination
-    paginator = CustomPagination()
+    paginator = get_paginator(request, ordering=books.query.order_by)
+    if not expand and isinstance(paginator, CustomPagination) and dbjson.enabled(books):
+        response = _database_json_page(request, paginator, books, BOOK_ROWS, "List of books retrieved successfully")
+        if response is None:
+            return Response({"message": "No books found."}, status=status.HTTP_404_NOT_FOUND)
+        return set_validators(response, etag, last_modified)
+
     result_page = paginator.paginate_queryset(books, request)
-    serializer = BookSerializer(result_page, many=True)
+    if paginator.is_empty():
+        return Response({"message": "No books found."}, status=status.HTTP_404_NOT_FOUND)
+    if expand:
+        data = ExpandableBookSerializer(result_page, many=True, expand=expand).data
+    else:
+        data = BOOK_ROWS.serialize(result_page)
 
     # Set the status code directly in the Response object
-    return paginator.get_paginated_response({"message": "List of books retrieved successfully", "data": serializer.data})
+    response = paginator.get_paginated_response({"message": "List of books retrieved successfully", "data": data})
+    return set_validators(response, etag, last_modified)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_books(request):
+    """
+    Full-text search over book title, genre, publisher and language.
+
+    GET /api/books/search/?q=gatsby penguin&page=1
+    GET /api/books/search/?q=gatsby&expand=details
+
+    Every word must match (as a word prefix); results are ranked best first.
+
+    Response:
+    200 OK - Search results retrieved successfully
+    {
+        "next": "http://localhost:8000/api/books/search/?page=2&q=gatsby",
+        "previous": null,
+        "results": {
+            "message": "Search results retrieved successfully",
+            "data": [
+                {
+                    "bookID": 1,
+                    "title": "The Great Gatsby",
+                    "isbn": "9781234567890",
+                    "published_date": "2022-01-30",
+                    "genre": "Fiction"
+                },
+                ...
+            ]
+        }
+    }
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return Response({"error": "The q query parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+    expand, error_response = _parse_expand(request)
+    if error_response is not None:
+        return error_response
+
+    try:
+        page = int(request.query_params.get('page', 1))
+        if page < 1:
+            raise ValueError
+    except ValueError:
+        return Response({"error": "page must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Fetch one extra ID to know whether there is a next page without counting matches
+    page_size = CustomPagination.page_size
+    book_ids = search.search_book_ids(query, limit=page_size + 1, offset=(page - 1) * page_size)
+    has_next = len(book_ids) > page_size
+    book_ids = book_ids[:page_size]
+
+    books = Book.objects.with_expansions(expand).in_bulk(book_ids)
+    ranked_books = [books[book_id] for book_id in book_ids if book_id in books]
+    serializer = ExpandableBookSerializer(ranked_books, many=True, expand=expand)
+
+    url = request.build_absolute_uri()
+    if page == 2:
+        previous_url = remove_query_param(url, 'page')
+    else:
+        previous_url = replace_query_param(url, 'page', page - 1) if page > 1 else None
+    return Response({
+        "next": replace_query_param(url, 'page', page + 1) if has_next else None,
+        "previous": previous_url,
+        "results": {"message": "Search results retrieved successfully", "data": serializer.data},
+    }, status=status.HTTP_200_OK)
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -266,6 +698,7 @@ def get_book_by_id(request, id):
     Get details of a book by ID.
 
     GET /api/books/<int:id>/
+    GET /api/books/<int:id>/?expand=details,borrowed_books
 
     Response:
     {
@@ -275,11 +708,23 @@ def get_book_by_id(request, id):
         "published_date": "2022-01-30",
         "genre": "Fiction"
     }
+
+    304 Not Modified - The If-None-Match / If-Modified-Since copy is current
     """
+    expand, error_response = _parse_expand(request)
+    if error_response is not None:
+        return error_response
+
     try:
-        book = Book.objects.get(bookID=id)
-        serializer = BookSerializer(book)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        book = Book.objects.with_expansions(expand).get(bookID=id)
+
+        etag, last_modified = book_validators(book, expand)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        serializer = ExpandableBookSerializer(book, expand=expand)
+        return set_validators(Response(serializer.data, status=status.HTTP_200_OK), etag, last_modified)
 
     except Book.DoesNotExist:
         return Response({"message": f"Book with ID {id} does not exist."}, status=status.HTTP_404_NOT_FOUND)
@@ -288,8 +733,93 @@ def get_book_by_id(request, id):
         return Response({"message": f"An error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_books_by_ids(request):
+    """
+    Get several books by ID in one request and one query (plus one per
+    prefetched expansion).
+
+    GET /api/books/batch/?ids=1,2,9
+    GET /api/books/batch/?ids=1,2,9&expand=details,borrowed_books
+
+    Response:
+    200 OK - Books retrieved successfully, in the order requested
+    {
+        "message": "Books retrieved successfully",
+        "data": [
+            {"bookID": 1, "title": "The Great Gatsby", "isbn": "9781234567890", "published_date": "2022-01-30", "genre": "Fiction", ...},
+            ...
+        ],
+        "missing": [9]
+    }
+
+    400 Bad Request - Unknown expand value, or ids missing, not integers or more than LMS_BATCH_MAX_IDS of them
+    """
+    expand, error_response = _parse_expand(request)
+    if error_response is None:
+        ids, error_response = _parse_ids(request)
+    if error_response is not None:
+        return error_response
+
+    if expand:
+        books = Book.objects.with_expansions(expand).in_bulk(ids)
+        data = ExpandableBookSerializer([books[pk] for pk in ids if pk in books], many=True, expand=expand).data
+        missing = [pk for pk in ids if pk not in books]
+    else:
+        rows, missing = _batch_rows(BOOK_ROWS, Book.objects.all(), 'bookID', ids)
+        data = BOOK_ROWS.serialize(rows)
+    return Response({"message": "Books retrieved successfully", "data": data, "missing": missing}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def list_book_current_borrowers(request, id):
+    """
+    List who currently has a book out (open loans only), newest loan first.
+
+    GET /api/books/<int:id>/borrowers/
+
+    Response:
+    200 OK - Current borrowers retrieved successfully
+    {
+        "message": "Current borrowers retrieved successfully",
+        "data": [
+            {
+                "loan": {"id": 7, "userID": 1, "bookID": 1, "borrow_date": "2022-01-30", "return_date": null},
+                "borrower": {"userID": 1, "name": "John Thapa", "email": "john@example.com", "membership_date": "2022-01-30"}
+            }
+        ]
+    }
+    """
+    loans = BorrowedBooks.objects.filter(bookID=id, return_date__isnull=True).select_related('userID').order_by('-borrow_date', '-id')
+    data = [
+        {"loan": BorrowedBooksSerializer(loan).data, "borrower": CustomUserSerializer(loan.userID).data}
+        for loan in loans
+    ]
+
+    if not data and not Book.objects.filter(bookID=id).exists():
+        return Response({"message": f"Book with ID {id} does not exist."}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({"message": "Current borrowers retrieved successfully", "data": data}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def list_book_loan_history(request, id):
+    """
+    List every loan of a book, returned and archived ones included, newest first.
+
+    GET /api/books/<int:id>/history/?page=2
+
+    Response: as for GET /api/users/<int:id>/history/
+    """
+    return _loan_history(request, 'bookID', id, Book.objects.all(), f"Book with ID {id} does not exist.")
+
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def update_book(request, id):
     """
     Update details of a book by ID.
@@ -317,11 +847,46 @@ def update_book(request, id):
 
     serializer = BookSerializer(book, data=request.data)
     if serializer.is_valid():
-        serializer.save()
+        try:
+            serializer.save()
+        except ValidationError as exc:
+            # copies is checked again against the locked row (BookSerializer.update)
+            return Response({"message": "Failed to update the book.", "errors": exc.detail}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"message": "Book updated successfully!", "data": serializer.data})
     return Response({"message": "Failed to update the book.", "errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent(bulk=True)
+def bulk_update_books(request):
+    """
+    Partially update many books from an NDJSON or CSV request body, in one transaction.
+
+    POST /api/books/update/bulk/?batch_size=1000
+    Content-Type: application/x-ndjson (one object per line) or text/csv (with a header row)
+
+    Request (each row names a bookID and the fields to change):
+    {"bookID": 1, "title": "Updated Title"}
+    {"bookID": 2, "copies": 4, "genre": "Adventure"}
+
+    Response:
+    200 OK - At least one book was updated
+    {
+        "message": "Books updated",
+        "data": {
+            "updated": 1,
+            "failed": 1,
+            "results": [
+                {"row": 1, "id": 1, "data": {"bookID": 1, "title": "Updated Title", ...}},
+                {"row": 2, "id": 2, "errors": {"copies": ["copies cannot be less than the 5 currently on loan."]}}
+            ]
+        }
+    }
+    """
+    return _run_bulk_update(request, bulk.update_books, "Books updated", "updated")
+
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_book(request, id):
@@ -338,7 +903,7 @@ def delete_book(request, id):
     except Book.DoesNotExist:
         return Response({"message": f"Sorry, the book with ID {id} does not exist."}, status=status.HTTP_404_NOT_FOUND)
 
-    book.delete()
+    deletion.delete_book(book)
     return Response({"message": "Book successfully deleted"}, status=status.HTTP_204_NO_CONTENT)
 
 
@@ -346,6 +911,7 @@ def delete_book(request, id):
 # BookDetails views
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def create_book_details(request):
     """
     Create details for a book.
@@ -394,19 +960,28 @@ def get_book_details_by_id(request, id):
         "publisher": "Penguin Books",
         "language": "English"
     }
+
+    304 Not Modified - The If-None-Match / If-Modified-Since copy is current
     """
     try:
         book_details = BookDetails.objects.get(detailsID=id)
     except BookDetails.DoesNotExist:
         return Response({"message": f"Sorry, the book details with ID {id} do not exist."}, status=status.HTTP_404_NOT_FOUND)
 
+    etag = make_etag('book-details', book_details.detailsID, book_details.modified_at)
+    not_modified = not_modified_response(request, etag, book_details.modified_at)
+    if not_modified is not None:
+        return not_modified
+
     serializer = BookDetailsSerializer(book_details)
-    return Response({"message": "Book details retrieved successfully", "data": serializer.data}, status=status.HTTP_200_OK)
+    response = Response({"message": "Book details retrieved successfully", "data": serializer.data}, status=status.HTTP_200_OK)
+    return set_validators(response, etag, book_details.modified_at)
 
 
 
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def update_book_details(request, id):
     """
     Update details of a book by details ID.
@@ -440,6 +1015,27 @@ def update_book_details(request, id):
     return Response({"message": "Failed to update book details", "errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent(bulk=True)
+def bulk_update_book_details(request):
+    """
+    Partially update many book details from an NDJSON or CSV request body, in one transaction.
+
+    POST /api/book-details/update/bulk/?batch_size=1000
+
+    Request (each row names a detailsID and the fields to change; bookID cannot change):
+    {"detailsID": 1, "publisher": "Penguin Books"}
+    {"detailsID": 2, "number_of_pages": 320, "language": "French"}
+
+    Response:
+    200 OK - At least one set of details was updated (results as in bulk_update_books)
+    {"message": "Book details updated", "data": {"updated": 2, "failed": 0, "results": [...]}}
+    """
+    return _run_bulk_update(request, bulk.update_book_details, "Book details updated", "updated")
+
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_book_details(request, id):
@@ -464,6 +1060,7 @@ def delete_book_details(request, id):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def borrow_book(request):
     """
     Record the borrowing of a book.
@@ -474,7 +1071,8 @@ def borrow_book(request):
     {
         "userID": 1,
         "bookID": 1,
-        "borrow_date": "2022-01-30"
+        "borrow_date": "2022-01-30",
+        "due_date": "2022-02-13"  (optional, defaults to LMS_LOAN_DAYS after borrow_date)
     }
 
     Response:
@@ -483,12 +1081,19 @@ def borrow_book(request):
         "userID": 1,
         "bookID": 1,
         "borrow_date": "2022-01-30",
-        "return_date": null
+        "return_date": null,
+        "due_date": "2022-02-13",
+        "fine": "0.00"
     }
+
+    409 Conflict - Every copy of the book is already on loan
     """
     serializer = BorrowedBooksSerializer(data=request.data)
     if serializer.is_valid():
-        serializer.save()
+        try:
+            circulation.checkout(serializer)
+        except circulation.NoCopiesAvailable:
+            return Response({"message": "Failed to borrow the book", "errors": {"bookID": ["No copies of this book are available."]}}, status=status.HTTP_409_CONFLICT)
         return Response({"message": "Book successfully borrowed", "data": serializer.data}, status=status.HTTP_201_CREATED)
     return Response({"message": "Failed to borrow the book", "errors": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -507,7 +1112,9 @@ def get_borrowed_book_by_id(request, id):
         "userID": 1,
         "bookID": 1,
         "borrow_date": "2022-01-30",
-        "return_date": null
+        "return_date": null,
+        "due_date": "2022-02-13",
+        "fine": "0.00"
     }
     """
     try:
@@ -519,8 +1126,38 @@ def get_borrowed_book_by_id(request, id):
     return Response({"message": "Borrowed book details retrieved successfully", "data": serializer.data}, status=status.HTTP_200_OK)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_borrowed_books_by_ids(request):
+    """
+    Get several loans by ID in one request and one query.
+
+    GET /api/borrowed/batch/?ids=3,4,7
+
+    Response:
+    200 OK - Borrowed books retrieved successfully, in the order requested
+    {
+        "message": "Borrowed books retrieved successfully",
+        "data": [
+            {"id": 3, "userID": 1, "bookID": 1, "borrow_date": "2022-01-30", "return_date": null, "due_date": "2022-02-13", "fine": "0.00"},
+            ...
+        ],
+        "missing": [7]
+    }
+
+    400 Bad Request - ids missing, not integers or more than LMS_BATCH_MAX_IDS of them
+    """
+    ids, error_response = _parse_ids(request)
+    if error_response is not None:
+        return error_response
+
+    rows, missing = _batch_rows(LOAN_ROWS, BorrowedBooks.objects.all(), 'id', ids)
+    return Response({"message": "Borrowed books retrieved successfully", "data": LOAN_ROWS.serialize(rows), "missing": missing}, status=status.HTTP_200_OK)
+
+
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
+@idempotent
 def return_borrowed_book(request, id):
     """
     Update the system when a book is returned.
@@ -533,25 +1170,67 @@ def return_borrowed_book(request, id):
     }
 
     Response:
-    200 OK - Book return updated successfully
+    200 OK - Book return updated successfully (the fine is settled as of the return date)
     {
         "userID": 1,
         "bookID": 1,
         "borrow_date": "2022-01-30",
-        "return_date": "2022-02-15"
+        "return_date": "2022-02-15",
+        "due_date": "2022-02-13",
+        "fine": "0.50"
     }
+
+    A null return_date re-opens the loan.
+
+    400 Bad Request - return_date missing, not a date or before borrow_date
     """
+    body = ReturnDateSerializer(data=request.data)
+    if not body.is_valid():
+        return Response({"message": "Failed to update the loan", "errors": body.errors}, status=status.HTTP_400_BAD_REQUEST)
+
     try:
-        borrowed_book = BorrowedBooks.objects.get(id=id)
+        borrowed_book = circulation.set_return_date(id, body.validated_data['return_date'])
     except BorrowedBooks.DoesNotExist:
         return Response({"message": f"Sorry, the borrowed book with ID {id} does not exist."}, status=status.HTTP_404_NOT_FOUND)
+    except circulation.ReturnBeforeBorrow:
+        return Response({"message": "Failed to update the loan", "errors": {"return_date": ["return_date cannot be before borrow_date."]}}, status=status.HTTP_400_BAD_REQUEST)
+    except circulation.NoCopiesAvailable:
+        return Response({"message": "Failed to reopen the loan", "errors": {"bookID": ["No copies of this book are available."]}}, status=status.HTTP_409_CONFLICT)
 
-    borrowed_book.return_date = request.data.get('return_date')
-    borrowed_book.save()
     serializer = BorrowedBooksSerializer(borrowed_book)
     return Response({"message": "Book return updated successfully", "data": serializer.data}, status=status.HTTP_200_OK)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@idempotent(bulk=True)
+def bulk_return_borrowed_books(request):
+    """
+    Return many loans at once, e.g. a book drop, from an NDJSON or CSV request body.
+
+    POST /api/borrowed/return/bulk/?batch_size=1000
+
+    Request (return_date defaults to today):
+    {"id": 1, "return_date": "2022-02-15"}
+    {"id": 2}
+
+    Response:
+    200 OK - At least one loan was returned (fines are settled as of the return dates)
+    {
+        "message": "Books returned",
+        "data": {
+            "returned": 1,
+            "failed": 1,
+            "results": [
+                {"row": 1, "id": 1, "data": {"id": 1, "return_date": "2022-02-15", "fine": "0.50", ...}},
+                {"row": 2, "id": 2, "errors": {"id": ["Loan was already returned."]}}
+            ]
+        }
+    }
+    """
+    return _run_bulk_update(request, bulk.return_loans, "Books returned", "returned")
+
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_borrowed_book(request, id):
@@ -564,10 +1243,100 @@ def delete_borrowed_book(request, id):
     204 No Content - Borrowed book successfully deleted
     """
     try:
-        borrowed_book = BorrowedBooks.objects.get(id=id)
+        circulation.delete_loan(id)
     except BorrowedBooks.DoesNotExist:
         return Response({"message": f"Sorry, the borrowed book with ID {id} does not exist."}, status=status.HTTP_404_NOT_FOUND)
-
-    borrowed_book.delete()
     return Response({"message": "Borrowed book successfully deleted"}, status=status.HTTP_204_NO_CONTENT)
 
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_resource(request, resource):
+    """
+    Stream a full export of books (with details), users or loans.
+
+    GET /api/export/books/?output=ndjson
+    GET /api/export/users/?output=csv
+    GET /api/export/loans/
+
+    The body is gzip-compressed on the fly when the client's Accept-Encoding
+    allows gzip (not with "gzip;q=0"). The loans export lists current loans,
+    then archived ones, with "archived": true|false on every row.
+
+    Response:
+    200 OK - application/x-ndjson or text/csv, one row per line
+    {"bookID": 1, "title": "The Great Gatsby", "isbn": "978123890", ..., "publisher": "Penguin Books", "language": "English"}
+    ...
+    """
+    if resource not in export.RESOURCES:
+        return Response({"error": f"Unknown export {resource}. Allowed: {', '.join(export.RESOURCES)}."}, status=status.HTTP_404_NOT_FOUND)
+
+    file_format = request.query_params.get('output', 'ndjson')
+    if file_format not in export.FORMATS:
+        return Response({"error": f"output must be one of: {', '.join(export.FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+    chunks = (chunk.encode() for chunk in export.ExportStream(resource, file_format))
+    content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+
+    gzip_accepted = export.accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    response = StreamingHttpResponse(compress_sequence(chunks) if gzip_accepted else chunks, content_type=content_type)
+    if gzip_accepted:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Content-Disposition'] = f'attachment; filename="{resource}.{file_format}"'
+    return response
+
+
+# Statistics views
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def circulation_stats(request):
+    """
+    Circulation dashboard, read from the summary tables kept up to date by every
+    loan, return and delete (see lms.stats) rather than aggregated from loans.
+
+    GET /api/stats/?top=5
+
+    Response:
+    200 OK
+    {
+        "message": "Circulation statistics retrieved successfully",
+        "data": {
+            "total_loans": 120,
+            "open_loans": 15,
+            "returned_loans": 105,
+            "active_borrowers": 9,
+            "average_loan_days": 12.4,
+            "loans_per_genre": [{"genre": "Fiction", "total_loans": 80, "open_loans": 10}, ...],
+            "most_borrowed_books": [{"bookID": 1, "title": "The Great Gatsby", "total_loans": 14, "open_loans": 2}, ...]
+        }
+    }
+    """
+    try:
+        top = int(request.query_params.get('top', stats.DEFAULT_TOP))
+    except ValueError:
+        return Response({"error": "top must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 <= top <= stats.MAX_TOP:
+        return Response({"error": f"top must be between 0 and {stats.MAX_TOP}."}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"message": "Circulation statistics retrieved successfully", "data": stats.snapshot(top)}, status=status.HTTP_200_OK)
+
+
+# Operational views
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def token_cache_stats(request):
+    """
+    Report the in-process token authentication cache counters for this worker.
+
+    GET /api/auth/token-cache/
+
+    Response:
+    200 OK
+    {
+        "message": "Token cache statistics retrieved successfully",
+        "data": {"size": 42, "max_size": 10000, "ttl": 60, "hits": 1200, "misses": 42}
+    }
+    """
+    return Response({"message": "Token cache statistics retrieved successfully", "data": token_cache.stats()}, status=status.HTTP_200_OK)